@@ -0,0 +1,51 @@
+"""
+SET throughput with the append only file enabled, for each appendfsync
+policy. Commands go through handle_command in batches, with one flush per
+batch as the servers do per pipeline.
+
+    python -m benchmarks.aof_fsync --ops 20000 --batch 1 16 128
+"""
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.persistence import APPENDFSYNC_POLICIES, AppendOnlyPersister
+from pyredis.types import Array, BulkString
+
+
+def run(appendfsync, ops, batch):
+    commands = [
+        Array([BulkString(b"SET"), BulkString(b"key:%d" % i), BulkString(b"x" * 64)])
+        for i in range(ops)
+    ]
+    datastore = DataStore()
+    with tempfile.TemporaryDirectory() as directory:
+        persister = AppendOnlyPersister(
+            os.path.join(directory, "bench.aof"), appendfsync
+        )
+        start = perf_counter()
+        for i in range(0, ops, batch):
+            for command in commands[i : i + batch]:
+                handle_command(command, datastore, persister)
+            persister.flush()
+        elapsed = perf_counter() - start
+        persister.close()
+    return ops / elapsed
+
+
+def main(args):
+    print(f"{'appendfsync':>11} {'batch':>6} {'SET/s':>12}")
+    for appendfsync in APPENDFSYNC_POLICIES:
+        for batch in args.batch:
+            rate = run(appendfsync, args.ops, batch)
+            print(f"{appendfsync:>11} {batch:>6} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AOF appendfsync policies")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 16, 128])
+    main(parser.parse_args())
@@ -0,0 +1,56 @@
+"""
+GET/SET throughput of DataStore as the number of client threads grows,
+comparing a single lock with lock-striped shards.
+
+    python -m benchmarks.datastore_threads --ops 200000
+"""
+import argparse
+import threading
+from time import perf_counter
+
+from pyredis.datastore import DataStore
+
+
+def worker(datastore, thread_id, ops, barrier):
+    keys = [b"key:%d:%d" % (thread_id, i) for i in range(1000)]
+    for key in keys:
+        datastore[key] = b"value"
+    barrier.wait()
+    for i in range(ops):
+        key = keys[i % 1000]
+        if i & 1:
+            datastore[key]
+        else:
+            datastore[key] = b"value"
+
+
+def run(shards, threads, ops):
+    datastore = DataStore(shards=shards)
+    barrier = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(target=worker, args=(datastore, t, ops // threads, barrier))
+        for t in range(threads)
+    ]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = perf_counter()
+    for w in workers:
+        w.join()
+    return ops / (perf_counter() - start)
+
+
+def main(args):
+    print(f"{'shards':>6} {'threads':>7} {'ops/s':>12}")
+    for shards in args.shards:
+        for threads in args.threads:
+            rate = run(shards, threads, args.ops)
+            print(f"{shards:>6} {threads:>7} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DataStore thread scaling")
+    parser.add_argument("--ops", type=int, default=200000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    main(parser.parse_args())
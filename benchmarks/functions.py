@@ -0,0 +1,90 @@
+"""
+A fixed window rate limiter run as one FCALL against the same check done
+atomically by the client with WATCH, GET, MULTI, INCR or SET EX and EXEC.
+Reports the server time per check and, with --rtt, the latency once every
+round trip pays the network.
+
+    python -m benchmarks.functions --ops 20000 --rtt 100
+"""
+import argparse
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from pyredis import functions
+from pyredis.commands import Transaction, handle_command
+from pyredis.datastore import DataStore
+from pyredis.types import Array, BulkString
+
+LIBRARY = """
+def ratelimit(redis, keys, args):
+    count = redis.call("INCR", keys[0])
+    if count == 1:
+        redis.call("SET", keys[0], count, "EX", args[0])
+    return count <= int(args[1])
+
+
+redis.register_function("ratelimit", ratelimit)
+"""
+WINDOW, LIMIT = b"60", b"100"
+
+
+def _command(*args):
+    return Array([BulkString(a) for a in args])
+
+
+def run_watch(ops):
+    datastore = DataStore()
+    transaction = Transaction()
+    key = b"ratelimit:client"
+    watch, get = _command(b"WATCH", key), _command(b"GET", key)
+    multi, exec_ = _command(b"MULTI"), _command(b"EXEC")
+    incr = _command(b"INCR", key)
+    start = perf_counter()
+    for _ in range(ops):
+        handle_command(watch, datastore, None, transaction)
+        value = handle_command(get, datastore, None, transaction).data
+        handle_command(multi, datastore, None, transaction)
+        if value is None:
+            handle_command(
+                _command(b"SET", key, b"1", b"EX", WINDOW),
+                datastore,
+                None,
+                transaction,
+            )
+        else:
+            handle_command(incr, datastore, None, transaction)
+        handle_command(exec_, datastore, None, transaction)
+    return (perf_counter() - start) / ops * 1e6, 5
+
+
+def run_fcall(ops):
+    datastore = DataStore()
+    command = _command(b"FCALL", b"ratelimit", b"1", b"ratelimit:client")
+    command.data += [BulkString(WINDOW), BulkString(LIMIT)]
+    start = perf_counter()
+    for _ in range(ops):
+        handle_command(command, datastore, None)
+    return (perf_counter() - start) / ops * 1e6, 1
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "ratelimit.py"
+        path.write_text(LIBRARY)
+        functions.load_library(path)
+
+    print(f"{'rate limit check':>18} {'round trips':>12} {'server us':>10} {'us':>8}")
+    for label, run in (("WATCH/MULTI/EXEC", run_watch), ("FCALL", run_fcall)):
+        server, round_trips = run(args.ops)
+        total = server + round_trips * args.rtt
+        print(f"{label:>18} {round_trips:>12} {server:>10.1f} {total:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FCALL against client logic")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument(
+        "--rtt", type=float, default=100, help="Network round trip in us"
+    )
+    main(parser.parse_args())
@@ -0,0 +1,41 @@
+"""
+GET and SET latency by value size, through handle_command and reply
+encoding as a server does for each request.
+
+    python -m benchmarks.get_set_values --ops 20000 --sizes 1024 102400
+"""
+import argparse
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.protocol import encode_message_into
+from pyredis.types import Array, BulkString
+
+
+def run(command, datastore, ops):
+    replies = bytearray()
+    start = perf_counter()
+    for _ in range(ops):
+        encode_message_into(handle_command(command, datastore, None), replies)
+        replies.clear()
+    return (perf_counter() - start) / ops
+
+
+def main(args):
+    print(f"{'size':>8} {'SET us':>8} {'GET us':>8}")
+    for size in args.sizes:
+        datastore = DataStore()
+        value = b"x" * size
+        set_command = Array([BulkString(b"SET"), BulkString(b"key"), BulkString(value)])
+        get_command = Array([BulkString(b"GET"), BulkString(b"key")])
+        set_latency = run(set_command, datastore, args.ops)
+        get_latency = run(get_command, datastore, args.ops)
+        print(f"{size:>8} {set_latency * 1e6:>8.2f} {get_latency * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GET/SET latency by value size")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 102400])
+    main(parser.parse_args())
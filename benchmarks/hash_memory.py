@@ -0,0 +1,67 @@
+"""
+Memory per user profile stored as one string key per field, as a listpack
+hash and as a dict encoded hash, plus field read throughput for each.
+
+    python -m benchmarks.hash_memory --users 100000 --fields 8
+"""
+import argparse
+import tracemalloc
+from time import perf_counter
+
+from pyredis import hashes
+from pyredis.datastore import DataStore
+
+
+def fill_strings(datastore, users, fields):
+    for user in range(users):
+        for field in range(fields):
+            datastore[b"user:%d:field%d" % (user, field)] = b"value-%d" % field
+
+
+def read_strings(datastore, users, fields):
+    for user in range(users):
+        datastore[b"user:%d:field%d" % (user, user % fields)]
+
+
+def fill_hashes(datastore, users, fields):
+    for user in range(users):
+        datastore.hset(
+            b"user:%d" % user,
+            [(b"field%d" % field, b"value-%d" % field) for field in range(fields)],
+        )
+
+
+def read_hashes(datastore, users, fields):
+    for user in range(users):
+        datastore.hget(b"user:%d" % user, b"field%d" % (user % fields))
+
+
+def measure(fill, read, users, fields):
+    datastore = DataStore()
+    tracemalloc.start()
+    fill(datastore, users, fields)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = perf_counter()
+    read(datastore, users, fields)
+    reads = users / (perf_counter() - start)
+    return memory / users, reads
+
+
+def main(args):
+    print(f"{'layout':>12} {'bytes/user':>12} {'reads/s':>12}")
+    per_user, reads = measure(fill_strings, read_strings, args.users, args.fields)
+    print(f"{'strings':>12} {per_user:>12.0f} {reads:>12,.0f}")
+    per_user, reads = measure(fill_hashes, read_hashes, args.users, args.fields)
+    print(f"{'listpack':>12} {per_user:>12.0f} {reads:>12,.0f}")
+    hashes.hash_max_listpack_entries = 0
+    per_user, reads = measure(fill_hashes, read_hashes, args.users, args.fields)
+    print(f"{'hashtable':>12} {per_user:>12.0f} {reads:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hash memory and reads")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--fields", type=int, default=8)
+    main(parser.parse_args())
@@ -0,0 +1,45 @@
+"""
+INCR throughput on one counter, straight on the DataStore and through
+handle_command with reply encoding.
+
+    python -m benchmarks.incr --ops 200000
+"""
+import argparse
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.protocol import encode_message_into
+from pyredis.types import Array, BulkString
+
+
+def run_datastore(ops):
+    datastore = DataStore()
+    incr = datastore.incr
+    start = perf_counter()
+    for _ in range(ops):
+        incr(b"counter")
+    return ops / (perf_counter() - start)
+
+
+def run_command(ops):
+    datastore = DataStore()
+    command = Array([BulkString(b"INCR"), BulkString(b"counter")])
+    replies = bytearray()
+    start = perf_counter()
+    for _ in range(ops):
+        encode_message_into(handle_command(command, datastore, None), replies)
+        replies.clear()
+    return ops / (perf_counter() - start)
+
+
+def main(args):
+    print(f"{'path':>14} {'INCR/s':>12}")
+    print(f"{'datastore':>14} {run_datastore(args.ops):>12,.0f}")
+    print(f"{'handle_command':>14} {run_command(args.ops):>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="INCR throughput")
+    parser.add_argument("--ops", type=int, default=200000)
+    main(parser.parse_args())
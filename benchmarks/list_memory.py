@@ -0,0 +1,54 @@
+"""
+Memory per element and push/index throughput of a list held as a deque of
+bytes objects, as lists used to be stored, and as a QuickList.
+
+    python -m benchmarks.list_memory --items 1000000 --size 16
+"""
+import argparse
+import tracemalloc
+from collections import deque
+from time import perf_counter
+
+from pyredis.quicklist import QuickList
+
+
+def fill(factory, items, size):
+    values = factory()
+    append = values.append
+    for i in range(items):
+        append(b"%0*d" % (size, i))
+    return values
+
+
+def measure(factory, items, size):
+    tracemalloc.start()
+    values = fill(factory, items, size)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del values
+
+    start = perf_counter()
+    values = fill(factory, items, size)
+    push = items / (perf_counter() - start)
+
+    indexes = range(0, items, max(1, items // 10000))
+    get = values.index if isinstance(values, QuickList) else values.__getitem__
+    start = perf_counter()
+    for i in indexes:
+        get(i)
+    lookup = len(indexes) / (perf_counter() - start)
+    return memory / items, push, lookup
+
+
+def main(args):
+    print(f"{'encoding':>10} {'bytes/item':>12} {'push/s':>12} {'index/s':>12}")
+    for name, factory in (("deque", deque), ("quicklist", QuickList)):
+        per_item, push, lookup = measure(factory, args.items, args.size)
+        print(f"{name:>10} {per_item:>12.1f} {push:>12,.0f} {lookup:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List memory and throughput")
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--size", type=int, default=16)
+    main(parser.parse_args())
@@ -0,0 +1,48 @@
+"""
+LRANGE latency through handle_command with reply encoding, for short
+ranges at the head and tail of a long list and for a whole shorter list.
+
+    python -m benchmarks.lrange --items 1000000
+"""
+import argparse
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.protocol import encode_message_into
+from pyredis.types import Array, BulkString
+
+
+def run(datastore, key, start, stop, ops):
+    command = Array([BulkString(a) for a in (b"LRANGE", key, start, stop)])
+    replies = bytearray()
+    begin = perf_counter()
+    for _ in range(ops):
+        encode_message_into(handle_command(command, datastore, None), replies)
+        replies.clear()
+    return (perf_counter() - begin) / ops * 1e6
+
+
+def main(args):
+    datastore = DataStore()
+    for i in range(args.items):
+        datastore.append(b"long", b"item:%08d" % i)
+    for i in range(10000):
+        datastore.append(b"short", b"item:%08d" % i)
+
+    middle = args.items // 2
+    print(f"{'range':>22} {'us/call':>10}")
+    for label, key, start, stop, ops in (
+        ("long 0 99", b"long", 0, 99, 2000),
+        ("long -100 -1", b"long", -100, -1, 2000),
+        ("long middle 100", b"long", middle, middle + 99, 2000),
+        ("short 0 -1", b"short", 0, -1, 50),
+    ):
+        latency = run(datastore, key, b"%d" % start, b"%d" % stop, ops)
+        print(f"{label:>22} {latency:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LRANGE latency")
+    parser.add_argument("--items", type=int, default=1000000)
+    main(parser.parse_args())
@@ -0,0 +1,59 @@
+"""
+Server side cost of fetching and storing a batch of keys: one MGET or
+MSET against the same number of pipelined GETs or SETs, from parsing the
+request bytes to the encoded replies.
+
+    python -m benchmarks.mget --keys 200
+"""
+import argparse
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.protocol import RespParser, encode_message_into
+from pyredis.types import Array, BulkString
+
+
+def request(*commands):
+    buffer = bytearray()
+    for command in commands:
+        Array([BulkString(arg) for arg in command]).encode_into(buffer)
+    return bytes(buffer)
+
+
+def run(datastore, data, ops):
+    parser = RespParser()
+    replies = bytearray()
+    begin = perf_counter()
+    for _ in range(ops):
+        parser.feed(data)
+        for frame in parser:
+            encode_message_into(handle_command(frame, datastore, None), replies)
+        replies.clear()
+    return (perf_counter() - begin) / ops * 1e6
+
+
+def main(args):
+    keys = [b"page:fragment:%d" % i for i in range(args.keys)]
+    values = [b"x" * args.size for _ in keys]
+    pairs = [arg for pair in zip(keys, values) for arg in pair]
+    print(f"{'batch of ' + str(args.keys):>24} {'us/batch':>10}")
+    for shards in (1, 8):
+        datastore = DataStore(shards=shards)
+        datastore.mset(list(zip(keys, values)))
+        for label, data in (
+            ("pipelined GET", request(*((b"GET", key) for key in keys))),
+            ("MGET", request((b"MGET", *keys))),
+            ("pipelined SET", request(*((b"SET", k, v) for k, v in zip(keys, values)))),
+            ("MSET", request((b"MSET", *pairs))),
+        ):
+            latency = run(datastore, data, args.ops)
+            print(f"{label + f' ({shards} shards)':>24} {latency:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MGET/MSET against pipelines")
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--ops", type=int, default=2000)
+    main(parser.parse_args())
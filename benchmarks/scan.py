@@ -0,0 +1,59 @@
+"""
+Full keyspace walk with SCAN: keys returned per second and the longest
+single call, which bounds how long other clients can be kept waiting, next
+to KEYS and to copying the whole keyspace under the lock.
+
+    python -m benchmarks.scan --keys 1000000 --count 1000
+"""
+import argparse
+from time import perf_counter
+
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.types import Array, BulkString
+
+
+def walk(datastore, count):
+    longest = 0
+    returned = 0
+    cursor = 0
+    start = perf_counter()
+    while True:
+        call = perf_counter()
+        cursor, keys = datastore.scan(cursor, count)
+        longest = max(longest, perf_counter() - call)
+        returned += len(keys)
+        if not cursor:
+            break
+    return returned, perf_counter() - start, longest
+
+
+def main(args):
+    datastore = DataStore()
+    for i in range(args.keys):
+        datastore[b"key:%d" % i] = b"value"
+
+    returned, elapsed, longest = walk(datastore, args.count)
+    print(
+        f"SCAN COUNT {args.count}: {returned / elapsed:,.0f} keys/s,"
+        f" longest call {longest * 1e3:.2f} ms"
+    )
+
+    start = perf_counter()
+    reply = handle_command(
+        Array([BulkString(b"KEYS"), BulkString(b"key:1*")]), datastore, None
+    )
+    elapsed = perf_counter() - start
+    print(f"KEYS key:1*: {len(reply)} keys in {elapsed * 1e3:.0f} ms, in batches")
+
+    start = perf_counter()
+    with datastore._lock:
+        list(datastore._data)
+    print(f"copying every key under the lock: {(perf_counter() - start) * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keyspace walks")
+    parser.add_argument("--keys", type=int, default=1000000)
+    parser.add_argument("--count", type=int, default=1000)
+    main(parser.parse_args())
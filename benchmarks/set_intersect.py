@@ -0,0 +1,70 @@
+"""
+SINTER and SUNION throughput over large id sets, such as tag filters, plus
+memory per member of a small set as an intset and as a hashed set.
+
+    python -m benchmarks.set_intersect --ids 100000 --tags 4
+"""
+import argparse
+import random
+import tracemalloc
+from time import perf_counter
+
+from pyredis import sets
+from pyredis.datastore import DataStore
+
+
+def fill_tags(datastore, ids, tags):
+    rng = random.Random(1)
+    population = range(ids * 10)
+    keys = []
+    for tag in range(tags):
+        key = b"tag:%d" % tag
+        # Each tag is ten times smaller than the one before
+        members = rng.sample(population, max(ids // 10**tag, 1))
+        datastore.sadd(key, [b"%d" % member for member in members])
+        keys.append(key)
+    return keys
+
+
+def time_per_call(call, keys, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        call(keys)
+    return (perf_counter() - start) / repeat
+
+
+def intset_memory(members):
+    tracemalloc.start()
+    datastore = DataStore()
+    for key in range(1000):
+        datastore.sadd(b"s:%d" % key, [b"%d" % member for member in range(members)])
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory / (1000 * members)
+
+
+def main(args):
+    datastore = DataStore()
+    keys = fill_tags(datastore, args.ids, args.tags)
+    sizes = ", ".join(str(datastore.scard(key)) for key in keys)
+    print(f"tag sizes: {sizes}")
+    for name, call in (("SINTER", datastore.sinter), ("SUNION", datastore.sunion)):
+        for count in range(2, args.tags + 1):
+            # Largest set first, as a naive left to right intersection would
+            # find its worst case
+            elapsed = time_per_call(call, keys[:count], args.repeat)
+            print(f"{name} of {count} sets: {elapsed * 1e3:8.3f} ms")
+
+    print(f"{'encoding':>12} {'bytes/member':>14}")
+    print(f"{'intset':>12} {intset_memory(args.members):>14.1f}")
+    sets.set_max_intset_entries = 0
+    print(f"{'hashtable':>12} {intset_memory(args.members):>14.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set intersection and memory")
+    parser.add_argument("--ids", type=int, default=100000)
+    parser.add_argument("--tags", type=int, default=4)
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
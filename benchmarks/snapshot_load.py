@@ -0,0 +1,56 @@
+"""
+Startup time from a binary snapshot compared to replaying an AOF holding
+the same keys, one SET per key as after a rewrite.
+
+    python -m benchmarks.snapshot_load --keys 200000
+"""
+import argparse
+import os
+import tempfile
+from time import perf_counter, sleep
+
+from pyredis import snapshot
+from pyredis.datastore import DataStore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.replay import replay_aof
+
+
+def main(args):
+    datastore = DataStore()
+    for i in range(args.keys):
+        datastore[b"key:%d" % i] = b"x" * args.value_size
+
+    with tempfile.TemporaryDirectory() as directory:
+        aof = os.path.join(directory, "bench.aof")
+        persister = AppendOnlyPersister(aof, "no")
+        persister.rewrite(datastore)
+        while persister.rewrite_in_progress:
+            sleep(0.01)
+        persister.close()
+
+        rdb = os.path.join(directory, "bench.rdb")
+        snapshot.save(datastore, rdb)
+
+        start = perf_counter()
+        replay_aof(aof, DataStore())
+        aof_elapsed = perf_counter() - start
+
+        start = perf_counter()
+        snapshot.load(DataStore(), rdb)
+        rdb_elapsed = perf_counter() - start
+
+        print(f"{'format':>8} {'bytes':>12} {'seconds':>8} {'keys/s':>12}")
+        for name, filename, elapsed in (
+            ("aof", aof, aof_elapsed),
+            ("snapshot", rdb, rdb_elapsed),
+        ):
+            size = os.path.getsize(filename)
+            rate = args.keys / elapsed
+            print(f"{name:>8} {size:>12,} {elapsed:>8.2f} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot load vs AOF replay")
+    parser.add_argument("--keys", type=int, default=200000)
+    parser.add_argument("--value-size", type=int, default=32)
+    main(parser.parse_args())
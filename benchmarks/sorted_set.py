@@ -0,0 +1,86 @@
+"""
+Sorted set operations on a leaderboard of a million members: ZADD, score
+updates, ZRANK, ZRANGE by index and by score with LIMIT, ZCOUNT and ZPOPMIN,
+plus the memory used per member.
+
+    python -m benchmarks.sorted_set --members 1000000
+"""
+import argparse
+import random
+import tracemalloc
+from time import perf_counter
+
+from pyredis.datastore import DataStore
+
+
+def timed(name, calls, call):
+    start = perf_counter()
+    for i in range(calls):
+        call(i)
+    elapsed = perf_counter() - start
+    print(f"{name:>28} {calls / elapsed:>12,.0f}/s {elapsed / calls * 1e6:>10.1f} µs")
+
+
+def memory_per_member(count):
+    """Bytes per member of a sorted set of count members, members included."""
+    rng = random.Random(2)
+    tracemalloc.start()
+    datastore = DataStore()
+    datastore.zadd(
+        b"board",
+        ((b"player:%d" % i, float(rng.randrange(count))) for i in range(count)),
+    )
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory / count, datastore.memory_usage(b"board") / count
+
+
+def main(args):
+    rng = random.Random(1)
+    members = [b"player:%d" % i for i in range(args.members)]
+    scores = [float(rng.randrange(args.members * 10)) for _ in members]
+    datastore = DataStore()
+
+    start = perf_counter()
+    for i in range(0, args.members, 1000):
+        datastore.zadd(b"board", zip(members[i : i + 1000], scores[i : i + 1000]))
+    elapsed = perf_counter() - start
+    print(f"ZADD of {args.members:,} members in batches of 1000: {elapsed:.2f} s")
+    traced, estimated = memory_per_member(args.members // 10)
+    print(f"{traced:.0f} bytes/member traced, {estimated:.0f} estimated")
+
+    calls = args.calls
+    picks = [rng.choice(members) for _ in range(calls)]
+    top = args.members * 10
+    timed("ZINCRBY", calls, lambda i: datastore.zincrby(b"board", picks[i], 1.0))
+    timed("ZSCORE", calls, lambda i: datastore.zscore(b"board", picks[i]))
+    timed("ZRANK", calls, lambda i: datastore.zrank(b"board", picks[i]))
+    timed("ZRANGE 0 9 REV", calls, lambda i: datastore.zrange(b"board", 0, 9, True))
+    middle = args.members // 2
+    timed(
+        "ZRANGE mid+0 mid+99",
+        calls,
+        lambda i: datastore.zrange(b"board", middle, middle + 99),
+    )
+    timed(
+        "ZRANGE BYSCORE LIMIT 0 10",
+        calls,
+        lambda i: datastore.zrange_by_score(
+            b"board", (rng.randrange(top), False), (float("inf"), False), count=10
+        ),
+    )
+    timed(
+        "ZCOUNT",
+        calls,
+        lambda i: datastore.zcount(
+            b"board", (rng.randrange(top), False), (float("inf"), False)
+        ),
+    )
+    timed("ZPOPMIN", calls, lambda i: datastore.zpop(b"board", 1))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sorted set operations")
+    parser.add_argument("--members", type=int, default=1000000)
+    parser.add_argument("--calls", type=int, default=20000)
+    main(parser.parse_args())
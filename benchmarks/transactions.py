@@ -0,0 +1,79 @@
+"""
+Cost of a WATCH/GET/MULTI/SET/EXEC check-and-set increment against a plain
+INCR, with threads contending for the same counter or using one each.
+
+    python -m benchmarks.transactions --ops 20000 --threads 4
+"""
+import argparse
+import threading
+from time import perf_counter
+
+from pyredis.commands import Transaction, handle_command
+from pyredis.datastore import DataStore
+from pyredis.types import Array, BulkString
+
+
+def _command(*args):
+    return Array([BulkString(a) for a in args])
+
+
+def incr(datastore, key, ops):
+    command = _command(b"INCR", key)
+    for _ in range(ops):
+        handle_command(command, datastore, None)
+    return 0
+
+
+def check_and_set(datastore, key, ops):
+    transaction = Transaction()
+    watch, get = _command(b"WATCH", key), _command(b"GET", key)
+    multi, exec_ = _command(b"MULTI"), _command(b"EXEC")
+    retries = 0
+    for _ in range(ops):
+        while True:
+            handle_command(watch, datastore, None, transaction)
+            value = int(handle_command(get, datastore, None, transaction).data or 0)
+            handle_command(multi, datastore, None, transaction)
+            handle_command(
+                _command(b"SET", key, b"%d" % (value + 1)),
+                datastore,
+                None,
+                transaction,
+            )
+            if handle_command(exec_, datastore, None, transaction).data is not None:
+                break
+            retries += 1
+    return retries
+
+
+def run(worker, threads, ops, shared):
+    datastore = DataStore()
+    retries = []
+
+    def target(i):
+        key = b"counter" if shared else b"counter:%d" % i
+        retries.append(worker(datastore, key, ops))
+
+    workers = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    start = perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return threads * ops / (perf_counter() - start), sum(retries)
+
+
+def main(args):
+    print(f"{'increment':>14} {'keys':>8} {'ops/s':>10} {'retries':>8}")
+    for shared in (False, True):
+        for name, worker in (("INCR", incr), ("check-and-set", check_and_set)):
+            rate, retries = run(worker, args.threads, args.ops, shared)
+            keys = "shared" if shared else "own"
+            print(f"{name:>14} {keys:>8} {rate:>10,.0f} {retries:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transaction throughput")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=4)
+    main(parser.parse_args())
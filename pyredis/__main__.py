@@ -1,5 +1,6 @@
 import argparse
 import asyncio
+import os
 import trio
 import logging
 import threading
@@ -8,12 +9,48 @@ from time import sleep
 from pyredis.server import Server
 from pyredis.asyncserver import RedisServerProtocol
 from pyredis.trioserver import TrioServer
+from pyredis import functions, hashes, sets, snapshot
+from pyredis.commands import evict_after_load
 from pyredis.datastore import DataStore
-from pyredis.persistence import AppendOnlyPersister
+from pyredis.eviction import (
+    MAXMEMORY_NOEVICTION,
+    MAXMEMORY_POLICIES,
+    MAXMEMORY_SAMPLES,
+)
+from pyredis.expiry import (
+    AsyncExpiryScheduler,
+    ThreadedExpiryScheduler,
+    TrioExpiryScheduler,
+)
+from pyredis.persistence import (
+    APPENDFSYNC_EVERYSEC,
+    APPENDFSYNC_POLICIES,
+    AUTO_AOF_REWRITE_MIN_SIZE,
+    AUTO_AOF_REWRITE_PERCENTAGE,
+    AppendOnlyPersister,
+)
 
 
 REDIS_DEFAULT_PORT = 6379
+AOF_FILENAME = "ccdb.aof"
 log = logging.getLogger("pyredis")
+_MEMORY_UNITS = {
+    "gb": 1 << 30,
+    "mb": 1 << 20,
+    "kb": 1 << 10,
+    "g": 10**9,
+    "m": 10**6,
+    "k": 1000,
+}
+
+
+def memory_size(text):
+    """Parse a size such as 100mb the way redis.conf does."""
+    text = text.strip().lower()
+    for unit, scale in _MEMORY_UNITS.items():
+        if text.endswith(unit):
+            return int(text[: -len(unit)]) * scale
+    return int(text)
 
 
 def check_expiry_task(datastore):
@@ -28,21 +65,65 @@ async def acheck_expiry_task(datastore):
         await asyncio.sleep(1)
 
 
+async def tcheck_expiry_task(datastore):
+    while True:
+        datastore.remove_expired_keys()
+        await trio.sleep(1)
+
+
+def open_datastore(args):
+    datastore = DataStore(
+        shards=args.shards,
+        precise_expiry=args.precise_expiry,
+        maxmemory=args.maxmemory,
+        maxmemory_policy=args.maxmemory_policy,
+        maxmemory_samples=args.maxmemory_samples,
+    )
+
+    snapshot.dbfilename = args.dbfilename
+    snapshot.rdbchecksum = args.rdbchecksum
+    hashes.hash_max_listpack_entries = args.hash_max_listpack_entries
+    hashes.hash_max_listpack_value = args.hash_max_listpack_value
+    sets.set_max_intset_entries = args.set_max_intset_entries
+
+    for path in args.functions:
+        try:
+            functions.load_library(path)
+        except ValueError as e:
+            log.error(str(e))
+            return None, None
+
+    if args.restore:
+        if not AppendOnlyPersister.restore_from_file(AOF_FILENAME, datastore):
+            return None, None
+    elif os.path.exists(args.dbfilename):
+        snapshot.load(datastore)
+
+    persister = AppendOnlyPersister(
+        AOF_FILENAME,
+        args.appendfsync,
+        datastore,
+        args.auto_aof_rewrite_percentage,
+        args.auto_aof_rewrite_min_size,
+    )
+    # Loading keeps every key; those over maxmemory are evicted now
+    evict_after_load(datastore, persister)
+    return datastore, persister
+
+
 async def amain(args):
     log.info(f"Starting Pyredis on port: {args.port}")
 
-    datastore = DataStore()
-
-    if args.restore and not AppendOnlyPersister.restore_from_file(
-        "ccdb.aof", datastore
-    ):
+    datastore, persister = open_datastore(args)
+    if datastore is None:
         return -1
 
     loop = asyncio.get_running_loop()
 
-    loop.create_task(acheck_expiry_task(datastore))
-
-    persister = AppendOnlyPersister("ccdb.aof")
+    if args.precise_expiry:
+        AsyncExpiryScheduler(datastore, loop).start()
+    else:
+        loop.create_task(acheck_expiry_task(datastore))
 
     server = await loop.create_server(
         lambda: RedisServerProtocol(datastore, persister), "127.0.0.1", args.port
@@ -53,19 +134,38 @@ async def amain(args):
 
 
 async def tmain(args):
-    server = TrioServer(args.port)
-    await server.run()
+    datastore, persister = open_datastore(args)
+    if datastore is None:
+        return -1
+
+    server = TrioServer(args.port, datastore, persister)
+
+    async with trio.open_nursery() as nursery:
+        if args.precise_expiry:
+            nursery.start_soon(TrioExpiryScheduler(datastore).run)
+        else:
+            nursery.start_soon(tcheck_expiry_task, datastore)
+        nursery.start_soon(server.run)
 
 
 def main(args):
     log.info(f"Starting PyRedis on port: {args.port}")
 
-    datastore = DataStore()
+    datastore, persister = open_datastore(args)
+    if datastore is None:
+        return -1
 
-    expiration_monitor = threading.Thread(target=check_expiry_task, args=(datastore,))
+    if args.precise_expiry:
+        expiration_monitor = threading.Thread(
+            target=ThreadedExpiryScheduler(datastore).run
+        )
+    else:
+        expiration_monitor = threading.Thread(
+            target=check_expiry_task, args=(datastore,)
+        )
     expiration_monitor.start()
 
-    server = Server(args.port, datastore)
+    server = Server(args.port, datastore, persister)
     server.run()
 
 
@@ -82,6 +182,89 @@ if __name__ == "__main__":
     parser.add_argument("--asyncio", action=argparse.BooleanOptionalAction)
     parser.add_argument("--trio", action=argparse.BooleanOptionalAction)
     parser.add_argument("--restore", action=argparse.BooleanOptionalAction)
+    parser.add_argument(
+        "--dbfilename",
+        help="Snapshot file written by SAVE/BGSAVE and loaded at startup",
+        default=snapshot.dbfilename,
+    )
+    parser.add_argument(
+        "--rdbchecksum",
+        help="Append a CRC32 checksum to snapshots and verify it on load",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+    )
+    parser.add_argument(
+        "--appendfsync",
+        choices=APPENDFSYNC_POLICIES,
+        help="When the append only file is fsynced to disk",
+        default=APPENDFSYNC_EVERYSEC,
+    )
+    parser.add_argument(
+        "--auto-aof-rewrite-percentage",
+        type=int,
+        help="Rewrite the AOF once it grew by this percentage, 0 to disable",
+        default=AUTO_AOF_REWRITE_PERCENTAGE,
+    )
+    parser.add_argument(
+        "--auto-aof-rewrite-min-size",
+        type=int,
+        help="Smallest AOF size in bytes that is rewritten automatically",
+        default=AUTO_AOF_REWRITE_MIN_SIZE,
+    )
+    parser.add_argument(
+        "--precise-expiry",
+        help="Expire keys at their deadline from a heap instead of sampling",
+        action=argparse.BooleanOptionalAction,
+    )
+    parser.add_argument(
+        "--functions",
+        metavar="PATH",
+        action="append",
+        help="Python library of functions to load for FCALL; may be repeated",
+        default=[],
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="Number of lock stripes the keyspace is split over",
+        default=1,
+    )
+    parser.add_argument(
+        "--maxmemory",
+        type=memory_size,
+        help="Memory limit, as bytes or with a kb/mb/gb unit; 0 for no limit",
+        default=0,
+    )
+    parser.add_argument(
+        "--maxmemory-policy",
+        choices=MAXMEMORY_POLICIES,
+        help="How keys are chosen for eviction once maxmemory is reached",
+        default=MAXMEMORY_NOEVICTION,
+    )
+    parser.add_argument(
+        "--maxmemory-samples",
+        type=int,
+        help="Keys sampled per eviction by the LRU, LFU and TTL policies",
+        default=MAXMEMORY_SAMPLES,
+    )
+    parser.add_argument(
+        "--hash-max-listpack-entries",
+        type=int,
+        help="Most fields a hash holds before it is converted to a dict",
+        default=hashes.hash_max_listpack_entries,
+    )
+    parser.add_argument(
+        "--hash-max-listpack-value",
+        type=int,
+        help="Longest field or value, in bytes, kept in a listpack hash",
+        default=hashes.hash_max_listpack_value,
+    )
+    parser.add_argument(
+        "--set-max-intset-entries",
+        type=int,
+        help="Most members an integer set holds before it is converted to a set",
+        default=sets.set_max_intset_entries,
+    )
     parser.add_argument(
         "-v",
         "--verbose",
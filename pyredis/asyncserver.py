@@ -1,27 +1,70 @@
 import asyncio
 
-from pyredis.commands import handle_command
-from pyredis.protocol import encode_message, extract_frame_from_buffer
+from pyredis.blocking import Blocked, async_wait_blocked
+from pyredis.commands import Transaction, handle_command
+from pyredis.protocol import ProtocolError, RespParser, encode_message_into
+from pyredis.types import Error
 
 
 class RedisServerProtocol(asyncio.Protocol):
     def __init__(self, datastore, persister):
-        self.buffer = bytearray()
+        self._parser = RespParser()
         self._datastore = datastore
         self._persister = persister
+        self._transaction = Transaction()
+        # Task waiting for a blocked command; later commands queue behind it
+        self._blocked = None
 
     def connection_made(self, transport):
         self.transport = transport
 
+    def connection_lost(self, exc):
+        if self._blocked is not None:
+            self._blocked.cancel()
+
     def data_received(self, data):
         if not data:
             self.transport.close()
 
-        self.buffer.extend(data)
+        self._parser.feed(data)
+        if self._blocked is None:
+            self._process(bytearray())
+
+    def _process(self, replies):
+        # Drain every complete frame so pipelined commands are all answered
+        # with a single write, rather than one frame per received chunk.
+        protocol_error = False
+        try:
+            for frame in self._parser:
+                result = handle_command(
+                    frame, self._datastore, self._persister, self._transaction
+                )
+                if isinstance(result, Blocked):
+                    self._blocked = asyncio.ensure_future(
+                        self._wait_blocked(result, frame)
+                    )
+                    break
+                encode_message_into(result, replies)
+        except ProtocolError as e:
+            encode_message_into(Error(f"ERR Protocol error: {e}"), replies)
+            protocol_error = True
 
-        frame, frame_size = extract_frame_from_buffer(self.buffer)
+        # Group commit: the whole batch reaches the AOF before any reply.
+        if self._persister:
+            self._persister.flush()
+
+        if replies:
+            self.transport.write(replies)
+        if protocol_error:
+            self.transport.close()
 
-        if frame:
-            self.buffer = self.buffer[frame_size:]
-            result = handle_command(frame, self._datastore, self._persister)
-            self.transport.write(encode_message(result))
+    async def _wait_blocked(self, blocked, frame):
+        result = await async_wait_blocked(
+            blocked,
+            lambda: handle_command(frame, self._datastore, self._persister),
+            self._datastore.blocked_keys,
+        )
+        self._blocked = None
+        replies = bytearray()
+        encode_message_into(result, replies)
+        self._process(replies)
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+import trio
+
+
+@dataclass
+class Blocked:
+    """
+    Returned by a blocking command that found nothing to pop. The connection
+    waits until one of `keys` is pushed to, or for `timeout` seconds (0 for
+    ever), then runs the command again; `timeout_reply` is sent if it never
+    succeeds.
+    """
+
+    keys: list
+    timeout: float
+    timeout_reply: Any
+
+
+class BlockedKeys:
+    """
+    Clients blocked on list keys, as one wait queue per key. A push wakes the
+    client that has been waiting on the key the longest. The client then
+    runs its command again and, if another client took the item first,
+    queues up again at the front.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._lock = Lock()
+
+    def __bool__(self):
+        return bool(self._queues)
+
+    def add(self, keys, waiter, first=False):
+        with self._lock:
+            for key in keys:
+                queue = self._queues.get(key)
+                if queue is None:
+                    queue = self._queues[key] = deque()
+                if first:
+                    queue.appendleft(waiter)
+                else:
+                    queue.append(waiter)
+
+    def remove(self, keys, waiter):
+        with self._lock:
+            for key in keys:
+                queue = self._queues.get(key)
+                if queue is None:
+                    continue
+                try:
+                    queue.remove(waiter)
+                except ValueError:
+                    pass
+                if not queue:
+                    del self._queues[key]
+
+    def signal(self, key):
+        """Wake the longest waiting client blocked on key, if any."""
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                return
+            # Clients blocked on several keys may already have been woken
+            # through another one; they will not take this item.
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.woken:
+                    waiter.wake()
+                    break
+            if not queue:
+                del self._queues[key]
+
+
+class ThreadWaiter:
+    __slots__ = ("woken", "_condition")
+
+    def __init__(self):
+        self.woken = False
+        self._condition = threading.Condition(Lock())
+
+    def wake(self):
+        with self._condition:
+            self.woken = True
+            self._condition.notify()
+
+    def wait(self, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self.woken, timeout)
+
+
+class AsyncWaiter:
+    __slots__ = ("woken", "_future")
+
+    def __init__(self):
+        self.woken = False
+        self._future = asyncio.get_running_loop().create_future()
+
+    def wake(self):
+        self.woken = True
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._future, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class TrioWaiter:
+    __slots__ = ("woken", "_event")
+
+    def __init__(self):
+        self.woken = False
+        self._event = trio.Event()
+
+    def wake(self):
+        self.woken = True
+        self._event.set()
+
+    async def wait(self, timeout):
+        with trio.move_on_after(float("inf") if timeout is None else timeout):
+            await self._event.wait()
+
+
+def _remaining(deadline):
+    return None if deadline is None else deadline - monotonic()
+
+
+def _attempts(blocked, retry, blocked_keys, waiter_type):
+    """
+    Drive one blocked command. Yields (waiter, seconds) for every wait, the
+    waiter being registered and seconds None for no limit, and finally
+    (None, reply).
+
+    The waiter is registered before the command is tried again, so a push
+    landing between the first attempt and the wait is never missed.
+    """
+    deadline = monotonic() + blocked.timeout if blocked.timeout else None
+    first = False
+    while True:
+        waiter = waiter_type()
+        blocked_keys.add(blocked.keys, waiter, first)
+        try:
+            result = retry()
+            if not isinstance(result, Blocked):
+                yield None, result
+                return
+            timeout = _remaining(deadline)
+            if timeout is not None and timeout <= 0:
+                yield None, blocked.timeout_reply
+                return
+            yield waiter, timeout
+        finally:
+            blocked_keys.remove(blocked.keys, waiter)
+        first = True
+
+
+def wait_blocked(blocked, retry, blocked_keys):
+    """Block the calling thread until retry() succeeds or the command times out."""
+    attempts = _attempts(blocked, retry, blocked_keys, ThreadWaiter)
+    try:
+        for waiter, value in attempts:
+            if waiter is None:
+                return value
+            waiter.wait(value)
+    finally:
+        attempts.close()
+
+
+async def async_wait_blocked(blocked, retry, blocked_keys):
+    """asyncio version of wait_blocked, the wait is a future."""
+    attempts = _attempts(blocked, retry, blocked_keys, AsyncWaiter)
+    try:
+        for waiter, value in attempts:
+            if waiter is None:
+                return value
+            await waiter.wait(value)
+    finally:
+        # Deregisters the waiter when the connection is closed while blocked
+        attempts.close()
+
+
+async def trio_wait_blocked(blocked, retry, blocked_keys):
+    """Trio version of wait_blocked, the wait is an event."""
+    attempts = _attempts(blocked, retry, blocked_keys, TrioWaiter)
+    try:
+        for waiter, value in attempts:
+            if waiter is None:
+                return value
+            await waiter.wait(value)
+    finally:
+        attempts.close()
@@ -2,7 +2,7 @@
 import socket
 import argparse
 
-from pyredis.protocol import encode_message, extract_frame_from_buffer
+from pyredis.protocol import RespParser, encode_message
 from pyredis.types import Array, BulkString
 
 
@@ -21,7 +21,7 @@ def main(args):
     with socket.socket() as client_socket:
         client_socket.connect((server, port))
 
-        buffer = bytearray()
+        parser = RespParser()
 
         while True:
             command = input(f"{server}:{port}> ")
@@ -34,11 +34,10 @@ def main(args):
 
                 while True:
                     data = client_socket.recv(RECV_SIZE)
-                    buffer.extend(data)
-                    frame, frame_size = extract_frame_from_buffer(buffer)
+                    parser.feed(data)
+                    frame = parser.get_frame()
 
-                    if frame:
-                        buffer = buffer[frame_size:]
+                    if frame is not None:
                         if isinstance(frame, Array):
                             for count, item in enumerate(frame.data):
                                 print(f"{count +1} {item}")
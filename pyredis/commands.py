@@ -1,207 +1,1579 @@
-from pyredis.types import Array, BulkString, Error, Integer, SimpleString
+from pyredis.types import (
+    NULL_BULK_STRING,
+    OK,
+    PONG,
+    QUEUED,
+    Array,
+    BulkString,
+    Error,
+    Integer,
+    RawReply,
+    SimpleString,
+    encode_spans_into,
+    encode_values,
+)
+from pyredis import snapshot
+from pyredis.blocking import Blocked
+from pyredis.datastore import COLLECTION_TYPES
+from pyredis.encoding import INT_MAX, parse_float, parse_int
+from pyredis.eviction import MAXMEMORY_NOEVICTION
+from pyredis.functions import (
+    FUNCTIONS,
+    LIBRARIES,
+    FunctionError,
+    to_argument,
+    to_python,
+    to_reply,
+)
+from pyredis.sortedsets import format_score
+from collections.abc import Callable
+from typing import Any
+from dataclasses import dataclass, field
 import logging
+import os
+import re
+from time import time
 
 log = logging.getLogger("pyredis")
 
+_WRONGTYPE = Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+_NOT_AN_INTEGER = Error("ERR value is not an integer or out of range")
 
-def _handle_echo(command):
-    if len(command) == 2:
-        message = command[1].data.decode()
-        return BulkString(f"{message}")
-    return Error("ERR wrong number of arguments for 'echo' command")
+
+def _text(arg):
+    """Decode an argument for an error message or a name lookup."""
+    return arg.decode(errors="replace")
+
+
+@dataclass
+class CommandSpec:
+    """
+    Command table entry, as in the Redis command table. A positive arity is
+    the exact number of arguments including the command name, a negative
+    one the minimum. first_key, last_key and step give the key positions;
+    a negative last_key counts from the end of the command.
+    """
+
+    name: str
+    handler: Callable
+    arity: int
+    flags: tuple = ()
+    first_key: int = 0
+    last_key: int = 0
+    step: int = 0
+    write: bool = field(init=False)
+    denyoom: bool = field(init=False)
+
+    def __post_init__(self):
+        self.write = "write" in self.flags
+        self.denyoom = "denyoom" in self.flags
+
+    def keys(self, command):
+        if not self.first_key:
+            return []
+        last_key = self.last_key
+        if last_key < 0:
+            last_key += len(command)
+        return [command[i].data for i in range(self.first_key, last_key + 1, self.step)]
+
+
+class Transaction:
+    """
+    MULTI/EXEC state of one client connection. queued holds the (spec,
+    command) pairs given since MULTI, or is None outside of one; failed is
+    set when one of them was rejected, so EXEC aborts. watched maps the keys
+    given to WATCH to their versions at the time.
+    """
+
+    __slots__ = ("queued", "failed", "watched")
+
+    def __init__(self):
+        self.queued = None
+        self.failed = False
+        self.watched = {}
+
+    def reset(self):
+        self.queued = None
+        self.failed = False
+        self.watched = {}
+
+
+@dataclass
+class _Rewrite:
+    """Returned by a write handler that must be logged as a different command."""
+
+    reply: Any
+    command: Array
+
+
+@dataclass
+class _Effects:
+    """
+    Returned by a handler that wrote through other commands, which are
+    logged in its place, or that changed nothing, with no commands.
+    """
+
+    reply: Any
+    commands: list
 
 
-def _handle_ping(command):
+def _unchanged(reply):
+    """The result of a write that changed nothing: no key is modified or logged."""
+    return _Effects(reply, [])
+
+
+def _count_reply(count):
+    """The reply of a write that added or removed count items, if any."""
+    return Integer(count) if count else _unchanged(Integer(0))
+
+
+def _handle_echo(command, datastore, persister):
+    return BulkString(command[1].data)
+
+
+def _handle_ping(command, datastore, persister):
     if len(command) == 2:
-        message = command[1].data.decode()
-        return BulkString(f"{message}")
+        return BulkString(command[1].data)
     elif len(command) == 1:
-        return SimpleString("PONG")
+        return PONG
     else:
         return Error(data="ERR wrong number of arguments for 'ping' command")
 
 
 def _handle_set(command, datastore, persister):
     length = len(command)
-    if length >= 3:
-        key = command[1].data.decode()
-        value = command[2].data.decode()
-
-        if length == 3:
-            datastore[key] = value
-            if persister:
-                persister.log_command(command)
-            return SimpleString("OK")
-        elif length == 5:
-            expiry_mode = command[3].data.decode()
-            try:
-                expiry = int(command[4].data.decode())
-            except ValueError:
-                return Error("ERR value is not an integer or out of range")
-
-            if expiry_mode == "ex":
-                datastore.set_with_expiry(key, value, expiry * 1000)
-                if persister:
-                    persister.log_command(command)
-                return SimpleString("OK")
-            elif expiry_mode == "px":
-                datastore.set_with_expiry(key, value, expiry)
-                if persister:
-                    persister.log_command(command)
-                return SimpleString("OK")
-        return Error("ERR syntax error")
+    key = command[1].data
+    value = command[2].data
 
-    return Error("ERR wrong number of arguments for 'set' command")
+    if length == 3:
+        datastore[key] = value
+        return OK
+    elif length == 5:
+        expiry_mode = command[3].data.lower()
+        if expiry_mode not in (b"ex", b"px", b"exat", b"pxat"):
+            return Error("ERR syntax error")
+        try:
+            expiry = parse_int(command[4].data)
+        except ValueError:
+            return _NOT_AN_INTEGER
+        match expiry_mode:
+            case b"ex":
+                deadline = int(time() * 1000) + expiry * 1000
+            case b"px":
+                deadline = int(time() * 1000) + expiry
+            case b"exat":
+                deadline = expiry * 1000
+            case b"pxat":
+                deadline = expiry
+        # The deadline is stored, and saved to snapshots, as a signed 64 bit
+        # number of milliseconds
+        if expiry <= 0 or deadline > INT_MAX:
+            return Error("ERR invalid expire time in 'set' command")
+        datastore.set_with_expiry_at(key, value, deadline)
 
+        # Log an absolute deadline so a replay does not extend the TTL
+        return _Rewrite(
+            OK,
+            Array(
+                [
+                    *command[:3],
+                    BulkString(b"PXAT"),
+                    BulkString(b"%d" % deadline),
+                ]
+            ),
+        )
+    return Error("ERR syntax error")
 
-def _handle_get(command, datastore):
-    if len(command) == 2:
-        key = command[1].data.decode()
-        try:
-            value = datastore[key]
-        except KeyError:
-            return BulkString(None)
-        return BulkString(value)
-    return Error("ERR wrong numer of arguments for 'get' command")
-
-
-def _handle_exists(command, datastore):
-    if len(command) >= 2:
-        found = 0
-        for key in command[1:]:
-            if key.data.decode() in datastore:
-                found += 1
-        return Integer(found)
-    else:
-        return Error("ERR wrong number of arguments for 'exists' command")
+
+def _handle_get(command, datastore, persister):
+    key = command[1].data
+    try:
+        value = datastore[key]
+    except KeyError:
+        return NULL_BULK_STRING
+    if isinstance(value, COLLECTION_TYPES):
+        return _WRONGTYPE
+    return BulkString(value)
+
+
+def _handle_mget(command, datastore, persister):
+    values = datastore.mget([key.data for key in command[1:]])
+    return RawReply(encode_values(values))
+
+
+def _pairs(command):
+    """The (key, value) pairs of MSET and MSETNX, or None if one is incomplete."""
+    if len(command) % 2 == 0:
+        return None
+    return [(command[i].data, command[i + 1].data) for i in range(1, len(command), 2)]
+
+
+def _handle_mset(command, datastore, persister):
+    pairs = _pairs(command)
+    if pairs is None:
+        return Error("ERR wrong number of arguments for 'mset' command")
+    datastore.mset(pairs)
+    return OK
+
+
+def _handle_msetnx(command, datastore, persister):
+    pairs = _pairs(command)
+    if pairs is None:
+        return Error("ERR wrong number of arguments for 'msetnx' command")
+    return _count_reply(int(datastore.msetnx(pairs)))
+
+
+def _handle_exists(command, datastore, persister):
+    keys = [key.data for key in command[1:]]
+    return Integer(datastore.exists(keys))
 
 
 def _handle_del(command, datastore, persister):
-    if len(command) >= 2:
-        found = 0
-        for key in command[1:]:
-            if key.data.decode() in datastore:
-                del datastore._data[key.data.decode()]
-                found += 1
-        if persister:
-            persister.log_command(command)
-        return Integer(found)
-    else:
-        return Error("ERR wrong number of arguments for 'del' command")
+    keys = [key.data for key in command[1:]]
+    return _count_reply(datastore.delete(keys))
+
+
+def _incr_by(key, amount, datastore):
+    try:
+        return Integer(datastore.incr_by(key, amount))
+    except TypeError:
+        return _NOT_AN_INTEGER
+    except OverflowError:
+        return Error("ERR increment or decrement would overflow")
 
 
 def _handle_incr(command, datastore, persister):
-    if len(command) == 2:
-        key = command[1].data.decode()
-        try:
-            value = datastore.incr(key)
-            if persister:
-                persister.log_command(command)
-            return Integer(value)
-        except TypeError:
-            return Error("ERR value is not an integer or out of range")
-    return Error("ERR wrong number of arguments for 'incr' command")
+    return _incr_by(command[1].data, 1, datastore)
 
 
 def _handle_decr(command, datastore, persister):
-    if len(command) == 2:
-        key = command[1].data.decode()
-        try:
-            value = datastore.decr(key)
-            if persister:
-                persister.log_command(command)
-            return Integer(value)
-        except TypeError:
-            return Error("ERR value is not an integer or out of range")
-    return Error("ERR wrong number of arguments for 'decr' command")
+    return _incr_by(command[1].data, -1, datastore)
+
+
+def _handle_incrby(command, datastore, persister):
+    try:
+        amount = parse_int(command[2].data)
+    except ValueError:
+        return _NOT_AN_INTEGER
+    return _incr_by(command[1].data, amount, datastore)
+
+
+def _handle_decrby(command, datastore, persister):
+    try:
+        amount = parse_int(command[2].data)
+    except ValueError:
+        return _NOT_AN_INTEGER
+    return _incr_by(command[1].data, -amount, datastore)
+
+
+def _handle_incrbyfloat(command, datastore, persister):
+    try:
+        amount = parse_float(command[2].data)
+    except ValueError:
+        return Error("ERR value is not a valid float")
+    try:
+        return BulkString(datastore.incr_by_float(command[1].data, amount))
+    except TypeError:
+        return Error("ERR value is not a valid float")
+    except OverflowError:
+        return Error("ERR increment would produce NaN or Infinity")
+
+
+def _handle_getset(command, datastore, persister):
+    try:
+        return BulkString(datastore.getset(command[1].data, command[2].data))
+    except TypeError:
+        return _WRONGTYPE
 
 
 def _handle_lpush(command, datastore, persister):
-    if len(command) >= 2:
-        count = 0
-        key = command[1].data.decode()
+    count = 0
+    key = command[1].data
+
+    try:
+        for c in command[2:]:
+            count = datastore.prepend(key, c.data)
+        return Integer(count)
+    except TypeError:
+        return _WRONGTYPE
+
 
+def _handle_lrange(command, datastore, persister):
+    try:
+        start = parse_int(command[2].data)
+        stop = parse_int(command[3].data)
+    except ValueError:
+        return _NOT_AN_INTEGER
+
+    # The items are encoded straight from the list nodes, without a bytes or
+    # BulkString object per item, so the key stays locked until they are.
+    key = command[1].data
+    reply = bytearray()
+    with datastore.lock_keys([key]):
         try:
-            for c in command[2:]:
-                item = c.data.decode()
-                count = datastore.prepend(key, item)
-            if persister:
-                persister.log_command(command)
-            return Integer(count)
+            count, spans = datastore.lrange_spans(key, start, stop)
         except TypeError:
-            return Error(
-                "WRONGTYPE Operation against a key holding the wrong kind of value"
-            )
-    return Error("ERR wrong number of arguments for 'lpush' command")
+            return _WRONGTYPE
+        encode_spans_into(reply, count, spans)
+    return RawReply(reply)
+
+
+def _handle_rpush(command, datastore, persister):
+    count = 0
+    key = command[1].data
+
+    try:
+        for c in command[2:]:
+            count = datastore.append(key, c.data)
+        return Integer(count)
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_llen(command, datastore, persister):
+    try:
+        return Integer(datastore.llen(command[1].data))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_lindex(command, datastore, persister):
+    try:
+        index = parse_int(command[2].data)
+    except ValueError:
+        return _NOT_AN_INTEGER
+    try:
+        return BulkString(datastore.lindex(command[1].data, index))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_lset(command, datastore, persister):
+    try:
+        index = parse_int(command[2].data)
+    except ValueError:
+        return _NOT_AN_INTEGER
+    try:
+        datastore.lset(command[1].data, index, command[3].data)
+    except TypeError:
+        return _WRONGTYPE
+    except KeyError:
+        return Error("ERR no such key")
+    except IndexError:
+        return Error("ERR index out of range")
+    return OK
 
 
-def _handle_lrange(command, datastore):
-    if len(command) == 4:
-        key = command[1].data.decode()
-        start = int(command[2].data.decode())
-        stop = int(command[3].data.decode())
+def _pop(command, pop):
+    if len(command) > 3:
+        return Error("ERR syntax error")
+    count = 1
+    if len(command) == 3:
+        try:
+            count = parse_int(command[2].data)
+        except ValueError:
+            return _NOT_AN_INTEGER
+        if count < 0:
+            return Error("ERR value is out of range, must be positive")
+
+    try:
+        items = pop(command[1].data, count)
+    except TypeError:
+        return _WRONGTYPE
+    if len(command) == 2:
+        reply = BulkString(items[0] if items else None)
+    elif items is None:
+        reply = Array(None)
+    else:
+        reply = Array([BulkString(item) for item in items])
+    return reply if items else _unchanged(reply)
+
+
+def _handle_lpop(command, datastore, persister):
+    return _pop(command, datastore.lpop)
+
+
+def _handle_rpop(command, datastore, persister):
+    return _pop(command, datastore.rpop)
 
+
+def _timeout(arg):
+    """Parse a blocking command timeout in seconds, or return an Error."""
+    try:
+        timeout = parse_float(arg)
+    except ValueError:
+        return Error("ERR timeout is not a float or out of range")
+    if timeout < 0:
+        return Error("ERR timeout is negative")
+    return timeout
+
+
+def _blocking_pop(command, pop, name):
+    timeout = _timeout(command[-1].data)
+    if isinstance(timeout, Error):
+        return timeout
+    keys = [c.data for c in command[1:-1]]
+    for key in keys:
         try:
-            items = datastore.lrange(key, start, stop)
-            return Array([BulkString(i) for i in items])
+            items = pop(key)
         except TypeError:
-            return Error(
-                "WRONGTYPE Operatino against a key holding the wrong kind of value"
+            return _WRONGTYPE
+        if items:
+            # Logged as the non blocking pop it amounts to, as Redis does
+            return _Rewrite(
+                Array([BulkString(key), BulkString(items[0])]),
+                Array([BulkString(name), BulkString(key)]),
             )
+    return Blocked(keys, timeout, Array(None))
 
-    return Error("ERR wrong number of arguments for 'lrange' command")
 
+def _handle_blpop(command, datastore, persister):
+    return _blocking_pop(command, datastore.lpop, b"LPOP")
+
+
+def _handle_brpop(command, datastore, persister):
+    return _blocking_pop(command, datastore.rpop, b"RPOP")
+
+
+def _list_end(arg):
+    """True for LEFT, False for RIGHT and None for anything else."""
+    match arg.upper():
+        case b"LEFT":
+            return True
+        case b"RIGHT":
+            return False
+    return None
+
+
+def _move(command, datastore):
+    from_head = _list_end(command[3].data)
+    to_head = _list_end(command[4].data)
+    if from_head is None or to_head is None:
+        return Error("ERR syntax error")
+    try:
+        item = datastore.lmove(command[1].data, command[2].data, from_head, to_head)
+    except TypeError:
+        return _WRONGTYPE
+    return BulkString(item)
+
+
+def _handle_lmove(command, datastore, persister):
+    reply = _move(command, datastore)
+    return _unchanged(reply) if reply == NULL_BULK_STRING else reply
+
+
+def _handle_blmove(command, datastore, persister):
+    timeout = _timeout(command[5].data)
+    if isinstance(timeout, Error):
+        return timeout
+    reply = _move(command, datastore)
+    if reply == NULL_BULK_STRING:
+        return Blocked([command[1].data], timeout, NULL_BULK_STRING)
+    if isinstance(reply, Error):
+        return reply
+    return _Rewrite(reply, Array([BulkString(b"LMOVE"), *command[1:5]]))
+
+
+def _handle_ltrim(command, datastore, persister):
+    try:
+        start = parse_int(command[2].data)
+        stop = parse_int(command[3].data)
+    except ValueError:
+        return _NOT_AN_INTEGER
+    try:
+        datastore.ltrim(command[1].data, start, stop)
+    except TypeError:
+        return _WRONGTYPE
+    return OK
+
+
+def _handle_hset(command, datastore, persister):
+    if len(command) % 2:
+        return Error("ERR wrong number of arguments for 'hset' command")
+    pairs = [(command[i].data, command[i + 1].data) for i in range(2, len(command), 2)]
+    try:
+        return Integer(datastore.hset(command[1].data, pairs))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_hget(command, datastore, persister):
+    try:
+        return BulkString(datastore.hget(command[1].data, command[2].data))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_hmget(command, datastore, persister):
+    try:
+        values = datastore.hmget(command[1].data, [c.data for c in command[2:]])
+    except TypeError:
+        return _WRONGTYPE
+    return Array([BulkString(value) for value in values])
+
+
+def _handle_hgetall(command, datastore, persister):
+    try:
+        pairs = datastore.hgetall(command[1].data)
+    except TypeError:
+        return _WRONGTYPE
+    return Array([BulkString(data) for pair in pairs for data in pair])
+
+
+def _handle_hdel(command, datastore, persister):
+    try:
+        return _count_reply(
+            datastore.hdel(command[1].data, [c.data for c in command[2:]])
+        )
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_hlen(command, datastore, persister):
+    try:
+        return Integer(datastore.hlen(command[1].data))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_hincrby(command, datastore, persister):
+    try:
+        amount = parse_int(command[3].data)
+    except ValueError:
+        return _NOT_AN_INTEGER
+    try:
+        return Integer(datastore.hincrby(command[1].data, command[2].data, amount))
+    except TypeError:
+        return _WRONGTYPE
+    except ValueError:
+        return Error("ERR hash value is not an integer")
+    except OverflowError:
+        return Error("ERR increment or decrement would overflow")
+
+
+def _compile_glob(pattern):
+    """Compile a Redis glob style pattern into a bytes regular expression."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i : i + 1]
+        i += 1
+        if char == b"*":
+            parts.append(b".*")
+        elif char == b"?":
+            parts.append(b".")
+        elif char == b"\\" and i < len(pattern):
+            parts.append(re.escape(pattern[i : i + 1]))
+            i += 1
+        elif char == b"[" and b"]" in pattern[i + 1 :]:
+            end = pattern.index(b"]", i + 1)
+            body = pattern[i:end]
+            i = end + 1
+            negate = body.startswith(b"^")
+            if negate:
+                body = body[1:]
+            body = b"".join(
+                b"-" if byte == 0x2D else re.escape(bytes((byte,))) for byte in body
+            )
+            parts.append(b"[%s%s]" % (b"^" if negate else b"", body))
+        else:
+            parts.append(re.escape(char))
+    return re.compile(b"".join(parts) + b"\\Z", re.DOTALL)
+
+
+def _scan_options(command, start, with_type=False):
+    """
+    Parse the MATCH and COUNT options of the SCAN family from command[start:],
+    and TYPE if with_type. Returns the compiled pattern or None, the count
+    and the type name or None; or an Error.
+    """
+    pattern, count, kind = None, 10, None
+    if (len(command) - start) % 2:
+        return Error("ERR syntax error")
+    for i in range(start, len(command), 2):
+        value = command[i + 1].data
+        match command[i].data.upper():
+            case b"MATCH":
+                pattern = None if value == b"*" else _compile_glob(value)
+            case b"COUNT":
+                try:
+                    count = parse_int(value)
+                except ValueError:
+                    return _NOT_AN_INTEGER
+                if count < 1:
+                    return Error("ERR syntax error")
+            case b"TYPE" if with_type:
+                kind = _text(value).lower()
+            case _:
+                return Error("ERR syntax error")
+    return pattern, count, kind
+
+
+def _cursor(arg):
+    try:
+        cursor = parse_int(arg)
+    except ValueError:
+        return None
+    return cursor if cursor >= 0 else None
+
+
+def _scan_reply(cursor, items):
+    return Array(
+        [
+            BulkString(b"%d" % cursor),
+            Array([BulkString(item) for item in items]),
+        ]
+    )
+
+
+def _handle_scan(command, datastore, persister):
+    cursor = _cursor(command[1].data)
+    if cursor is None:
+        return Error("ERR invalid cursor")
+    options = _scan_options(command, 2, with_type=True)
+    if isinstance(options, Error):
+        return options
+    pattern, count, kind = options
+    cursor, keys = datastore.scan(cursor, count, kind)
+    if pattern is not None:
+        keys = list(filter(pattern.match, keys))
+    return _scan_reply(cursor, keys)
+
+
+def _handle_keys(command, datastore, persister):
+    pattern = command[1].data
+    # Compiled once, then matched against every key
+    pattern = None if pattern == b"*" else _compile_glob(pattern)
+    keys = []
+    # Walked in batches, so that other clients get the lock in between
+    cursor = 0
+    while True:
+        cursor, batch = datastore.scan(cursor, 1000)
+        if pattern is None:
+            keys += batch
+        else:
+            keys += filter(pattern.match, batch)
+        if not cursor:
+            break
+    return Array([BulkString(key) for key in keys])
+
+
+def _handle_type(command, datastore, persister):
+    return SimpleString(datastore.type(command[1].data))
+
+
+def _handle_hscan(command, datastore, persister):
+    cursor = _cursor(command[2].data)
+    if cursor is None:
+        return Error("ERR invalid cursor")
+    options = _scan_options(command, 3)
+    if isinstance(options, Error):
+        return options
+    pattern, count, _ = options
+    try:
+        cursor, pairs = datastore.hscan(command[1].data, cursor, count)
+    except TypeError:
+        return _WRONGTYPE
+    if pattern is not None:
+        pairs = [pair for pair in pairs if pattern.match(pair[0])]
+    return _scan_reply(cursor, [data for pair in pairs for data in pair])
+
+
+def _handle_sadd(command, datastore, persister):
+    try:
+        return _count_reply(
+            datastore.sadd(command[1].data, [c.data for c in command[2:]])
+        )
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_srem(command, datastore, persister):
+    try:
+        return _count_reply(
+            datastore.srem(command[1].data, [c.data for c in command[2:]])
+        )
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_sismember(command, datastore, persister):
+    try:
+        return Integer(int(datastore.sismember(command[1].data, command[2].data)))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_scard(command, datastore, persister):
+    try:
+        return Integer(datastore.scard(command[1].data))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _members_reply(read, arg):
+    try:
+        members = read(arg)
+    except TypeError:
+        return _WRONGTYPE
+    return Array([BulkString(member) for member in members])
+
+
+def _handle_smembers(command, datastore, persister):
+    return _members_reply(datastore.smembers, command[1].data)
 
-def _handle_rpush(command, datastore, persister):
-    if len(command) >= 2:
-        count = 0
-        key = command[1].data.decode()
 
+def _handle_sscan(command, datastore, persister):
+    cursor = _cursor(command[2].data)
+    if cursor is None:
+        return Error("ERR invalid cursor")
+    options = _scan_options(command, 3)
+    if isinstance(options, Error):
+        return options
+    pattern, count, _ = options
+    try:
+        cursor, members = datastore.sscan(command[1].data, cursor, count)
+    except TypeError:
+        return _WRONGTYPE
+    if pattern is not None:
+        members = [
+            member
+            for member in members
+            # Integer members of a set are stored as ints
+            if pattern.match(b"%d" % member if type(member) is int else member)
+        ]
+    return _scan_reply(cursor, members)
+
+
+def _handle_sinter(command, datastore, persister):
+    return _members_reply(datastore.sinter, [c.data for c in command[1:]])
+
+
+def _handle_sunion(command, datastore, persister):
+    return _members_reply(datastore.sunion, [c.data for c in command[1:]])
+
+
+def _handle_sdiff(command, datastore, persister):
+    return _members_reply(datastore.sdiff, [c.data for c in command[1:]])
+
+
+def _handle_sinterstore(command, datastore, persister):
+    keys = [c.data for c in command[2:]]
+    try:
+        return Integer(datastore.sinterstore(command[1].data, keys))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _score(arg):
+    """Parse a sorted set score, None if it is not a float."""
+    try:
+        score = parse_float(arg)
+    except ValueError:
+        return None
+    # NaN never compares equal to itself
+    return score if score == score else None
+
+
+def _score_bound(arg):
+    """Parse a score range bound, "(" making it exclusive, into (score, exclusive)."""
+    exclusive = arg.startswith(b"(")
+    score = _score(arg[1:] if exclusive else arg)
+    return None if score is None else (score, exclusive)
+
+
+def _lex_bound(arg):
+    """
+    Parse a lex range bound, "[" or "(" followed by a member, into (member,
+    exclusive). "-" and "+" are returned as they are.
+    """
+    if arg in (b"-", b"+"):
+        return arg
+    match arg[:1]:
+        case b"[":
+            return arg[1:], False
+        case b"(":
+            return arg[1:], True
+    return None
+
+
+def _pairs_reply(pairs, withscores):
+    reply = []
+    for member, score in pairs:
+        reply.append(BulkString(member))
+        if withscores:
+            reply.append(BulkString(format_score(score)))
+    return Array(reply)
+
+
+_ZADD_OPTIONS = {b"NX", b"XX", b"GT", b"LT", b"CH", b"INCR"}
+
+
+def _handle_zadd(command, datastore, persister):
+    options = set()
+    i = 2
+    while i < len(command) and command[i].data.upper() in _ZADD_OPTIONS:
+        options.add(command[i].data.upper())
+        i += 1
+    if {b"NX", b"XX"} <= options:
+        return Error("ERR XX and NX options at the same time are not compatible")
+    if {b"GT", b"LT"} <= options or (b"NX" in options and options & {b"GT", b"LT"}):
+        return Error(
+            "ERR GT, LT, and/or NX options at the same time are not compatible"
+        )
+    if i == len(command) or (len(command) - i) % 2:
+        return Error("ERR syntax error")
+    if b"INCR" in options and len(command) - i != 2:
+        return Error("ERR INCR option supports a single increment-element pair")
+
+    pairs = []
+    for j in range(i, len(command), 2):
+        score = _score(command[j].data)
+        if score is None:
+            return Error("ERR value is not a valid float")
+        pairs.append((command[j + 1].data, score))
+    condition = next((o.decode() for o in (b"NX", b"XX") if o in options), None)
+    compare = next((o.decode() for o in (b"GT", b"LT") if o in options), None)
+
+    key = command[1].data
+    try:
+        if b"INCR" in options:
+            ((member, amount),) = pairs
+            score = datastore.zincrby(key, member, amount, condition, compare)
+            if score is None:
+                return _unchanged(NULL_BULK_STRING)
+            return BulkString(format_score(score))
+        added, changed = datastore.zadd(key, pairs, condition, compare)
+    except TypeError:
+        return _WRONGTYPE
+    except ValueError:
+        return Error("ERR resulting score is not a number (NaN)")
+    reply = Integer(added + changed if b"CH" in options else added)
+    return reply if added or changed else _unchanged(reply)
+
+
+def _handle_zincrby(command, datastore, persister):
+    amount = _score(command[2].data)
+    if amount is None:
+        return Error("ERR value is not a valid float")
+    try:
+        score = datastore.zincrby(command[1].data, command[3].data, amount)
+    except TypeError:
+        return _WRONGTYPE
+    except ValueError:
+        return Error("ERR resulting score is not a number (NaN)")
+    return BulkString(format_score(score))
+
+
+def _handle_zrem(command, datastore, persister):
+    try:
+        return _count_reply(
+            datastore.zrem(command[1].data, [c.data for c in command[2:]])
+        )
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_zscore(command, datastore, persister):
+    try:
+        score = datastore.zscore(command[1].data, command[2].data)
+    except TypeError:
+        return _WRONGTYPE
+    return BulkString(None if score is None else format_score(score))
+
+
+def _handle_zcard(command, datastore, persister):
+    try:
+        return Integer(datastore.zcard(command[1].data))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_zrank(command, datastore, persister):
+    try:
+        rank = datastore.zrank(command[1].data, command[2].data)
+    except TypeError:
+        return _WRONGTYPE
+    return BulkString(None) if rank is None else Integer(rank)
+
+
+def _handle_zcount(command, datastore, persister):
+    low, high = _score_bound(command[2].data), _score_bound(command[3].data)
+    if low is None or high is None:
+        return Error("ERR min or max is not a float")
+    try:
+        return Integer(datastore.zcount(command[1].data, low, high))
+    except TypeError:
+        return _WRONGTYPE
+
+
+def _handle_zrange(command, datastore, persister):
+    by, reverse, withscores, limit = None, False, False, None
+    i = 4
+    while i < len(command):
+        match command[i].data.upper():
+            case b"BYSCORE" | b"BYLEX" as option:
+                by = option
+            case b"REV":
+                reverse = True
+            case b"WITHSCORES":
+                withscores = True
+            case b"LIMIT" if i + 2 < len(command):
+                try:
+                    limit = parse_int(command[i + 1].data), parse_int(
+                        command[i + 2].data
+                    )
+                except ValueError:
+                    return _NOT_AN_INTEGER
+                i += 2
+            case _:
+                return Error("ERR syntax error")
+        i += 1
+    if limit is not None and by is None:
+        return Error(
+            "ERR syntax error, LIMIT is only supported in combination with either "
+            "BYSCORE or BYLEX"
+        )
+    if withscores and by == b"BYLEX":
+        return Error(
+            "ERR syntax error, WITHSCORES not supported in combination with BYLEX"
+        )
+
+    key, low, high = command[1].data, command[2].data, command[3].data
+    # With REV, the score and lex ranges are given from max to min
+    if reverse and by is not None:
+        low, high = high, low
+    offset, count = limit or (0, -1)
+    try:
+        match by:
+            case None:
+                try:
+                    start, stop = parse_int(low), parse_int(high)
+                except ValueError:
+                    return _NOT_AN_INTEGER
+                pairs = datastore.zrange(key, start, stop, reverse)
+            case b"BYSCORE":
+                low, high = _score_bound(low), _score_bound(high)
+                if low is None or high is None:
+                    return Error("ERR min or max is not a float")
+                pairs = datastore.zrange_by_score(
+                    key, low, high, reverse, offset, count
+                )
+            case b"BYLEX":
+                low, high = _lex_bound(low), _lex_bound(high)
+                if low is None or high is None:
+                    return Error("ERR min or max not valid string range item")
+                if low == b"+" or high == b"-":
+                    return Array([])
+                pairs = datastore.zrange_by_lex(
+                    key,
+                    None if low == b"-" else low,
+                    None if high == b"+" else high,
+                    reverse,
+                    offset,
+                    count,
+                )
+    except TypeError:
+        return _WRONGTYPE
+    return _pairs_reply(pairs, withscores)
+
+
+def _zpop(command, datastore, from_max):
+    if len(command) > 3:
+        return Error("ERR syntax error")
+    count = 1
+    if len(command) == 3:
         try:
-            for c in command[2:]:
-                item = c.data.decode()
-                count = datastore.append(key, item)
-            if persister:
-                persister.log_command(command)
-            return Integer(count)
-        except TypeError:
-            return Error(
-                "WRONGTYPE Operation against a key holding the wrong kind of value"
+            count = parse_int(command[2].data)
+        except ValueError:
+            return _NOT_AN_INTEGER
+        if count < 0:
+            return Error("ERR value is out of range, must be positive")
+    try:
+        pairs = datastore.zpop(command[1].data, count, from_max)
+    except TypeError:
+        return _WRONGTYPE
+    reply = _pairs_reply(pairs, True)
+    return reply if pairs else _unchanged(reply)
+
+
+def _handle_zpopmin(command, datastore, persister):
+    return _zpop(command, datastore, False)
+
+
+def _handle_zpopmax(command, datastore, persister):
+    return _zpop(command, datastore, True)
+
+
+def _handle_bgrewriteaof(command, datastore, persister):
+    if not persister:
+        return Error("ERR Append only file is not enabled")
+    if not persister.rewrite(datastore):
+        return Error("ERR Background append only file rewriting already in progress")
+    return SimpleString("Background append only file rewriting started")
+
+
+def _handle_save(command, datastore, persister):
+    if snapshot.bgsave_in_progress():
+        return Error("ERR Background save already in progress")
+    snapshot.save(datastore)
+    return OK
+
+
+def _handle_bgsave(command, datastore, persister):
+    if not snapshot.bgsave(datastore):
+        return Error("ERR Background save already in progress")
+    return SimpleString("Background saving started")
+
+
+def _handle_memory(command, datastore, persister):
+    match command[1].data.upper():
+        case b"USAGE":
+            # Every encoding tracks its own size, so SAMPLES is accepted for
+            # compatibility but nothing needs to be sampled.
+            if len(command) == 5 and command[3].data.upper() == b"SAMPLES":
+                try:
+                    parse_int(command[4].data)
+                except ValueError:
+                    return _NOT_AN_INTEGER
+            elif len(command) != 3:
+                return Error("ERR syntax error")
+            usage = datastore.memory_usage(command[2].data)
+            return NULL_BULK_STRING if usage is None else Integer(usage)
+    return Error(f"ERR unknown subcommand '{_text(command[1].data)}'. Try MEMORY HELP.")
+
+
+def _bytes_to_human(size):
+    for unit, scale in (("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)):
+        if size >= scale:
+            return f"{size / scale:.2f}{unit}"
+    return f"{size}B"
+
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _memory_info(datastore):
+    used = datastore.used_memory()
+    lines = [
+        "# Memory",
+        f"used_memory:{used}",
+        f"used_memory_human:{_bytes_to_human(used)}",
+    ]
+    rss = _rss()
+    if rss is not None:
+        lines += [
+            f"used_memory_rss:{rss}",
+            f"used_memory_rss_human:{_bytes_to_human(rss)}",
+        ]
+    evictor = datastore.evictor
+    maxmemory = evictor.maxmemory if evictor else 0
+    lines += [
+        f"maxmemory:{maxmemory}",
+        f"maxmemory_human:{_bytes_to_human(maxmemory)}",
+        f"maxmemory_policy:{evictor.policy if evictor else MAXMEMORY_NOEVICTION}",
+    ]
+    return lines
+
+
+def _stats_info(datastore):
+    evictor = datastore.evictor
+    return ["# Stats", f"evicted_keys:{evictor.evicted_keys if evictor else 0}"]
+
+
+_INFO_SECTIONS = {"memory": _memory_info, "stats": _stats_info}
+
+
+def _handle_info(command, datastore, persister):
+    if len(command) == 1:
+        sections = list(_INFO_SECTIONS)
+    else:
+        sections = [_text(c.data).lower() for c in command[1:]]
+        if "all" in sections or "everything" in sections or "default" in sections:
+            sections = list(_INFO_SECTIONS)
+
+    lines = []
+    for section in sections:
+        render = _INFO_SECTIONS.get(section)
+        if render is not None:
+            if lines:
+                lines.append("")
+            lines += render(datastore)
+    return BulkString("".join(f"{line}\r\n" for line in lines).encode())
+
+
+def _command_info(spec):
+    return Array(
+        [
+            BulkString(spec.name.encode()),
+            Integer(spec.arity),
+            Array([SimpleString(flag) for flag in spec.flags]),
+            Integer(spec.first_key),
+            Integer(spec.last_key),
+            Integer(spec.step),
+        ]
+    )
+
+
+def _handle_command(command, datastore, persister):
+    if len(command) == 1:
+        return Array([_command_info(spec) for spec in _COMMAND_SPECS])
+
+    match command[1].data.upper():
+        case b"COUNT":
+            return Integer(len(_COMMAND_SPECS))
+        case b"INFO":
+            if len(command) == 2:
+                return Array([_command_info(spec) for spec in _COMMAND_SPECS])
+            infos = []
+            for name in command[2:]:
+                spec = lookup_command(name.data)
+                infos.append(NULL_BULK_STRING if spec is None else _command_info(spec))
+            return Array(infos)
+    return Error(
+        f"ERR unknown subcommand '{_text(command[1].data)}'. Try COMMAND HELP."
+    )
+
+
+_OOM = Error("OOM command not allowed when used memory > 'maxmemory'.")
+
+
+def _evict(datastore, persister):
+    """Evict keys down to maxmemory. Returns False if that is not possible."""
+    if datastore.evictor is None:
+        return True
+    if not persister:
+        return datastore.evict(None)
+
+    def on_evict(key):
+        # Evicted keys are logged as deletes, as Redis propagates them
+        persister.log_command(Array([BulkString(b"DEL"), BulkString(key)]))
+
+    return datastore.evict(on_evict)
+
+
+def _execute(spec, command, datastore, persister, keys):
+    """
+    Run a write command with its keys locked. Returns the reply and the
+    commands to log, none if nothing was written.
+    """
+    result = spec.handler(command, datastore, persister)
+    if isinstance(result, _Effects):
+        # The commands it ran marked their own keys modified
+        return result.reply, result.commands
+    if isinstance(result, _Rewrite):
+        result, command = result.reply, result.command
+    if isinstance(result, (Error, Blocked)):
+        return result, []
+    datastore.mark_modified(keys)
+    return result, [command]
+
+
+def _run_in_block(spec, command, datastore, persister, allowed, logged):
+    """
+    Run a command of a MULTI block or a function, with its keys already
+    locked. allowed is False when the memory limit denies writes; the
+    commands to log are appended to logged.
+    """
+    if not spec.write:
+        return spec.handler(command, datastore, persister)
+    if not allowed and spec.denyoom:
+        return _OOM
+    result, commands = _execute(spec, command, datastore, persister, spec.keys(command))
+    logged += commands
+    # Blocking commands never block inside a transaction or a function
+    if isinstance(result, Blocked):
+        return result.timeout_reply
+    return result
+
+
+def _log_block(persister, logged):
+    """
+    Log the writes of one atomic command. Several are wrapped in MULTI and
+    EXEC, which a replay applies whole.
+    """
+    if len(logged) == 1:
+        persister.log_command(logged[0])
+    elif logged:
+        persister.log_commands(
+            [Array([BulkString(b"MULTI")]), *logged, Array([BulkString(b"EXEC")])]
+        )
+
+
+def _handle_multi(command, datastore, persister, transaction):
+    if transaction.queued is not None:
+        transaction.failed = True
+        return Error("ERR MULTI calls can not be nested")
+    transaction.queued = []
+    return OK
+
+
+def _handle_exec(command, datastore, persister, transaction):
+    queued, watched = transaction.queued, transaction.watched
+    if queued is None:
+        return Error("ERR EXEC without MULTI")
+    failed = transaction.failed
+    transaction.reset()
+    if failed:
+        return Error("EXECABORT Transaction discarded because of previous errors.")
+
+    keys = list(watched)
+    for spec, queued_command in queued:
+        keys += spec.keys(queued_command)
+    # Evicting takes every shard lock, so it is done before locking the keys
+    allowed = _evict(datastore, persister) if any(s.write for s, _ in queued) else True
+    # A command without key positions may lock any shard from its handler,
+    # as SCAN, MEMORY USAGE, SAVE or a function do, and locking shards out
+    # of order could deadlock, so the block takes the whole store first
+    if any(not spec.first_key for spec, _ in queued):
+        lock = datastore.lock_all()
+    else:
+        lock = datastore.lock_keys(keys)
+
+    replies = []
+    logged = []
+    with lock:
+        for key, version in watched.items():
+            if datastore.version(key) != version:
+                return Array(None)
+        for spec, queued_command in queued:
+            replies.append(
+                _run_in_block(
+                    spec, queued_command, datastore, persister, allowed, logged
+                )
             )
-    return Error("ERR wrong number of arguments for 'rpush' command")
+        if persister and logged:
+            _log_block(persister, logged)
+    return Array(replies)
+
+
+def _handle_discard(command, datastore, persister, transaction):
+    if transaction.queued is None:
+        return Error("ERR DISCARD without MULTI")
+    transaction.reset()
+    return OK
+
+
+def _handle_watch(command, datastore, persister, transaction):
+    if transaction.queued is not None:
+        transaction.failed = True
+        return Error("ERR WATCH inside MULTI is not allowed")
+    for arg in command[1:]:
+        # Watching a key again keeps the version it was first watched at
+        if arg.data not in transaction.watched:
+            transaction.watched[arg.data] = datastore.version(arg.data)
+    return OK
+
+
+def _handle_unwatch(command, datastore, persister, transaction):
+    transaction.watched = {}
+    return OK
+
+
+class _FunctionCall:
+    """
+    The redis object a function is called with. call() runs a command the
+    way EXEC runs a queued one and returns its reply as Python values.
+    """
+
+    __slots__ = ("_function", "_datastore", "_persister", "_allowed", "_logged")
+
+    def __init__(self, function, datastore, persister, allowed):
+        self._function = function
+        self._datastore = datastore
+        self._persister = persister
+        self._allowed = allowed
+        self._logged = []
+
+    def call(self, *args):
+        if not args:
+            raise FunctionError(
+                "ERR Please specify at least one argument for this redis lib call"
+            )
+        command = Array([to_argument(arg) for arg in args])
+        spec = lookup_command(command[0].data)
+        if spec is None:
+            raise FunctionError("ERR Unknown Redis command called from script")
+        if _wrong_arity(spec, command):
+            raise FunctionError(
+                f"ERR wrong number of arguments for '{spec.name}' command"
+            )
+        if "noscript" in spec.flags:
+            raise FunctionError("ERR This Redis command is not allowed from script")
+        if spec.write and self._function.read_only:
+            raise FunctionError(
+                "ERR Write commands are not allowed from read-only scripts"
+            )
+        return to_python(
+            _run_in_block(
+                spec,
+                command,
+                self._datastore,
+                self._persister,
+                self._allowed,
+                self._logged,
+            )
+        )
+
+
+def _fcall(command, datastore, persister, read_only):
+    function = FUNCTIONS.get(command[1].data)
+    if function is None:
+        return Error("ERR Function not found")
+    if read_only and not function.read_only:
+        return Error("ERR Can not execute a script with write flag using *_ro command.")
+    try:
+        numkeys = parse_int(command[2].data)
+    except ValueError:
+        return _NOT_AN_INTEGER
+    if numkeys < 0:
+        return Error("ERR Number of keys can't be negative")
+    if numkeys > len(command) - 3:
+        return Error("ERR Number of keys can't be greater than number of args")
+    keys = [arg.data for arg in command[3 : 3 + numkeys]]
+    args = [arg.data for arg in command[3 + numkeys :]]
+
+    allowed = function.read_only or _evict(datastore, persister)
+    call = _FunctionCall(function, datastore, persister, allowed)
+    # The function can reach any key, so it runs with the whole store locked
+    with datastore.lock_all():
+        try:
+            reply = to_reply(function.callback(call, keys, args))
+        except FunctionError as e:
+            reply = Error(str(e))
+        except Exception as e:
+            reply = Error(f"ERR Error running function '{function.name}': {e!r}")
+    return _Effects(reply, call._logged)
+
+
+def _handle_fcall(command, datastore, persister):
+    return _fcall(command, datastore, persister, False)
+
+
+def _handle_fcall_ro(command, datastore, persister):
+    result = _fcall(command, datastore, persister, True)
+    return result.reply if isinstance(result, _Effects) else result
+
+
+def _handle_function(command, datastore, persister):
+    match command[1].data.upper():
+        case b"LIST":
+            libraries = []
+            for library, names in LIBRARIES.items():
+                functions = []
+                for name in names:
+                    function = FUNCTIONS[name.encode()]
+                    flags = ["no-writes"] if function.read_only else []
+                    functions.append(
+                        Array(
+                            [
+                                BulkString(b"name"),
+                                BulkString(name.encode()),
+                                BulkString(b"flags"),
+                                Array([SimpleString(flag) for flag in flags]),
+                            ]
+                        )
+                    )
+                libraries.append(
+                    Array(
+                        [
+                            BulkString(b"library_name"),
+                            BulkString(library.encode()),
+                            BulkString(b"functions"),
+                            Array(functions),
+                        ]
+                    )
+                )
+            return Array(libraries)
+    return Error(
+        f"ERR unknown subcommand '{_text(command[1].data)}'. Try FUNCTION HELP."
+    )
 
 
 def _handle_unrecognised_command(command, *args):
-    args = " ".join((f"'{c.data.decode()}'" for c in command[1:]))
+    args = " ".join((f"'{_text(c.data)}'" for c in command[1:]))
     return Error(
-        f"ERR unknown command '{command[0].data.decode()}', with args beginning with: {args}"
+        f"ERR unknown command '{_text(command[0].data)}', with args beginning with: {args}"
     )
 
 
-def handle_command(command, datastore, persister):
-    match command[0].data.decode().upper():
-        case "ECHO":
-            return _handle_echo(command)
-
-        case "PING":
-            return _handle_ping(command)
-
-        case "SET":
-            return _handle_set(command, datastore, persister)
-        case "GET":
-            return _handle_get(command, datastore)
-        case "EXISTS":
-            return _handle_exists(command, datastore)
-        case "DEL":
-            return _handle_del(command, datastore, persister)
-        case "INCR":
-            return _handle_incr(command, datastore, persister)
-        case "DECR":
-            return _handle_decr(command, datastore, persister)
-        case "LPUSH":
-            return _handle_lpush(command, datastore, persister)
-        case "RPUSH":
-            return _handle_rpush(command, datastore, persister)
-        case "LRANGE":
-            return _handle_lrange(command, datastore)
-    return _handle_unrecognised_command(command)
+_COMMAND_SPECS = (
+    CommandSpec("echo", _handle_echo, 2, ("fast",)),
+    CommandSpec("ping", _handle_ping, -1, ("fast",)),
+    CommandSpec("set", _handle_set, -3, ("write", "denyoom"), 1, 1, 1),
+    CommandSpec("get", _handle_get, 2, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("mget", _handle_mget, -2, ("readonly", "fast"), 1, -1, 1),
+    CommandSpec("mset", _handle_mset, -3, ("write", "denyoom"), 1, -1, 2),
+    CommandSpec("msetnx", _handle_msetnx, -3, ("write", "denyoom"), 1, -1, 2),
+    CommandSpec("exists", _handle_exists, -2, ("readonly", "fast"), 1, -1, 1),
+    CommandSpec("del", _handle_del, -2, ("write",), 1, -1, 1),
+    CommandSpec("incr", _handle_incr, 2, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("decr", _handle_decr, 2, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("incrby", _handle_incrby, 3, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("decrby", _handle_decrby, 3, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec(
+        "incrbyfloat", _handle_incrbyfloat, 3, ("write", "denyoom", "fast"), 1, 1, 1
+    ),
+    CommandSpec("getset", _handle_getset, 3, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("lpush", _handle_lpush, -3, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("rpush", _handle_rpush, -3, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("lrange", _handle_lrange, 4, ("readonly",), 1, 1, 1),
+    CommandSpec("llen", _handle_llen, 2, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("lindex", _handle_lindex, 3, ("readonly",), 1, 1, 1),
+    CommandSpec("lset", _handle_lset, 4, ("write", "denyoom"), 1, 1, 1),
+    CommandSpec("lpop", _handle_lpop, -2, ("write", "fast"), 1, 1, 1),
+    CommandSpec("rpop", _handle_rpop, -2, ("write", "fast"), 1, 1, 1),
+    CommandSpec("ltrim", _handle_ltrim, 4, ("write",), 1, 1, 1),
+    CommandSpec("blpop", _handle_blpop, -3, ("write", "blocking"), 1, -2, 1),
+    CommandSpec("brpop", _handle_brpop, -3, ("write", "blocking"), 1, -2, 1),
+    CommandSpec("lmove", _handle_lmove, 5, ("write", "denyoom"), 1, 2, 1),
+    CommandSpec("blmove", _handle_blmove, 6, ("write", "denyoom", "blocking"), 1, 2, 1),
+    CommandSpec("hset", _handle_hset, -4, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("hget", _handle_hget, 3, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("hmget", _handle_hmget, -3, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("hgetall", _handle_hgetall, 2, ("readonly",), 1, 1, 1),
+    CommandSpec("hdel", _handle_hdel, -3, ("write", "fast"), 1, 1, 1),
+    CommandSpec("hlen", _handle_hlen, 2, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("hincrby", _handle_hincrby, 4, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("hscan", _handle_hscan, -3, ("readonly",), 1, 1, 1),
+    CommandSpec("sscan", _handle_sscan, -3, ("readonly",), 1, 1, 1),
+    CommandSpec("scan", _handle_scan, -2, ("readonly",)),
+    CommandSpec("keys", _handle_keys, 2, ("readonly",)),
+    CommandSpec("type", _handle_type, 2, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("sadd", _handle_sadd, -3, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("srem", _handle_srem, -3, ("write", "fast"), 1, 1, 1),
+    CommandSpec("sismember", _handle_sismember, 3, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("smembers", _handle_smembers, 2, ("readonly",), 1, 1, 1),
+    CommandSpec("scard", _handle_scard, 2, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("sinter", _handle_sinter, -2, ("readonly",), 1, -1, 1),
+    CommandSpec("sunion", _handle_sunion, -2, ("readonly",), 1, -1, 1),
+    CommandSpec("sdiff", _handle_sdiff, -2, ("readonly",), 1, -1, 1),
+    CommandSpec("sinterstore", _handle_sinterstore, -3, ("write", "denyoom"), 1, -1, 1),
+    CommandSpec("zadd", _handle_zadd, -4, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("zincrby", _handle_zincrby, 4, ("write", "denyoom", "fast"), 1, 1, 1),
+    CommandSpec("zrem", _handle_zrem, -3, ("write", "fast"), 1, 1, 1),
+    CommandSpec("zscore", _handle_zscore, 3, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("zcard", _handle_zcard, 2, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("zrank", _handle_zrank, 3, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("zcount", _handle_zcount, 4, ("readonly", "fast"), 1, 1, 1),
+    CommandSpec("zrange", _handle_zrange, -4, ("readonly",), 1, 1, 1),
+    CommandSpec("zpopmin", _handle_zpopmin, -2, ("write", "fast"), 1, 1, 1),
+    CommandSpec("zpopmax", _handle_zpopmax, -2, ("write", "fast"), 1, 1, 1),
+    CommandSpec("multi", _handle_multi, 1, ("noscript", "loading", "stale", "fast")),
+    CommandSpec("exec", _handle_exec, 1, ("noscript", "loading", "stale")),
+    CommandSpec(
+        "discard", _handle_discard, 1, ("noscript", "loading", "stale", "fast")
+    ),
+    CommandSpec(
+        "watch", _handle_watch, -2, ("noscript", "loading", "stale", "fast"), 1, -1, 1
+    ),
+    CommandSpec(
+        "unwatch", _handle_unwatch, 1, ("noscript", "loading", "stale", "fast")
+    ),
+    CommandSpec("fcall", _handle_fcall, -3, ("write", "noscript")),
+    CommandSpec("fcall_ro", _handle_fcall_ro, -3, ("readonly", "noscript")),
+    CommandSpec("function", _handle_function, -2, ("noscript",)),
+    CommandSpec("bgrewriteaof", _handle_bgrewriteaof, 1, ("admin", "noscript")),
+    CommandSpec("save", _handle_save, 1, ("admin", "noscript")),
+    CommandSpec("bgsave", _handle_bgsave, 1, ("admin", "noscript")),
+    CommandSpec("memory", _handle_memory, -2, ("readonly",)),
+    CommandSpec("info", _handle_info, -1, ("loading", "stale")),
+    CommandSpec("command", _handle_command, -1, ("loading", "stale")),
+)
+
+# Command names arrive as raw bytes; both common spellings are indexed so
+# that almost every lookup is a single dict hit without case folding.
+COMMANDS = {}
+for _spec in _COMMAND_SPECS:
+    COMMANDS[_spec.name.encode()] = _spec
+    COMMANDS[_spec.name.upper().encode()] = _spec
+del _spec
+
+
+def lookup_command(name):
+    spec = COMMANDS.get(name)
+    if spec is None:
+        spec = COMMANDS.get(name.upper())
+    return spec
+
+
+# Commands acting on the connection's Transaction, which they are given
+_TRANSACTION_COMMANDS = {"multi", "exec", "discard", "watch", "unwatch"}
+
+
+def _wrong_arity(spec, command):
+    arity = spec.arity
+    return (arity > 0 and len(command) != arity) or len(command) < -arity
+
+
+def _reject(transaction, error):
+    # A command rejected inside MULTI makes the EXEC fail
+    if transaction is not None and transaction.queued is not None:
+        transaction.failed = True
+    return error
+
+
+def load_command(command, datastore):
+    """
+    Apply a command read back from the AOF. Loading never evicts or rejects
+    a write for the memory limit, see evict_after_load, and logs nothing.
+    """
+    spec = lookup_command(command[0].data)
+    if spec is None:
+        return _handle_unrecognised_command(command)
+    if _wrong_arity(spec, command):
+        return Error(f"ERR wrong number of arguments for '{spec.name}' command")
+    with datastore.lock_keys(spec.keys(command)):
+        return spec.handler(command, datastore, None)
+
+
+def evict_after_load(datastore, persister):
+    """Evict down to maxmemory once the store is loaded."""
+    evictor = datastore.evictor
+    while evictor is not None and datastore.used_memory() > evictor.maxmemory:
+        if not _evict(datastore, persister):
+            break
+
+
+def handle_command(command, datastore, persister, transaction=None):
+    """
+    Run command and return its reply. transaction is the MULTI/EXEC state of
+    the client connection; without one, MULTI has nothing to queue into.
+    """
+    spec = lookup_command(command[0].data)
+    if spec is None:
+        return _reject(transaction, _handle_unrecognised_command(command))
+
+    if _wrong_arity(spec, command):
+        return _reject(
+            transaction,
+            Error(f"ERR wrong number of arguments for '{spec.name}' command"),
+        )
+
+    if spec.name in _TRANSACTION_COMMANDS:
+        if transaction is None:
+            transaction = Transaction()
+        return spec.handler(command, datastore, persister, transaction)
+    if transaction is not None and transaction.queued is not None:
+        transaction.queued.append((spec, command))
+        return QUEUED
+
+    if not spec.write:
+        return spec.handler(command, datastore, persister)
+
+    if not _evict(datastore, persister) and spec.denyoom:
+        return _OOM
+
+    # The keys stay locked until the command is logged, so the AOF records
+    # writes to a key in the order they were applied.
+    keys = spec.keys(command)
+    with datastore.lock_keys(keys):
+        result, logged = _execute(spec, command, datastore, persister, keys)
+        if persister and logged:
+            _log_block(persister, logged)
+    return result
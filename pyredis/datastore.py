@@ -1,44 +1,413 @@
-from threading import Lock
+from itertools import count
+from threading import Lock, RLock
 from dataclasses import dataclass
 from typing import Any
-from time import time
-from itertools import islice
-from collections import deque
+from time import perf_counter, time
+from sys import getsizeof
 
+import math
 import random
 import logging
 
+from pyredis.blocking import BlockedKeys
+from pyredis.encoding import INT_MAX, INT_MIN, encode_value, parse_float, parse_int
+from pyredis.eviction import (
+    EVICTION_TIME_LIMIT,
+    MAXMEMORY_ALLKEYS_RANDOM,
+    MAXMEMORY_NOEVICTION,
+    MAXMEMORY_SAMPLES,
+    MAXMEMORY_VOLATILE_RANDOM,
+    Evictor,
+)
+from pyredis.expiry import ExpiryHeap
+from pyredis.hashes import Hash
+from pyredis.quicklist import QuickList
+from pyredis.sets import Set
+from pyredis.sortedsets import SortedSet
+
 
 EXPIRY_TEST_SAMPLE_SIZE = 20
+# Upper bound on the time one active expiry cycle may spend, in seconds.
+EXPIRY_CYCLE_TIME_LIMIT = 0.025
 log = logging.getLogger("pyredis")
 
 
-@dataclass
+class _MultiLock:
+    """
+    Holds several shard locks at once. The locks are always taken in shard
+    order so that concurrent multi-key operations cannot deadlock.
+    """
+
+    def __init__(self, locks):
+        self._locks = locks
+
+    def __enter__(self):
+        for lock in self._locks:
+            lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        for lock in reversed(self._locks):
+            lock.release()
+
+
+class VolatileKeys:
+    """
+    Index of the keys carrying a TTL. Keys live in a list with a map from key
+    to list position, so adding, removing and sampling a key are all O(1).
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._positions = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def add(self, key):
+        with self._lock:
+            if key not in self._positions:
+                self._positions[key] = len(self._keys)
+                self._keys.append(key)
+
+    def discard(self, key):
+        with self._lock:
+            position = self._positions.pop(key, None)
+            if position is None:
+                return
+            # Fill the hole with the last key to keep the list dense.
+            last = self._keys.pop()
+            if position < len(self._keys):
+                self._keys[position] = last
+                self._positions[last] = position
+
+    def keys(self):
+        with self._lock:
+            return list(self._keys)
+
+    def sample(self, count):
+        with self._lock:
+            return random.sample(self._keys, min(count, len(self._keys)))
+
+
+@dataclass(slots=True)
 class DataEntry:
     """Class to represent a data entry. Contains the data and the expiry in milisecond."""
 
     value: Any
     expiry: int = 0
+    # LRU clock or LFU counter, only kept up to date under a maxmemory policy
+    access: int = 0
+    # Slot of the key in Keyspace's array
+    position: int = 0
+    # Set when the key is stored and bumped by every command writing it, see WATCH
+    version: int = 0
+
+
+class Keyspace:
+    """
+    The keyspace dict plus, for each shard, an array of the shard's keys,
+    each entry knowing its key's slot, so keys are sampled and scanned
+    without a copy of the dict. Every insertion and removal goes through
+    here, with the key's shard lock held by the caller, so writers to
+    different shards never contend.
+
+    A removed key's slot is filled with the last key of its shard, and
+    scan() walks the shards in order and each array down from the end. A
+    key therefore only ever moves to a slot the scan has not reached yet,
+    so every key present for the whole scan is returned, some maybe twice.
+    """
+
+    def __init__(self, data, locks):
+        self._data = data
+        self._locks = locks
+        self._shards = len(locks)
+        self._keys = [[] for _ in locks]
+
+    def __len__(self):
+        return sum(map(len, self._keys))
+
+    def _shard_keys(self, key):
+        if self._shards == 1:
+            return self._keys[0]
+        return self._keys[hash(key) % self._shards]
+
+    def set(self, key, entry):
+        """Store entry at key. Returns the entry it replaced, or None."""
+        old = self._data.get(key)
+        if old is None:
+            keys = self._shard_keys(key)
+            entry.position = len(keys)
+            keys.append(key)
+        else:
+            entry.position = old.position
+        self._data[key] = entry
+        return old
+
+    def pop(self, key):
+        """Remove key. Returns its entry, or None if it was not there."""
+        item = self._data.pop(key, None)
+        if item is None:
+            return None
+        keys = self._shard_keys(key)
+        last = keys.pop()
+        if item.position < len(keys):
+            keys[item.position] = last
+            self._data[last].position = item.position
+        return item
+
+    def load(self, entries):
+        """
+        Fill the empty keyspace from (key, entry) pairs with distinct keys,
+        without a lock: nothing else can reach the store while it loads.
+        """
+        data = self._data
+        data.update(entries)
+        if self._shards == 1:
+            self._keys[0] = list(data)
+            for position, entry in enumerate(data.values()):
+                entry.position = position
+            return
+        shards = self._shards
+        arrays = self._keys
+        for key, entry in data.items():
+            keys = arrays[hash(key) % shards]
+            entry.position = len(keys)
+            keys.append(key)
+
+    def sample(self, count):
+        """
+        count keys picked at random, with repetition. The caller holds every
+        shard lock.
+        """
+        if self._shards == 1:
+            keys = self._keys[0]
+            return random.choices(keys, k=count) if keys else []
+        sizes = [len(keys) for keys in self._keys]
+        if not any(sizes):
+            return []
+        shards = random.choices(self._keys, weights=sizes, k=count)
+        return [random.choice(keys) for keys in shards]
+
+    def scan(self, cursor, count):
+        """
+        The next cursor, 0 once the walk is over, and the batch of up to
+        count keys from the shard and below the slot encoded in cursor, as
+        slot * shards + shard, slot 0 meaning the top of the shard. Cursor 0
+        starts a new walk.
+        """
+        slot, shard = divmod(cursor, self._shards)
+        with self._locks[shard]:
+            keys = self._keys[shard]
+            stop = len(keys)
+            if slot:
+                stop = min(slot, stop)
+            start = max(stop - count, 0)
+            batch = keys[start:stop]
+        if start:
+            return start * self._shards + shard, batch
+        # This shard is done; the next starts at its top
+        shard += 1
+        return (0 if shard == self._shards else shard), batch
+
+
+# Rough per-key cost of the keyspace dict slot and array slot plus the DataEntry.
+_KEY_OVERHEAD = 56 + getsizeof(DataEntry(None))
+
+
+def _format_float(value):
+    """Format like INCRBYFLOAT: no exponent and no trailing zeros."""
+    text = repr(value)
+    if "e" in text:
+        text = ("%.17f" % value).rstrip("0").rstrip(".")
+    elif text.endswith(".0"):
+        text = text[:-2]
+    return text.encode()
+
+
+# Value types other than strings, which all provide copy() and memory_usage()
+COLLECTION_TYPES = (QuickList, Hash, Set, SortedSet)
+# Names of the value types, as TYPE and SCAN's TYPE option spell them
+_TYPE_NAMES = {QuickList: "list", Hash: "hash", Set: "set", SortedSet: "zset"}
+
+
+def type_name(value):
+    return _TYPE_NAMES.get(type(value), "string")
+
+
+def _value_size(value):
+    """Estimated bytes used by a value."""
+    if isinstance(value, COLLECTION_TYPES):
+        return value.memory_usage()
+    return getsizeof(value)
+
+
+def _entry_size(key, value):
+    return _KEY_OVERHEAD + getsizeof(key) + _value_size(value)
+
+
+def _list_range(length, start, stop):
+    """
+    Convert LRANGE/LTRIM style inclusive indexes, negative ones counting from
+    the tail, into a [start, stop) range clamped to the list.
+    """
+    if start < 0:
+        start = max(start + length, 0)
+    if stop < 0:
+        stop += length
+    stop = min(stop + 1, length)
+    if start >= stop:
+        return 0, 0
+    return start, stop
+
+
+def _limit(start, stop, offset, count, reverse):
+    """Apply a LIMIT offset and count to the ranks [start, stop)."""
+    if offset < 0:
+        return 0, 0
+    if reverse:
+        stop -= offset
+        if count >= 0:
+            start = max(start, stop - count)
+    else:
+        start += offset
+        if count >= 0:
+            stop = min(stop, start + count)
+    return start, stop
+
+
+def _copy_value(value):
+    if isinstance(value, COLLECTION_TYPES):
+        return value.copy()
+    return value
 
 
 class DataStore:
     """
     The core data store, provides a thread safe dictionary extended with
     the interface needed to support Redis functionality.
+
+    Keys are hashed onto `shards` lock stripes so that threads working on
+    different keys do not serialise on one lock. `_lock` holds every stripe
+    and is used by operations spanning the whole keyspace.
+
+    With `precise_expiry` the keys carrying a TTL are also kept in a heap
+    ordered by deadline, and remove_due_keys() deletes exactly the keys that
+    are due instead of relying on random sampling.
+
+    With a non zero `maxmemory`, evict() removes keys chosen by
+    `maxmemory_policy` whenever the estimated memory use is over the limit.
+
+    Clients blocked on a list by BLPOP and friends wait in `blocked_keys`,
+    and every push to a key wakes one of them.
     """
 
-    def __init__(self, initial_data=None):
-        self._data: dict[str, DataEntry] = dict()
-        self._lock = Lock()
+    def __init__(
+        self,
+        initial_data=None,
+        shards=1,
+        precise_expiry=False,
+        maxmemory=0,
+        maxmemory_policy=MAXMEMORY_NOEVICTION,
+        maxmemory_samples=MAXMEMORY_SAMPLES,
+    ):
+        if shards < 1:
+            raise ValueError("DataStore needs at least one shard")
+        self._data: dict[bytes, DataEntry] = dict()
+        self._volatile = VolatileKeys()
+        self._expiry_heap = ExpiryHeap() if precise_expiry else None
+        self._shards = shards
+        # Estimated bytes used by the keys of each shard, only changed under
+        # that shard's lock.
+        self._memory = [0] * shards
+        self.evictor = None
+        if maxmemory:
+            self.evictor = Evictor(maxmemory, maxmemory_policy, maxmemory_samples)
+        self.blocked_keys = BlockedKeys()
+        # Versions handed out to written keys; never reused, so a key that
+        # is deleted and created again does not get an old version back.
+        self._versions = count(1)
+        # Version of the last removal from each shard, which a missing key
+        # reports, so WATCH sees a key created and deleted again.
+        self._removed = [0] * shards
+        self._locks = tuple(RLock() for _ in range(shards))
+        self._keyspace = Keyspace(self._data, self._locks)
+        if shards == 1:
+            self._lock = self._locks[0]
+        else:
+            self._lock = _MultiLock(self._locks)
         if initial_data:
             if not isinstance(initial_data, dict):
                 raise TypeError("Initial Data should be of type dict")
 
             for key, value in initial_data.items():
-                self._data[key] = DataEntry(value)
+                self._replace(key, DataEntry(value))
+
+    def _lock_for(self, key):
+        if self._shards == 1:
+            return self._lock
+        return self._locks[hash(key) % self._shards]
+
+    def _account(self, key, delta):
+        if self._shards == 1:
+            self._memory[0] += delta
+        else:
+            self._memory[hash(key) % self._shards] += delta
+
+    def _replace(self, key, entry):
+        """Store entry at key under the key's lock. Returns the old entry."""
+        entry.version = next(self._versions)
+        old = self._keyspace.set(key, entry)
+        if old is None:
+            self._account(key, _entry_size(key, entry.value))
+            if self.evictor is not None:
+                self.evictor.init_access(entry)
+        else:
+            self._account(key, _value_size(entry.value) - _value_size(old.value))
+            if self.evictor is not None:
+                entry.access = old.access
+                self.evictor.touch(entry)
+        return old
+
+    def _remove(self, key):
+        """Remove key under its lock. Returns its entry, or None."""
+        item = self._keyspace.pop(key)
+        if item is not None:
+            self._removed[hash(key) % self._shards] = next(self._versions)
+            self._account(key, -_entry_size(key, item.value))
+            if item.expiry:
+                self._volatile.discard(key)
+        return item
+
+    def used_memory(self):
+        """Estimated bytes used by the keyspace, kept up to date on every write."""
+        return sum(self._memory)
+
+    def memory_usage(self, key):
+        """Estimated bytes used by key and its value, or None if it does not exist."""
+        with self._lock_for(key):
+            item = self._data.get(key)
+            if item is None or self.check_expiry(key, item):
+                return None
+            return _KEY_OVERHEAD + getsizeof(key) + _value_size(item.value)
+
+    def lock_keys(self, keys):
+        """Lock the shards owning keys, in shard order."""
+        if self._shards == 1:
+            return self._lock
+        shards = sorted({hash(key) % self._shards for key in keys})
+        return _MultiLock([self._locks[shard] for shard in shards])
+
+    def lock_all(self):
+        """Lock every shard, in shard order."""
+        return self._lock
 
     def __getitem__(self, key):
-        with self._lock:
+        with self._lock_for(key):
             log.info("Try to get key %s", key)
             item = self._data[key]
             log.info("key exist %s, checking expiry", key)
@@ -46,90 +415,854 @@ class DataStore:
             if self.check_expiry(key, item):
                 raise KeyError  # catched in _handle_get
 
+            if self.evictor is not None:
+                self.evictor.touch(item)
             return item.value
 
     def __setitem__(self, key, value):
-        with self._lock:
-            self._data[key] = DataEntry(value)
+        with self._lock_for(key):
+            old = self._replace(key, DataEntry(encode_value(value)))
+            if old is not None and old.expiry:
+                self._volatile.discard(key)
 
     def __contains__(self, key):
-        with self._lock:
+        with self._lock_for(key):
             return key in self._data
 
-    def incr(self, key):
-        with self._lock:
-            item = self._data.get(key, DataEntry(0))
-            try:
-                value = int(item.value) + 1
-            except ValueError:
-                raise TypeError
-            item.value = str(value)
-            self._data[key] = item
+    def exists(self, keys):
+        found = 0
+        with self.lock_keys(keys):
+            for key in keys:
+                item = self._data.get(key)
+                if item is not None and not self.check_expiry(key, item):
+                    found += 1
+        return found
+
+    def delete(self, keys):
+        found = 0
+        with self.lock_keys(keys):
+            for key in keys:
+                item = self._remove(key)
+                if item is None:
+                    continue
+                if item.expiry and item.expiry < int(time() * 1000):
+                    continue
+                found += 1
+        return found
+
+    def incr_by(self, key, amount):
+        """
+        Add amount to the integer at key, keeping its TTL. Raises TypeError
+        if the value is not an integer and OverflowError if the result does
+        not fit in 64 bits.
+        """
+        with self._lock_for(key):
+            item = self._data.get(key)
+            if item is None or self.check_expiry(key, item):
+                item = DataEntry(0)
+                self._replace(key, item)
+            elif self.evictor is not None:
+                self.evictor.touch(item)
+            old = value = item.value
+            if type(value) is not int:
+                try:
+                    value = parse_int(value)
+                except (TypeError, ValueError):
+                    raise TypeError
+            value += amount
+            if not INT_MIN <= value <= INT_MAX:
+                raise OverflowError
+            item.value = value
+            self._account(key, getsizeof(value) - getsizeof(old))
         return value
 
+    def incr(self, key):
+        return self.incr_by(key, 1)
+
     def decr(self, key):
-        with self._lock:
+        return self.incr_by(key, -1)
+
+    def incr_by_float(self, key, amount):
+        """
+        Add the float amount to the number at key, keeping its TTL. Returns
+        the new value as bytes. Raises TypeError if the value is not a
+        number and OverflowError if the result is not finite.
+        """
+        with self._lock_for(key):
+            item = self._data.get(key)
+            if item is None or self.check_expiry(key, item):
+                item = DataEntry(0)
+                self._replace(key, item)
+            elif self.evictor is not None:
+                self.evictor.touch(item)
+            old = item.value
             try:
-                value = int(self._data.get(key, DataEntry(0)).value) - 1
-            except ValueError:
+                value = float(old) if type(old) is int else parse_float(old)
+            except (TypeError, ValueError):
                 raise TypeError
-            self._data[key].value = str(value)
-        return value
+            value += amount
+            if not math.isfinite(value):
+                raise OverflowError
+            encoded = _format_float(value)
+            item.value = encode_value(encoded)
+            self._account(key, getsizeof(item.value) - getsizeof(old))
+        return encoded
+
+    def getset(self, key, value):
+        """Set key to value, dropping its TTL, and return the old value or None."""
+        with self._lock_for(key):
+            old = self._data.get(key)
+            if old is not None:
+                if isinstance(old.value, COLLECTION_TYPES):
+                    raise TypeError
+                if old.expiry and self.check_expiry(key, old):
+                    old = None
+                elif old.expiry:
+                    self._volatile.discard(key)
+            self._replace(key, DataEntry(encode_value(value)))
+        return None if old is None else old.value
+
+    def mget(self, keys):
+        """The values at keys, None for a missing key or one holding a collection."""
+        values = []
+        with self.lock_keys(keys):
+            data = self._data
+            evictor = self.evictor
+            for key in keys:
+                item = data.get(key)
+                if item is None or (item.expiry and self.check_expiry(key, item)):
+                    values.append(None)
+                elif isinstance(item.value, COLLECTION_TYPES):
+                    values.append(None)
+                else:
+                    if evictor is not None:
+                        evictor.touch(item)
+                    values.append(item.value)
+        return values
+
+    def mset(self, pairs):
+        """Set each (key, value) pair, dropping any TTL, all under one lock."""
+        with self.lock_keys([key for key, _ in pairs]):
+            for key, value in pairs:
+                old = self._replace(key, DataEntry(encode_value(value)))
+                if old is not None and old.expiry:
+                    self._volatile.discard(key)
+
+    def msetnx(self, pairs):
+        """Set the pairs only if none of their keys exists. Returns True if set."""
+        keys = [key for key, _ in pairs]
+        with self.lock_keys(keys):
+            if self.exists(keys):
+                return False
+            self.mset(pairs)
+            return True
 
     def set_with_expiry(self, key, value, expiry: int):
-        with self._lock:
-            calculated_expiry = int(time() * 1000) + expiry  # in miliseconds
-            self._data[key] = DataEntry(value, calculated_expiry)
+        calculated_expiry = int(time() * 1000) + expiry  # in miliseconds
+        self.set_with_expiry_at(key, value, calculated_expiry)
+        return calculated_expiry
+
+    def set_with_expiry_at(self, key, value, deadline: int):
+        """Set key to expire at the unix time deadline, in milliseconds."""
+        with self._lock_for(key):
+            self._replace(key, DataEntry(encode_value(value), deadline))
+            self._volatile.add(key)
+            if self._expiry_heap is not None:
+                self._expiry_heap.push(deadline, key)
 
-    def check_expiry(self, key: str, value: DataEntry) -> bool:
+    def check_expiry(self, key: bytes, value: DataEntry) -> bool:
         # if key expired then delete
         if value.expiry and value.expiry < int(time() * 1000):
             log.info("%s key expired", key)
-            del self._data[key]
+            self._remove(key)
             return True
         else:
             return False
 
     def remove_expired_keys(self):
-        expired_count = 0
+        """
+        Active expiry cycle: test a random sample of the keys carrying a TTL
+        and go again while more than 25% of the sample had expired, within a
+        time budget of EXPIRY_CYCLE_TIME_LIMIT. The lock is released between
+        samples. Returns the number of keys removed.
+        """
+        deadline = perf_counter() + EXPIRY_CYCLE_TIME_LIMIT
+        removed = 0
+        while True:
+            expired_count = 0
+            with self._lock:
+                keys = self._volatile.sample(EXPIRY_TEST_SAMPLE_SIZE)
+                for key in keys:
+                    item = self._data.get(key)
+                    if item is not None and self.check_expiry(key, item):
+                        expired_count += 1
+            removed += expired_count
+
+            if expired_count <= len(keys) * 0.25 or perf_counter() > deadline:
+                return removed
+
+    def snapshot(self):
+        """
+        Point in time copy of the keyspace as (key, value, expiry) tuples,
+        taken under the store lock. Mutable values are copied so that later
+        writes do not leak into the copy. Keys already expired are left out.
+        """
+        now = int(time() * 1000)
         with self._lock:
-            keys = random.sample(
-                sorted(self._data), min(EXPIRY_TEST_SAMPLE_SIZE, len(self._data))
-            )
+            return [
+                (key, _copy_value(item.value), item.expiry)
+                for key, item in self._data.items()
+                if not item.expiry or item.expiry >= now
+            ]
 
-            for key in keys:
-                if self.check_expiry(key, self._data[key]):
-                    expired_count += 1
-        # after release lock
-        # if more than
-        if expired_count > EXPIRY_TEST_SAMPLE_SIZE * 0.25:
-            self.remove_expired_keys()
+    def load_entries(self, entries):
+        """
+        Bulk insert (key, DataEntry) pairs with distinct keys, as read from a
+        snapshot at startup. An empty store is built in one pass without
+        per key locking: nothing else can reach it yet.
+        """
+        with self._lock:
+            if self._data:
+                for key, entry in entries:
+                    self._replace(key, entry)
+                    if entry.expiry:
+                        self._volatile.add(key)
+                        if self._expiry_heap is not None:
+                            self._expiry_heap.push(entry.expiry, key)
+                return
 
-    def append(self, key, value):
+            self._keyspace.load(entries)
+            shards = self._shards
+            memory = self._memory
+            volatile = []
+            for key, entry in entries:
+                value = entry.value
+                if isinstance(value, COLLECTION_TYPES):
+                    size = value.memory_usage()
+                else:
+                    size = getsizeof(value)
+                size += _KEY_OVERHEAD + getsizeof(key)
+                if shards == 1:
+                    memory[0] += size
+                else:
+                    memory[hash(key) % shards] += size
+                if entry.expiry:
+                    volatile.append((entry.expiry, key))
+                entry.version = next(self._versions)
+            if self.evictor is not None:
+                for _, entry in entries:
+                    self.evictor.init_access(entry)
+            for _, key in volatile:
+                self._volatile.add(key)
+            if self._expiry_heap is not None and volatile:
+                self._expiry_heap.rebuild(volatile)
+
+    def set_expiry_listener(self, listener):
+        """Register a callback told about each new earliest expiry deadline."""
+        if self._expiry_heap is None:
+            raise ValueError("DataStore was created without precise_expiry")
+        self._expiry_heap.listener = listener
+
+    def remove_due_keys(self):
+        """
+        Delete the keys whose deadline has passed, at most EXPIRY_BATCH_SIZE
+        per call. Returns the next deadline in milliseconds, or None.
+        """
+        heap = self._expiry_heap
         with self._lock:
-            item = self._data.get(key, DataEntry(deque()))
-            if not isinstance(item.value, deque):
-                raise TypeError
-            item.value.append(value)
-            self._data[key] = item
-            return len(item.value)
+            for deadline, key in heap.pop_due(int(time() * 1000)):
+                item = self._data.get(key)
+                # Skip entries left behind by keys overwritten or deleted since
+                if item is not None and item.expiry == deadline:
+                    self.check_expiry(key, item)
 
-    def lrange(self, key, start, stop):
+            if len(heap) > 2 * len(self._volatile) + 64:
+                heap.rebuild(
+                    (self._data[key].expiry, key) for key in self._volatile.keys()
+                )
+        return heap.next_deadline()
+
+    def version(self, key):
+        """
+        Version of the value at key. A missing key has the version of the
+        last removal from its shard, so deleting any key of the shard
+        changes it.
+        """
+        with self._lock_for(key):
+            item = self._data.get(key)
+            if item is None or self.check_expiry(key, item):
+                return self._removed[hash(key) % self._shards]
+            return item.version
+
+    def mark_modified(self, keys):
+        """Give the keys a new version, as the dispatcher does after a write."""
+        data = self._data
+        for key in keys:
+            item = data.get(key)
+            if item is not None:
+                item.version = next(self._versions)
+
+    def type(self, key):
+        """Name of the type of the value at key, or "none"."""
+        with self._lock_for(key):
+            item = self._data.get(key)
+            if item is None or self.check_expiry(key, item):
+                return "none"
+            return type_name(item.value)
+
+    def scan(self, cursor, count, kind=None):
+        """
+        The next cursor and the live keys among the next count, as SCAN;
+        only those holding a kind value, a type name, if given. No lock is
+        held for longer than one batch.
+        """
+        cursor, batch = self._keyspace.scan(cursor, count)
+        keys = []
+        with self.lock_keys(batch):
+            for key in batch:
+                item = self._data.get(key)
+                if item is None or (item.expiry and self.check_expiry(key, item)):
+                    continue
+                if kind is None or type_name(item.value) == kind:
+                    keys.append(key)
+        return cursor, keys
+
+    def _collection_for_write(self, key, kind):
+        """The kind value at key, created if missing; TypeError for other types."""
+        item = self._data.get(key)
+        if item is None or self.check_expiry(key, item):
+            item = DataEntry(kind())
+            self._replace(key, item)
+        elif type(item.value) is not kind:
+            raise TypeError
+        elif self.evictor is not None:
+            self.evictor.touch(item)
+        return item.value
+
+    def _collection(self, key, kind):
+        """The kind value at key, or None if there is none; TypeError for other types."""
+        item = self._data.get(key)
+        if item is None or self.check_expiry(key, item):
+            return None
+        if type(item.value) is not kind:
+            raise TypeError
+        if self.evictor is not None:
+            self.evictor.touch(item)
+        return item.value
+
+    def _remove_if_empty(self, key, items):
+        # Redis never keeps an empty list, hash or set around
+        if not items:
+            self._remove(key)
+
+    def _sample_keys(self, evictor):
+        if evictor.volatile:
+            return self._volatile.sample(evictor.samples)
+        return self._keyspace.sample(evictor.samples)
+
+    def _eviction_candidate(self, evictor):
+        # A few rounds, in case the pool only offers keys gone since
+        for _ in range(4):
+            keys = self._sample_keys(evictor)
+            if not keys:
+                return None
+            live = [(key, self._data.get(key)) for key in keys]
+            live = [(key, item) for key, item in live if item is not None]
+            if not live:
+                continue
+            if evictor.policy in (MAXMEMORY_ALLKEYS_RANDOM, MAXMEMORY_VOLATILE_RANDOM):
+                return live[0][0]
+
+            evictor.add_to_pool(live)
+            while (key := evictor.pop_best()) is not None:
+                item = self._data.get(key)
+                if item is not None and (item.expiry or not evictor.volatile):
+                    return key
+        return None
+
+    def evict(self, on_evict=None):
+        """
+        Evict keys by the maxmemory policy while the memory estimate is over
+        maxmemory, for at most EVICTION_TIME_LIMIT; the next call carries on.
+        on_evict is called with each evicted key while the store is locked.
+        Returns False if the store is over the limit and no key can be
+        evicted.
+        """
+        evictor = self.evictor
+        if evictor is None or self.used_memory() <= evictor.maxmemory:
+            return True
+        if evictor.policy == MAXMEMORY_NOEVICTION:
+            return False
+
+        deadline = perf_counter() + EVICTION_TIME_LIMIT
         with self._lock:
-            item = self._data.get(key, DataEntry(deque()))
-            if not isinstance(item.value, deque):
-                raise TypeError
+            while self.used_memory() > evictor.maxmemory:
+                key = self._eviction_candidate(evictor)
+                if key is None:
+                    return False
+                self._remove(key)
+                evictor.evicted_keys += 1
+                if on_evict is not None:
+                    on_evict(key)
+                if perf_counter() > deadline:
+                    break
+        return True
 
-            return list(islice(item.value, start, stop))
+    def append(self, key, value):
+        with self._lock_for(key):
+            items = self._collection_for_write(key, QuickList)
+            size = items.memory_usage()
+            items.append(value)
+            self._account(key, items.memory_usage() - size)
+            if self.blocked_keys:
+                self.blocked_keys.signal(key)
+            return len(items)
 
     def prepend(self, key, value):
-        with self._lock:
-            item = self._data.get(key, DataEntry(deque()))
-            print("HERE")
-            if not isinstance(item.value, deque):
-                print(item.value)
-                raise TypeError
-            print("HERE 2")
-            item.value.insert(0, value)
-            self._data[key] = item
-            return len(item.value)
+        with self._lock_for(key):
+            items = self._collection_for_write(key, QuickList)
+            size = items.memory_usage()
+            items.appendleft(value)
+            self._account(key, items.memory_usage() - size)
+            if self.blocked_keys:
+                self.blocked_keys.signal(key)
+            return len(items)
+
+    def lrange(self, key, start, stop):
+        """Items from start to stop inclusive, with Redis index rules."""
+        with self._lock_for(key):
+            _, spans = self.lrange_spans(key, start, stop)
+            return [bytes(node[begin:end]) for node, begin, end in spans]
+
+    def lrange_spans(self, key, start, stop):
+        """
+        Like lrange, but return the number of items and an iterator over them
+        as QuickList.spans triples. The caller must hold the key's lock until
+        the iterator is exhausted, see lock_keys.
+        """
+        with self._lock_for(key):
+            items = self._collection(key, QuickList)
+            if items is None:
+                return 0, iter(())
+            start, stop = _list_range(len(items), start, stop)
+            return stop - start, items.spans(start, stop)
+
+    def llen(self, key):
+        with self._lock_for(key):
+            items = self._collection(key, QuickList)
+            return 0 if items is None else len(items)
+
+    def lindex(self, key, index):
+        """The item at index, negative counting from the tail, or None."""
+        with self._lock_for(key):
+            items = self._collection(key, QuickList)
+            if items is None:
+                return None
+            if index < 0:
+                index += len(items)
+            if not 0 <= index < len(items):
+                return None
+            return items.index(index)
+
+    def lset(self, key, index, value):
+        """
+        Replace the item at index. Raises KeyError if there is no list at key
+        and IndexError if index is out of range.
+        """
+        with self._lock_for(key):
+            items = self._collection(key, QuickList)
+            if items is None:
+                raise KeyError(key)
+            if index < 0:
+                index += len(items)
+            if not 0 <= index < len(items):
+                raise IndexError(index)
+            size = items.memory_usage()
+            items.set(index, value)
+            self._account(key, items.memory_usage() - size)
+
+    def _pop(self, key, count, from_head):
+        with self._lock_for(key):
+            items = self._collection(key, QuickList)
+            if items is None:
+                return None
+            size = items.memory_usage()
+            pop = items.popleft if from_head else items.pop
+            popped = [pop() for _ in range(min(count, len(items)))]
+            self._account(key, items.memory_usage() - size)
+            self._remove_if_empty(key, items)
+            return popped
+
+    def lpop(self, key, count=1):
+        """Pop up to count items from the head, or None if there is no list."""
+        return self._pop(key, count, True)
+
+    def rpop(self, key, count=1):
+        """Pop up to count items from the tail, or None if there is no list."""
+        return self._pop(key, count, False)
+
+    def lmove(self, source, destination, from_head, to_head):
+        """
+        Pop an item from source and push it onto destination, as LMOVE.
+        Returns the item, or None if there is no list at source.
+        """
+        with self.lock_keys((source, destination)):
+            if self._collection(source, QuickList) is None:
+                return None
+            # Nothing is popped if destination holds another type
+            if destination != source:
+                self._collection(destination, QuickList)
+            (item,) = self._pop(source, 1, from_head)
+            if to_head:
+                self.prepend(destination, item)
+            else:
+                self.append(destination, item)
+            return item
+
+    def ltrim(self, key, start, stop):
+        """Keep the items from start to stop inclusive, with Redis index rules."""
+        with self._lock_for(key):
+            items = self._collection(key, QuickList)
+            if items is None:
+                return
+            size = items.memory_usage()
+            items.trim(*_list_range(len(items), start, stop))
+            self._account(key, items.memory_usage() - size)
+            self._remove_if_empty(key, items)
+
+    def hset(self, key, pairs):
+        """Set (field, value) pairs in the hash at key. Returns how many are new."""
+        with self._lock_for(key):
+            fields = self._collection_for_write(key, Hash)
+            size = fields.memory_usage()
+            added = 0
+            for field, value in pairs:
+                added += fields.set(field, value)
+            self._account(key, fields.memory_usage() - size)
+            return added
+
+    def hget(self, key, field):
+        with self._lock_for(key):
+            fields = self._collection(key, Hash)
+            return None if fields is None else fields.get(field)
+
+    def hmget(self, key, fields):
+        with self._lock_for(key):
+            values = self._collection(key, Hash)
+            if values is None:
+                return [None] * len(fields)
+            return [values.get(field) for field in fields]
+
+    def hgetall(self, key):
+        """The (field, value) pairs of the hash at key."""
+        with self._lock_for(key):
+            fields = self._collection(key, Hash)
+            return [] if fields is None else list(fields.items())
+
+    def hdel(self, key, fields):
+        """Remove fields from the hash at key. Returns how many were there."""
+        with self._lock_for(key):
+            values = self._collection(key, Hash)
+            if values is None:
+                return 0
+            size = values.memory_usage()
+            removed = 0
+            for field in fields:
+                removed += values.delete(field)
+            self._account(key, values.memory_usage() - size)
+            self._remove_if_empty(key, values)
+            return removed
+
+    def hlen(self, key):
+        with self._lock_for(key):
+            fields = self._collection(key, Hash)
+            return 0 if fields is None else len(fields)
+
+    def hincrby(self, key, field, amount):
+        """
+        Add amount to the integer in field of the hash at key. Raises
+        ValueError if the field does not hold an integer and OverflowError
+        if the result does not fit in 64 bits.
+        """
+        with self._lock_for(key):
+            fields = self._collection_for_write(key, Hash)
+            value = amount
+            old = fields.get(field)
+            if old is not None:
+                old = encode_value(old)
+                if type(old) is not int:
+                    raise ValueError
+                value += old
+            if not INT_MIN <= value <= INT_MAX:
+                raise OverflowError
+            size = fields.memory_usage()
+            fields.set(field, b"%d" % value)
+            self._account(key, fields.memory_usage() - size)
+            return value
+
+    def hscan(self, key, cursor, count):
+        """The next cursor and a batch of (field, value) pairs, as HSCAN."""
+        with self._lock_for(key):
+            fields = self._collection(key, Hash)
+            return (0, []) if fields is None else fields.scan(cursor, count)
+
+    def sadd(self, key, members):
+        """Add members to the set at key. Returns how many are new."""
+        with self._lock_for(key):
+            values = self._collection_for_write(key, Set)
+            size = values.memory_usage()
+            added = 0
+            for member in members:
+                added += values.add(encode_value(member))
+            self._account(key, values.memory_usage() - size)
+            return added
+
+    def srem(self, key, members):
+        """Remove members from the set at key. Returns how many were there."""
+        with self._lock_for(key):
+            values = self._collection(key, Set)
+            if values is None:
+                return 0
+            size = values.memory_usage()
+            removed = 0
+            for member in members:
+                removed += values.remove(encode_value(member))
+            self._account(key, values.memory_usage() - size)
+            self._remove_if_empty(key, values)
+            return removed
+
+    def sscan(self, key, cursor, count):
+        """The next cursor and a batch of members, as SSCAN."""
+        with self._lock_for(key):
+            members = self._collection(key, Set)
+            return (0, []) if members is None else members.scan(cursor, count)
+
+    def sismember(self, key, member):
+        with self._lock_for(key):
+            values = self._collection(key, Set)
+            return values is not None and encode_value(member) in values
+
+    def smembers(self, key):
+        with self._lock_for(key):
+            values = self._collection(key, Set)
+            return [] if values is None else list(values)
+
+    def scard(self, key):
+        with self._lock_for(key):
+            values = self._collection(key, Set)
+            return 0 if values is None else len(values)
+
+    def _sinter(self, keys):
+        sets = []
+        for key in keys:
+            values = self._collection(key, Set)
+            if values is None:
+                return set()
+            sets.append(values)
+        # Start from the smallest set, so every step iterates over at most
+        # as many members as it has, and stop as soon as nothing is left.
+        sets.sort(key=len)
+        members = sets[0].as_set()
+        for values in sets[1:]:
+            if not members:
+                break
+            members = values.intersection(members)
+        return members
+
+    def sinter(self, keys):
+        """The members of all the sets at keys, a missing key being empty."""
+        with self.lock_keys(keys):
+            return list(self._sinter(keys))
+
+    def sinterstore(self, destination, keys):
+        """Store the intersection of the sets at keys at destination."""
+        with self.lock_keys([destination, *keys]):
+            members = self._sinter(keys)
+            if members:
+                self[destination] = Set(members)
+            else:
+                self.delete([destination])
+            return len(members)
+
+    def sunion(self, keys):
+        with self.lock_keys(keys):
+            members = set()
+            for key in keys:
+                values = self._collection(key, Set)
+                if values is not None:
+                    members.update(values.as_set())
+            return list(members)
+
+    def sdiff(self, keys):
+        """The members of the first set that are in none of the others."""
+        with self.lock_keys(keys):
+            first = self._collection(keys[0], Set)
+            if first is None:
+                return []
+            members = set(first.as_set())
+            for key in keys[1:]:
+                values = self._collection(key, Set)
+                if values is not None and members:
+                    members.difference_update(values.as_set())
+            return list(members)
+
+    def zadd(self, key, pairs, condition=None, compare=None):
+        """
+        Set the scores of (member, score) pairs in the sorted set at key, as
+        ZADD. condition is "NX" or "XX" and compare "GT" or "LT", as its
+        options. Returns how many members were added and how many changed.
+        """
+        with self._lock_for(key):
+            if condition == "XX":
+                members = self._collection(key, SortedSet)
+                if members is None:
+                    return 0, 0
+            else:
+                members = self._collection_for_write(key, SortedSet)
+            size = members.memory_usage()
+            added = changed = 0
+            for member, score in pairs:
+                old = members.score(member)
+                if old is None:
+                    if condition == "XX":
+                        continue
+                    added += 1
+                elif (
+                    condition == "NX"
+                    or (compare == "GT" and score <= old)
+                    or (compare == "LT" and score >= old)
+                ):
+                    continue
+                elif score != old:
+                    changed += 1
+                members.add(member, score)
+            self._account(key, members.memory_usage() - size)
+            self._remove_if_empty(key, members)
+            return added, changed
+
+    def zincrby(self, key, member, amount, condition=None, compare=None):
+        """
+        Add amount to member's score, as ZINCRBY or ZADD INCR with its options.
+        Returns the new score, or None if the options prevented the update.
+        Raises ValueError if the result is not a number.
+        """
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            old = None if members is None else members.score(member)
+            if (old is None and condition == "XX") or (
+                old is not None and condition == "NX"
+            ):
+                return None
+            score = amount if old is None else old + amount
+            if score != score:
+                raise ValueError("resulting score is not a number (NaN)")
+            if old is not None and (
+                (compare == "GT" and score <= old) or (compare == "LT" and score >= old)
+            ):
+                return None
+            members = self._collection_for_write(key, SortedSet)
+            size = members.memory_usage()
+            members.add(member, score)
+            self._account(key, members.memory_usage() - size)
+            return score
+
+    def zrem(self, key, members):
+        """Remove members from the sorted set at key. Returns how many were there."""
+        with self._lock_for(key):
+            scores = self._collection(key, SortedSet)
+            if scores is None:
+                return 0
+            size = scores.memory_usage()
+            removed = 0
+            for member in members:
+                removed += scores.remove(member)
+            self._account(key, scores.memory_usage() - size)
+            self._remove_if_empty(key, scores)
+            return removed
+
+    def zscore(self, key, member):
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            return None if members is None else members.score(member)
+
+    def zcard(self, key):
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            return 0 if members is None else len(members)
+
+    def zrank(self, key, member):
+        """Rank of member by ascending score, or None."""
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            return None if members is None else members.rank(member)
+
+    def _score_ranks(self, members, low, high):
+        start = members.score_rank(*low)
+        stop = members.score_rank(*high, right=True)
+        return start, max(start, stop)
+
+    def zcount(self, key, low, high):
+        """
+        Number of members scored between low and high, each a (score,
+        exclusive) pair.
+        """
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            if members is None:
+                return 0
+            start, stop = self._score_ranks(members, low, high)
+            return stop - start
+
+    def zrange(self, key, start, stop, reverse=False):
+        """
+        (member, score) pairs ranked from start to stop inclusive, with Redis
+        index rules, counting from the highest score if reverse.
+        """
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            if members is None:
+                return []
+            start, stop = _list_range(len(members), start, stop)
+            if reverse:
+                start, stop = len(members) - stop, len(members) - start
+            return list(members.items(start, stop, reverse))
+
+    def zrange_by_score(self, key, low, high, reverse=False, offset=0, count=-1):
+        """
+        (member, score) pairs scored between low and high, each a (score,
+        exclusive) pair, skipping offset of them and returning at most count
+        if it is not negative.
+        """
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            if members is None:
+                return []
+            start, stop = self._score_ranks(members, low, high)
+            start, stop = _limit(start, stop, offset, count, reverse)
+            return list(members.items(start, stop, reverse))
+
+    def zrange_by_lex(self, key, low, high, reverse=False, offset=0, count=-1):
+        """
+        As zrange_by_score for members between low and high, each a (member,
+        exclusive) pair or None for no bound, when all scores are equal.
+        """
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            if members is None:
+                return []
+            start = 0 if low is None else members.lex_rank(*low)
+            stop = len(members) if high is None else members.lex_rank(*high, right=True)
+            start, stop = _limit(start, max(start, stop), offset, count, reverse)
+            return list(members.items(start, stop, reverse))
+
+    def zpop(self, key, count, from_max=False):
+        """Remove and return up to count of the lowest, or highest, scored pairs."""
+        with self._lock_for(key):
+            members = self._collection(key, SortedSet)
+            if members is None:
+                return []
+            size = members.memory_usage()
+            popped = members.pop(count, from_max)
+            self._account(key, members.memory_usage() - size)
+            self._remove_if_empty(key, members)
+            return popped
@@ -0,0 +1,52 @@
+import re
+
+INT_MIN = -(2**63)
+INT_MAX = 2**63 - 1
+_INT_START = frozenset(b"-0123456789")
+# What Redis accepts as an integer or a float. Python's int() and float()
+# also take surrounding whitespace, "+", "_" separators and NaN.
+_INTEGER = re.compile(rb"0|-?[1-9][0-9]*")
+_FLOAT = re.compile(
+    rb"[+-]?(?:(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:e[+-]?[0-9]+)?|inf|infinity)",
+    re.IGNORECASE,
+)
+
+
+def encode_value(value):
+    """
+    Store byte strings holding a canonical 64 bit integer as an int, like the
+    Redis "int" encoding, so counters are not parsed and formatted on every
+    update. Values are turned back into bytes when they are read as strings.
+    """
+    if type(value) is bytes and 0 < len(value) <= 20 and value[0] in _INT_START:
+        try:
+            number = int(value)
+        except ValueError:
+            return value
+        if INT_MIN <= number <= INT_MAX and b"%d" % number == value:
+            return number
+    return value
+
+
+def parse_int(data):
+    """
+    Parse a signed 64 bit integer from bytes, or str as the DataStore API
+    accepts, raising ValueError as int() does.
+    """
+    if type(data) is str:
+        data = data.encode()
+    if _INTEGER.fullmatch(data) is None:
+        raise ValueError(f"invalid integer {data!r}")
+    value = int(data)
+    if not INT_MIN <= value <= INT_MAX:
+        raise ValueError(f"integer out of range {data!r}")
+    return value
+
+
+def parse_float(data):
+    """Parse a float from bytes or str, raising ValueError as float() does."""
+    if type(data) is str:
+        data = data.encode()
+    if _FLOAT.fullmatch(data) is None:
+        raise ValueError(f"invalid float {data!r}")
+    return float(data)
@@ -0,0 +1,140 @@
+import random
+from bisect import insort
+from time import monotonic
+
+
+MAXMEMORY_NOEVICTION = "noeviction"
+MAXMEMORY_ALLKEYS_LRU = "allkeys-lru"
+MAXMEMORY_ALLKEYS_LFU = "allkeys-lfu"
+MAXMEMORY_ALLKEYS_RANDOM = "allkeys-random"
+MAXMEMORY_VOLATILE_LRU = "volatile-lru"
+MAXMEMORY_VOLATILE_LFU = "volatile-lfu"
+MAXMEMORY_VOLATILE_RANDOM = "volatile-random"
+MAXMEMORY_VOLATILE_TTL = "volatile-ttl"
+MAXMEMORY_POLICIES = (
+    MAXMEMORY_NOEVICTION,
+    MAXMEMORY_ALLKEYS_LRU,
+    MAXMEMORY_ALLKEYS_LFU,
+    MAXMEMORY_ALLKEYS_RANDOM,
+    MAXMEMORY_VOLATILE_LRU,
+    MAXMEMORY_VOLATILE_LFU,
+    MAXMEMORY_VOLATILE_RANDOM,
+    MAXMEMORY_VOLATILE_TTL,
+)
+MAXMEMORY_SAMPLES = 5
+# Best candidates kept between eviction rounds, as in the Redis eviction pool.
+EVICTION_POOL_SIZE = 16
+# Upper bound on the time one write spends evicting, in seconds. Writes go
+# ahead once it is spent, and the next write carries on.
+EVICTION_TIME_LIMIT = 0.0005
+
+# Redis LFU parameters: a new key starts at LFU_INIT_VAL, the logarithmic
+# counter grows more slowly the higher it is, and it is decremented once
+# per LFU_DECAY_TIME minutes without access.
+LFU_INIT_VAL = 5
+LFU_LOG_FACTOR = 10
+LFU_DECAY_TIME = 1
+
+
+class Evictor:
+    """
+    Approximated LRU/LFU bookkeeping for a maxmemory policy. Each entry keeps
+    one `access` int: the LRU clock in seconds for LRU policies, or the last
+    decrement time in minutes and an 8 bit logarithmic counter for LFU ones.
+    The ints are shared between entries touched in the same period, so the
+    field costs one slot per key.
+    """
+
+    def __init__(self, maxmemory, policy, samples=MAXMEMORY_SAMPLES):
+        if policy not in MAXMEMORY_POLICIES:
+            raise ValueError(f"Unknown maxmemory policy {policy}")
+        self.maxmemory = maxmemory
+        self.policy = policy
+        self.samples = samples
+        self.volatile = policy.startswith("volatile-")
+        self.lru = policy.endswith("-lru")
+        self.lfu = policy.endswith("-lfu")
+        self._pool = []
+        self._pool_keys = set()
+        self.evicted_keys = 0
+        self._clock = 0
+        self._lfu_minutes = 0
+        self._lfu_values = {}
+
+    def _lru_clock(self):
+        now = int(monotonic())
+        if now != self._clock:
+            self._clock = now
+        return self._clock
+
+    def _lfu_now(self):
+        now = int(monotonic() / 60) & 0xFFFF
+        if now != self._lfu_minutes:
+            self._lfu_minutes = now
+            self._lfu_values = {}
+        return now
+
+    def _lfu_pack(self, minutes, counter):
+        value = minutes << 8 | counter
+        return self._lfu_values.setdefault(value, value)
+
+    def _lfu_counter(self, access, now):
+        counter = access & 0xFF
+        elapsed = (now - (access >> 8)) & 0xFFFF
+        return max(0, counter - elapsed // LFU_DECAY_TIME)
+
+    def init_access(self, entry):
+        if self.lru:
+            entry.access = self._lru_clock()
+        elif self.lfu:
+            entry.access = self._lfu_pack(self._lfu_now(), LFU_INIT_VAL)
+
+    def touch(self, entry):
+        if self.lru:
+            entry.access = self._lru_clock()
+        elif self.lfu:
+            now = self._lfu_now()
+            counter = self._lfu_counter(entry.access, now)
+            if counter < 255:
+                base = max(0, counter - LFU_INIT_VAL)
+                if random.random() < 1.0 / (base * LFU_LOG_FACTOR + 1):
+                    counter += 1
+            entry.access = self._lfu_pack(now, counter)
+
+    def add_to_pool(self, candidates):
+        """
+        Score (key, entry) candidates, higher meaning evict sooner, and keep
+        the best EVICTION_POOL_SIZE of them in the pool, lowest first.
+        """
+        pool = self._pool
+        keys = self._pool_keys
+        if self.lru:
+            now = self._lru_clock()
+            scored = ((now - entry.access, key) for key, entry in candidates)
+        elif self.lfu:
+            now = self._lfu_now()
+            scored = (
+                (255 - self._lfu_counter(entry.access, now), key)
+                for key, entry in candidates
+            )
+        else:
+            scored = ((-entry.expiry, key) for key, entry in candidates)
+
+        for candidate in scored:
+            key = candidate[1]
+            if key in keys or (
+                len(pool) == EVICTION_POOL_SIZE and candidate <= pool[0]
+            ):
+                continue
+            insort(pool, candidate)
+            keys.add(key)
+            if len(pool) > EVICTION_POOL_SIZE:
+                keys.discard(pool.pop(0)[1])
+
+    def pop_best(self):
+        """Take the best candidate key out of the pool, or None if it is empty."""
+        if not self._pool:
+            return None
+        key = self._pool.pop()[1]
+        self._pool_keys.discard(key)
+        return key
@@ -0,0 +1,145 @@
+import heapq
+import threading
+from threading import Lock
+from time import time
+
+import trio
+
+
+# Most keys removed by a single pass, so a burst of keys expiring together
+# cannot hold the store lock for long. The rest are removed on the next pass.
+EXPIRY_BATCH_SIZE = 1000
+
+
+def _delay_until(deadline):
+    """Seconds from now until the millisecond timestamp deadline has passed."""
+    return max(0, deadline + 1 - time() * 1000) / 1000
+
+
+class ExpiryHeap:
+    """
+    Min-heap of (expiry, key) pairs, used to find the keys that are due
+    without scanning. Entries are not removed when a key is overwritten or
+    deleted; the caller checks each popped entry against the live one.
+
+    `listener` is called with the new deadline whenever a push makes it the
+    earliest one, so a scheduler can bring its next wakeup forward.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._lock = Lock()
+        self.listener = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, deadline, key):
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, key))
+            earliest = self._heap[0][0] == deadline
+        if earliest and self.listener:
+            self.listener(deadline)
+
+    def pop_due(self, now, limit=EXPIRY_BATCH_SIZE):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] < now and len(due) < limit:
+                due.append(heapq.heappop(self._heap))
+        return due
+
+    def next_deadline(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def rebuild(self, entries):
+        heap = list(entries)
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+
+
+class AsyncExpiryScheduler:
+    """Removes keys at their deadline using loop.call_at, with no polling."""
+
+    def __init__(self, datastore, loop):
+        self._datastore = datastore
+        self._loop = loop
+        self._handle = None
+        self._deadline = None
+        datastore.set_expiry_listener(self.schedule)
+
+    def start(self):
+        deadline = self._datastore.remove_due_keys()
+        if deadline is not None:
+            self.schedule(deadline)
+
+    def schedule(self, deadline):
+        if self._deadline is not None and self._deadline <= deadline:
+            return
+        if self._handle:
+            self._handle.cancel()
+        self._deadline = deadline
+        self._handle = self._loop.call_at(
+            self._loop.time() + _delay_until(deadline), self._run
+        )
+
+    def _run(self):
+        self._handle = None
+        self._deadline = None
+        deadline = self._datastore.remove_due_keys()
+        if deadline is not None:
+            self.schedule(deadline)
+
+
+class ThreadedExpiryScheduler:
+    """Background thread sleeping on a condition until the next deadline."""
+
+    def __init__(self, datastore):
+        self._datastore = datastore
+        self._condition = threading.Condition()
+        self._deadline = None
+        datastore.set_expiry_listener(self.schedule)
+
+    def schedule(self, deadline):
+        with self._condition:
+            if self._deadline is None or deadline < self._deadline:
+                self._deadline = deadline
+                self._condition.notify()
+
+    def run(self):
+        while True:
+            deadline = self._datastore.remove_due_keys()
+            with self._condition:
+                if self._deadline is not None and (
+                    deadline is None or self._deadline < deadline
+                ):
+                    deadline = self._deadline
+                self._deadline = deadline
+                timeout = None if deadline is None else _delay_until(deadline)
+                self._condition.wait(timeout)
+                self._deadline = None
+
+
+class TrioExpiryScheduler:
+    """Trio task sleeping in a cancel scope whose deadline tracks the heap."""
+
+    def __init__(self, datastore):
+        self._datastore = datastore
+        self._scope = None
+        datastore.set_expiry_listener(self.schedule)
+
+    def schedule(self, deadline):
+        if self._scope is not None:
+            when = trio.current_time() + _delay_until(deadline)
+            self._scope.deadline = min(self._scope.deadline, when)
+
+    async def run(self):
+        while True:
+            deadline = self._datastore.remove_due_keys()
+            with trio.CancelScope() as scope:
+                if deadline is not None:
+                    scope.deadline = trio.current_time() + _delay_until(deadline)
+                self._scope = scope
+                await trio.sleep_forever()
+            self._scope = None
@@ -0,0 +1,193 @@
+import builtins
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from pyredis.protocol import RespParser
+from pyredis.types import (
+    NULL_BULK_STRING,
+    Array,
+    BulkString,
+    Error,
+    Integer,
+    RawReply,
+)
+
+log = logging.getLogger("pyredis")
+
+# The builtins a library is compiled against. Without __import__, open or
+# eval a function can only compute and call commands. Libraries come from
+# the operator at startup, so this keeps them honest rather than being a
+# security boundary.
+_SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in (
+        "abs",
+        "all",
+        "any",
+        "bool",
+        "bytes",
+        "dict",
+        "divmod",
+        "enumerate",
+        "Exception",
+        "filter",
+        "float",
+        "int",
+        "isinstance",
+        "len",
+        "list",
+        "map",
+        "max",
+        "min",
+        "range",
+        "reversed",
+        "round",
+        "set",
+        "sorted",
+        "str",
+        "sum",
+        "tuple",
+        "TypeError",
+        "ValueError",
+        "zip",
+    )
+}
+
+
+class FunctionError(Exception):
+    """
+    A command called from a function replied with an error. Raised out of
+    redis.call; if the function lets it through, it is the FCALL reply.
+    """
+
+
+@dataclass
+class Function:
+    name: str
+    library: str
+    callback: Callable
+    # Set by the no-writes flag: the function may only call read commands
+    # and can be run with FCALL_RO.
+    read_only: bool
+
+
+# Functions by name, filled once at startup by load_library.
+FUNCTIONS = {}
+# Library name to the names of its functions, for FUNCTION LIST.
+LIBRARIES = {}
+
+
+class _Registrar:
+    """The redis object a library sees while it is loaded."""
+
+    def __init__(self, library):
+        self._library = library
+        self.registered = []
+
+    def register_function(self, name, callback, flags=()):
+        if not isinstance(name, str) or not name:
+            raise ValueError("function name must be a non empty string")
+        if name.encode() in FUNCTIONS or any(f.name == name for f in self.registered):
+            raise ValueError(f"function '{name}' already exists")
+        if not callable(callback):
+            raise ValueError(f"function '{name}' callback is not callable")
+        unknown = set(flags) - {"no-writes"}
+        if unknown:
+            raise ValueError(f"function '{name}' has unknown flags {sorted(unknown)}")
+        self.registered.append(
+            Function(name, self._library, callback, "no-writes" in flags)
+        )
+
+
+def load_library(path):
+    """
+    Compile the library at path and register the functions it declares with
+    redis.register_function(name, callback, flags). The library is compiled
+    and run once, here; FCALL then calls the registered callback directly.
+    Raises ValueError if the library cannot be loaded, and registers none of
+    its functions then.
+    """
+    path = Path(path)
+    library = path.stem
+    if library in LIBRARIES:
+        raise ValueError(f"library '{library}' already exists")
+    try:
+        code = compile(path.read_bytes(), str(path), "exec")
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"cannot load library '{library}': {e}") from e
+
+    registrar = _Registrar(library)
+    namespace = {
+        "__builtins__": _SAFE_BUILTINS,
+        "__name__": library,
+        "redis": registrar,
+        "FunctionError": FunctionError,
+    }
+    try:
+        exec(code, namespace)
+    except Exception as e:
+        raise ValueError(f"cannot load library '{library}': {e!r}") from e
+    if not registrar.registered:
+        raise ValueError(f"library '{library}' registers no functions")
+
+    for function in registrar.registered:
+        FUNCTIONS[function.name.encode()] = function
+    LIBRARIES[library] = [function.name for function in registrar.registered]
+    log.info(f"Loaded library {library}: {', '.join(LIBRARIES[library])}")
+    return LIBRARIES[library]
+
+
+def to_python(reply):
+    """Convert a command reply to the value redis.call returns for it."""
+    match reply:
+        case Error():
+            raise FunctionError(reply.data)
+        case RawReply():
+            # Replies encoded straight from the store, as MGET's
+            parser = RespParser()
+            parser.feed(reply.data)
+            return to_python(parser.get_frame())
+        case Array():
+            if reply.data is None:
+                return None
+            return [to_python(item) for item in reply.data]
+        case BulkString():
+            data = reply.data
+            if type(data) is int:
+                return b"%d" % data
+            return data.encode() if isinstance(data, str) else data
+    return reply.data
+
+
+def to_reply(value):
+    """Convert the value a function returns to its FCALL reply."""
+    match value:
+        case None:
+            return NULL_BULK_STRING
+        case bool():
+            return Integer(int(value))
+        case int():
+            return Integer(value)
+        case bytes():
+            return BulkString(value)
+        case str():
+            return BulkString(value.encode())
+        case float():
+            return BulkString(repr(value).encode())
+        case list() | tuple():
+            return Array([to_reply(item) for item in value])
+    raise TypeError(f"cannot reply with a {type(value).__name__}")
+
+
+def to_argument(value):
+    """Convert an argument given to redis.call to a command argument."""
+    match value:
+        case bytes():
+            return BulkString(value)
+        case str():
+            return BulkString(value.encode())
+        case int() | float():
+            return BulkString(repr(value).encode())
+    raise TypeError(f"command arguments must be bytes, str or numbers, not {value!r}")
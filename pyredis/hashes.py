@@ -0,0 +1,198 @@
+from sys import getsizeof
+
+from pyredis.listpack import LONG_ENTRY, entry_data, next_entry, pack_entry
+
+
+# A hash stays a listpack while it has at most this many fields and no
+# field or value is longer than this many bytes, see --hash-max-listpack-*.
+hash_max_listpack_entries = 128
+hash_max_listpack_value = 64
+
+
+class Hash:
+    """
+    Hash value with the two Redis encodings. A small hash is a listpack:
+    fields and values packed alternately into one bytearray and searched
+    linearly. It is converted to a dict for good once it grows past
+    hash_max_listpack_entries or hash_max_listpack_value.
+
+    The dict encoding keeps fields and values in two dense lists, and _dict
+    maps each field to its slot there, so HSCAN walks the lists down from
+    the end as SCAN walks the keyspace: a deleted field's slot is filled
+    with the last field, which the scan has already returned or has yet to
+    reach.
+    """
+
+    __slots__ = ("_listpack", "_count", "_dict", "_fields", "_values", "_dict_bytes")
+
+    def __init__(self, pairs=()):
+        self._listpack = bytearray()
+        self._count = 0
+        self._dict = None
+        self._fields = None
+        self._values = None
+        # Bytes used by the fields and values of the dict encoding
+        self._dict_bytes = 0
+        for field, value in pairs:
+            self.set(field, value)
+
+    def __len__(self):
+        return self._count if self._dict is None else len(self._dict)
+
+    def __iter__(self):
+        return self.items()
+
+    def __repr__(self):
+        return f"Hash({list(self.items())!r})"
+
+    @property
+    def encoding(self):
+        return "listpack" if self._dict is None else "hashtable"
+
+    def copy(self):
+        clone = Hash()
+        if self._dict is None:
+            clone._listpack = bytearray(self._listpack)
+            clone._count = self._count
+        else:
+            clone._listpack = None
+            clone._dict = dict(self._dict)
+            clone._fields = list(self._fields)
+            clone._values = list(self._values)
+            clone._dict_bytes = self._dict_bytes
+        return clone
+
+    def memory_usage(self):
+        if self._dict is None:
+            return _HASH_SIZE + getsizeof(self._listpack)
+        return (
+            _HASH_SIZE
+            + getsizeof(self._dict)
+            + getsizeof(self._fields)
+            + getsizeof(self._values)
+            + self._dict_bytes
+        )
+
+    def _find(self, field):
+        """
+        Position of field's entry in the listpack and of its value's entry,
+        or None if it is not there.
+        """
+        listpack = self._listpack
+        size = len(field)
+        pos, end = 0, len(listpack)
+        # The walk is the hot path of every read, so entries are decoded
+        # inline, relying on set() keeping only short entries here.
+        while pos < end:
+            length = listpack[pos]
+            value_pos = pos + length + 2
+            if length == size and listpack[pos + 1 : value_pos - 1] == field:
+                return pos, value_pos
+            pos = value_pos + listpack[value_pos] + 2
+        return None
+
+    def _convert(self):
+        pairs = list(self.items())
+        self._fields = [field for field, _ in pairs]
+        self._values = [value for _, value in pairs]
+        self._dict = {field: slot for slot, field in enumerate(self._fields)}
+        self._dict_bytes = sum(getsizeof(f) + getsizeof(v) for f, v in pairs)
+        self._listpack = None
+        self._count = 0
+
+    def get(self, field):
+        if self._dict is not None:
+            slot = self._dict.get(field)
+            return None if slot is None else self._values[slot]
+        found = self._find(field)
+        if found is None:
+            return None
+        start, stop = entry_data(self._listpack, found[1])
+        return bytes(self._listpack[start:stop])
+
+    def set(self, field, value):
+        """Set field to value. Returns True if the field is new."""
+        if self._dict is None:
+            # Listpack entries always have a one byte length, see _find
+            limit = min(hash_max_listpack_value, LONG_ENTRY - 1)
+            if len(field) > limit or len(value) > limit:
+                self._convert()
+
+        if self._dict is not None:
+            slot = self._dict.get(field)
+            if slot is None:
+                self._dict[field] = len(self._fields)
+                self._fields.append(field)
+                self._values.append(value)
+                self._dict_bytes += getsizeof(field) + getsizeof(value)
+                return True
+            self._dict_bytes += getsizeof(value) - getsizeof(self._values[slot])
+            self._values[slot] = value
+            return False
+
+        listpack = self._listpack
+        found = self._find(field)
+        if found is not None:
+            value_pos = found[1]
+            listpack[value_pos : next_entry(listpack, value_pos)] = pack_entry(value)
+            return False
+        listpack += pack_entry(field)
+        listpack += pack_entry(value)
+        self._count += 1
+        if self._count > hash_max_listpack_entries:
+            self._convert()
+        return True
+
+    def delete(self, field):
+        """Remove field. Returns True if it was there."""
+        if self._dict is not None:
+            slot = self._dict.pop(field, None)
+            if slot is None:
+                return False
+            fields, values = self._fields, self._values
+            self._dict_bytes -= getsizeof(field) + getsizeof(values[slot])
+            last_field, last_value = fields.pop(), values.pop()
+            if slot < len(fields):
+                fields[slot] = last_field
+                values[slot] = last_value
+                self._dict[last_field] = slot
+            return True
+
+        found = self._find(field)
+        if found is None:
+            return False
+        pos, value_pos = found
+        del self._listpack[pos : next_entry(self._listpack, value_pos)]
+        self._count -= 1
+        return True
+
+    def items(self):
+        if self._dict is not None:
+            yield from zip(self._fields, self._values)
+            return
+        listpack = self._listpack
+        pos, end = 0, len(listpack)
+        while pos < end:
+            start, stop = entry_data(listpack, pos)
+            field = bytes(listpack[start:stop])
+            pos = next_entry(listpack, pos)
+            start, stop = entry_data(listpack, pos)
+            yield field, bytes(listpack[start:stop])
+            pos = next_entry(listpack, pos)
+
+    def scan(self, cursor, count):
+        """
+        Return the next cursor, 0 once the walk is over, and the batch of up
+        to count pairs below cursor, as HSCAN. A listpack is small and is
+        returned whole, as Redis does.
+        """
+        if self._dict is None:
+            return 0, list(self.items())
+        stop = len(self._fields)
+        if cursor:
+            stop = min(cursor, stop)
+        start = max(stop - count, 0)
+        return start, list(zip(self._fields[start:stop], self._values[start:stop]))
+
+
+_HASH_SIZE = getsizeof(Hash())
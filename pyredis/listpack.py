@@ -0,0 +1,41 @@
+import struct
+
+
+# Entries are stored as their length, the data and the length again, so a
+# packed buffer can be walked from either end. Lengths of 255 bytes or more
+# are announced by this byte and stored as 4 bytes.
+LONG_ENTRY = 0xFF
+
+_U32 = struct.Struct("<I")
+
+
+def pack_entry(item):
+    size = len(item)
+    if size < LONG_ENTRY:
+        header = bytes((size,))
+        return b"".join((header, item, header))
+    length = _U32.pack(size)
+    return b"".join((b"\xff", length, item, length, b"\xff"))
+
+
+def entry_data(buffer, pos):
+    """Return the start and end of the data of the entry starting at pos."""
+    size = buffer[pos]
+    if size == LONG_ENTRY:
+        (size,) = _U32.unpack_from(buffer, pos + 1)
+        return pos + 5, pos + 5 + size
+    return pos + 1, pos + 1 + size
+
+
+def next_entry(buffer, pos):
+    size = buffer[pos]
+    if size == LONG_ENTRY:
+        return pos + 10 + _U32.unpack_from(buffer, pos + 1)[0]
+    return pos + 2 + size
+
+
+def previous_entry(buffer, end):
+    size = buffer[end - 1]
+    if size == LONG_ENTRY:
+        return end - 10 - _U32.unpack_from(buffer, end - 5)[0]
+    return end - 2 - size
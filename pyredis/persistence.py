@@ -1,34 +1,274 @@
-from pyredis.commands import handle_command
-from pyredis.protocol import extract_frame_from_buffer
+import logging
+import os
+import threading
+from time import sleep
+
+from pyredis.hashes import Hash
+from pyredis.quicklist import QuickList
+from pyredis.sets import Set
+from pyredis.sortedsets import SortedSet, format_score
+from pyredis.replay import replay_aof
+from pyredis.types import Array, BulkString
+
+
+APPENDFSYNC_ALWAYS = "always"
+APPENDFSYNC_EVERYSEC = "everysec"
+APPENDFSYNC_NO = "no"
+APPENDFSYNC_POLICIES = (APPENDFSYNC_ALWAYS, APPENDFSYNC_EVERYSEC, APPENDFSYNC_NO)
+# log_command writes the buffer out itself once it grows past this, for
+# callers that never call flush().
+AOF_BUFFER_LIMIT = 1024 * 1024
+# A rewrite is started automatically once the file has grown this many
+# percent over its size after the last rewrite, and is at least min size.
+AUTO_AOF_REWRITE_PERCENTAGE = 100
+AUTO_AOF_REWRITE_MIN_SIZE = 64 * 1024 * 1024
+# Most list elements emitted per RPUSH by a rewrite.
+AOF_REWRITE_ITEMS_PER_CMD = 64
+log = logging.getLogger("pyredis")
 
 
 class AppendOnlyPersister:
-    def __init__(self, filename):
+    """
+    Append only file writer. Commands are encoded into an in-memory buffer
+    and written out with one write per flush(), which the servers call once
+    per pipeline batch before sending the replies. The appendfsync policy
+    decides when the data is forced to disk:
+
+    - always: fsync on every flush
+    - everysec: fsync once a second from a background thread
+    - no: leave it to the operating system
+
+    rewrite() compacts the file in the background, see BGREWRITEAOF. Given
+    a datastore, a rewrite also starts by itself once the file has grown by
+    auto_rewrite_percentage since the last one and is over auto_rewrite_min_size.
+    """
+
+    def __init__(
+        self,
+        filename,
+        appendfsync=APPENDFSYNC_EVERYSEC,
+        datastore=None,
+        auto_rewrite_percentage=AUTO_AOF_REWRITE_PERCENTAGE,
+        auto_rewrite_min_size=AUTO_AOF_REWRITE_MIN_SIZE,
+    ):
+        if appendfsync not in APPENDFSYNC_POLICIES:
+            raise ValueError(f"Invalid appendfsync policy: {appendfsync}")
         self._filename = filename
-        self._file = open(filename, mode="ab", buffering=0)
+        self._appendfsync = appendfsync
+        self._file = open(filename, mode="ab")
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._unsynced = False
+        self._closed = False
+
+        self._datastore = datastore
+        self._auto_rewrite_percentage = auto_rewrite_percentage
+        self._auto_rewrite_min_size = auto_rewrite_min_size
+        self._size = os.path.getsize(filename)
+        self._base_size = self._size
+        # Commands logged while a rewrite runs, appended to the new file
+        self._rewrite_buffer = None
+
+        self._fsync_thread = None
+        if appendfsync == APPENDFSYNC_EVERYSEC:
+            self._fsync_thread = threading.Thread(
+                target=self._fsync_every_second, daemon=True
+            )
+            self._fsync_thread.start()
+
+    @property
+    def rewrite_in_progress(self):
+        return self._rewrite_buffer is not None
 
     def log_command(self, command):
-        self._file.write(f"*{len(command)}\r\n".encode())
+        with self._lock:
+            start = len(self._buffer)
+            self._buffer += b"*%d\r\n" % len(command)
+            for item in command:
+                item.encode_into(self._buffer)
+            if self._rewrite_buffer is not None:
+                self._rewrite_buffer += self._buffer[start:]
+            if len(self._buffer) > AOF_BUFFER_LIMIT:
+                self._write()
 
-        for item in command:
-            self._file.write(item.resp_encode())
+    def log_commands(self, commands):
+        """Log commands back to back, with no other command between them."""
+        with self._lock:
+            start = len(self._buffer)
+            for command in commands:
+                self._buffer += b"*%d\r\n" % len(command)
+                for item in command:
+                    item.encode_into(self._buffer)
+            if self._rewrite_buffer is not None:
+                self._rewrite_buffer += self._buffer[start:]
+            if len(self._buffer) > AOF_BUFFER_LIMIT:
+                self._write()
 
-    @staticmethod
-    def restore_from_file(filename=None, database=None):
-        buffer = bytearray()
-        with open(filename, "rb") as f:
-            while True:
-                data = f.read(1024)
-                if data:
-                    buffer.extend(data)
-                else:
-                    break
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return
+            self._write()
+            if self._appendfsync == APPENDFSYNC_ALWAYS:
+                os.fsync(self._file.fileno())
+                self._unsynced = False
+            start_rewrite = self._should_rewrite()
+
+        if start_rewrite:
+            log.info("Starting automatic AOF rewrite at %d bytes", self._size)
+            self.rewrite()
+
+    def _write(self):
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._size += len(self._buffer)
+        self._buffer.clear()
+        self._unsynced = True
+
+    def _should_rewrite(self):
+        if (
+            self._datastore is None
+            or not self._auto_rewrite_percentage
+            or self._rewrite_buffer is not None
+            or self._size < self._auto_rewrite_min_size
+        ):
+            return False
+        growth = self._size * 100 / max(self._base_size, 1) - 100
+        return growth >= self._auto_rewrite_percentage
+
+    def rewrite(self, datastore=None):
+        """
+        Start compacting the file in the background: the smallest command
+        stream recreating a point in time copy of the datastore is written
+        to a temporary file while new commands keep going to the live file
+        and to a rewrite buffer. The buffer is then appended to the new file,
+        which atomically replaces the old one. Returns False if a rewrite is
+        already in progress.
+        """
+        datastore = datastore or self._datastore
+        # Lock order is datastore then persister, as for a logged command
+        with datastore._lock:
+            with self._lock:
+                if self._rewrite_buffer is not None:
+                    return False
+                self._rewrite_buffer = bytearray()
+            snapshot = datastore.snapshot()
+
+        threading.Thread(target=self._rewrite, args=(snapshot,), daemon=True).start()
+        return True
+
+    def _rewrite(self, snapshot):
+        temp_filename = f"{self._filename}.rewrite"
+        try:
+            with open(temp_filename, "wb") as f:
+                _write_snapshot_commands(f, snapshot)
+                # Drain the commands logged meanwhile without holding the lock
+                # so that only a small tail is left for the final switch.
                 while True:
-                    frame, frame_size = extract_frame_from_buffer(buffer)
+                    with self._lock:
+                        if len(self._rewrite_buffer) < AOF_BUFFER_LIMIT:
+                            break
+                        pending, self._rewrite_buffer = (
+                            self._rewrite_buffer,
+                            bytearray(),
+                        )
+                    f.write(pending)
+
+                with self._lock:
+                    if self._buffer:
+                        self._write()
+                    f.write(self._rewrite_buffer)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    os.replace(temp_filename, self._filename)
+                    self._file.close()
+                    self._file = open(self._filename, mode="ab")
+                    self._size = self._base_size = os.path.getsize(self._filename)
+                    # Everything in the new file was synced above
+                    self._unsynced = False
+                    self._rewrite_buffer = None
+            log.info("AOF rewrite finished, new size %d bytes", self._size)
+        except Exception:
+            log.exception("AOF rewrite failed")
+            with self._lock:
+                self._rewrite_buffer = None
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+    def _fsync_every_second(self):
+        while True:
+            sleep(1)
+            # Under the lock, so the file is neither closed nor swapped for
+            # a rewritten one during the fsync
+            with self._lock:
+                if self._closed:
+                    return
+                if not self._unsynced:
+                    continue
+                self._unsynced = False
+                try:
+                    os.fsync(self._file.fileno())
+                except OSError:
+                    log.exception("Background AOF fsync failed")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._unsynced = False
+            self._closed = True
 
-                    if frame:
-                        buffer = buffer[frame_size:]
-                        handle_command(frame, database, None)
-                    else:
-                        break
+    @staticmethod
+    def restore_from_file(filename=None, database=None):
+        replay_aof(filename, database)
         return True
+
+
+def _bulk(value):
+    if not isinstance(value, (bytes, str)):
+        value = str(value)
+    return BulkString(value)
+
+
+def _write_snapshot_commands(f, snapshot):
+    buffer = bytearray()
+    for key, value, expiry in snapshot:
+        key = _bulk(key)
+        if isinstance(value, QuickList):
+            items = list(value)
+            for i in range(0, len(items), AOF_REWRITE_ITEMS_PER_CMD):
+                chunk = items[i : i + AOF_REWRITE_ITEMS_PER_CMD]
+                Array([BulkString(b"RPUSH"), key, *map(_bulk, chunk)]).encode_into(
+                    buffer
+                )
+        elif isinstance(value, Hash):
+            pairs = [BulkString(data) for pair in value.items() for data in pair]
+            step = 2 * AOF_REWRITE_ITEMS_PER_CMD
+            for i in range(0, len(pairs), step):
+                Array([BulkString(b"HSET"), key, *pairs[i : i + step]]).encode_into(
+                    buffer
+                )
+        elif isinstance(value, Set):
+            members = [BulkString(member) for member in value]
+            for i in range(0, len(members), AOF_REWRITE_ITEMS_PER_CMD):
+                chunk = members[i : i + AOF_REWRITE_ITEMS_PER_CMD]
+                Array([BulkString(b"SADD"), key, *chunk]).encode_into(buffer)
+        elif isinstance(value, SortedSet):
+            pairs = []
+            for member, score in value:
+                pairs += (BulkString(format_score(score)), BulkString(member))
+            step = 2 * AOF_REWRITE_ITEMS_PER_CMD
+            for i in range(0, len(pairs), step):
+                chunk = pairs[i : i + step]
+                Array([BulkString(b"ZADD"), key, *chunk]).encode_into(buffer)
+        else:
+            command = [BulkString(b"SET"), key, _bulk(value)]
+            if expiry:
+                command += [BulkString(b"PXAT"), _bulk(expiry)]
+            Array(command).encode_into(buffer)
+
+        if len(buffer) > AOF_BUFFER_LIMIT:
+            f.write(buffer)
+            buffer.clear()
+    f.write(buffer)
@@ -9,69 +9,157 @@ from pyredis.types import (
 
 _MSG_SEPARATOR = b"\r\n"
 _MSG_SEPARATOR_SIZE = len(_MSG_SEPARATOR)
+# Consumed bytes are only dropped from the front of the parser buffer once
+# this many have accumulated, so most reads never move the pending data.
+_COMPACT_THRESHOLD = 64 * 1024
 
 
-def extract_frame_from_buffer(buffer):
-    separator = buffer.find(_MSG_SEPARATOR)
-
-    if separator == -1:
-        return None, 0
-    else:
-        paylood = buffer[1:separator].decode()
-    match chr(buffer[0]):
-        case "+":
-            return SimpleString(paylood), separator + _MSG_SEPARATOR_SIZE
+class ProtocolError(Exception):
+    pass
 
-        case "-":
-            return Error(buffer[1:separator].decode()), separator + _MSG_SEPARATOR_SIZE
 
-        case ":":
-            return Integer(int(buffer[1:separator])), separator + _MSG_SEPARATOR_SIZE
+def _read_item(buffer, view, pos):
+    """
+    Read one item starting at pos. Returns the item, the position just after
+    it and, for array headers, the number of elements still to be read.
+    Returns (None, pos, 0) when the item is not complete yet.
+    """
+    separator = buffer.find(_MSG_SEPARATOR, pos)
+    if separator == -1:
+        return None, pos, 0
 
-        case "$":
-            data_size = int(paylood)
+    end = separator + _MSG_SEPARATOR_SIZE
+    match buffer[pos]:
+        case 0x24:  # $
+            try:
+                data_size = int(buffer[pos + 1 : separator])
+            except ValueError:
+                raise ProtocolError("invalid bulk length")
             # NULL bulk String
             if data_size == -1:
-                return BulkString(None), 5
-            content_saparator = buffer.find(_MSG_SEPARATOR, separator + 1)
-            if (
-                data_size >= 0
-                and content_saparator != -1
-                and separator + _MSG_SEPARATOR_SIZE + data_size + _MSG_SEPARATOR_SIZE
-            ):
-                return (
-                    BulkString(data=buffer[separator + 2 : separator + 2 + data_size]),
-                    data_size + 2 + separator + 2,
-                )
-
-            # Everything else is considered illegal
-            return None, 0
-
-        case "*":
-            if separator != -1:
-                size = int(buffer[1:separator].decode())
-                if size == -1:
-                    return Array(None), separator + _MSG_SEPARATOR_SIZE
-                if size == 0:
-                    return Array([]), separator + _MSG_SEPARATOR_SIZE
-
-                array_builder = Array([])
-
-                total_frame_size = separator + 2
-                for _ in range(size):
-                    frame, frame_size = extract_frame_from_buffer(
-                        buffer[separator + 2 :]
-                    )
-                    if frame and frame_size:
-                        array_builder.data.append(frame)
-                        separator += frame_size
-                        total_frame_size += frame_size
-                    else:
-                        return None, 0
-
-                return array_builder, total_frame_size
-    return None, 0
+                return BulkString(None), end, 0
+            if data_size < 0:
+                raise ProtocolError("invalid bulk length")
+            data_end = end + data_size
+            if len(buffer) < data_end + _MSG_SEPARATOR_SIZE:
+                return None, pos, 0
+            if view[data_end : data_end + _MSG_SEPARATOR_SIZE] != _MSG_SEPARATOR:
+                raise ProtocolError("bulk string not terminated by CRLF")
+            return (
+                BulkString(view[end:data_end].tobytes()),
+                data_end + _MSG_SEPARATOR_SIZE,
+                0,
+            )
+
+        case 0x2A:  # *
+            try:
+                size = int(buffer[pos + 1 : separator])
+            except ValueError:
+                raise ProtocolError("invalid multibulk length")
+            if size == -1:
+                return Array(None), end, 0
+            if size < 0:
+                raise ProtocolError("invalid multibulk length")
+            return Array([]), end, size
+
+        case 0x2B:  # +
+            return SimpleString(str(view[pos + 1 : separator], "utf-8")), end, 0
+
+        case 0x2D:  # -
+            return Error(str(view[pos + 1 : separator], "utf-8")), end, 0
+
+        case 0x3A:  # :
+            try:
+                return Integer(int(buffer[pos + 1 : separator])), end, 0
+            except ValueError:
+                raise ProtocolError("invalid integer")
+
+    raise ProtocolError(f"unexpected type byte {buffer[pos]!r}")
+
+
+def _parse(buffer, pos, stack):
+    """
+    Parse the next complete frame from buffer starting at pos. Arrays are
+    built in place on the stack of [array, remaining] pairs, so a frame that
+    is split over several reads resumes where it stopped instead of being
+    parsed again from its first element.
+
+    Returns (frame, pos) with frame None when more data is needed; in that
+    case pos and stack describe the partial frame.
+    """
+    with memoryview(buffer) as view:
+        while True:
+            frame, end, pending = _read_item(buffer, view, pos)
+            if frame is None:
+                return None, pos
+            pos = end
+
+            if pending:
+                stack.append([frame, pending])
+                continue
+
+            while stack:
+                parent = stack[-1]
+                parent[0].data.append(frame)
+                parent[1] -= 1
+                if parent[1]:
+                    break
+                stack.pop()
+                frame = parent[0]
+            else:
+                return frame, pos
+
+
+class RespParser:
+    """
+    Incremental RESP parser keeping a read cursor into a single receive
+    buffer. Bytes are appended with feed() and complete frames are taken out
+    by iterating over the parser.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0
+        self._stack = []
+
+    def feed(self, data):
+        if self._pos == len(self._buffer):
+            self._buffer.clear()
+            self._pos = 0
+        elif self._pos > _COMPACT_THRESHOLD:
+            del self._buffer[: self._pos]
+            self._pos = 0
+        self._buffer += data
+
+    def get_frame(self):
+        frame, self._pos = _parse(self._buffer, self._pos, self._stack)
+        return frame
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        frame = self.get_frame()
+        if frame is None:
+            raise StopIteration
+        return frame
+
+
+def extract_frame_from_buffer(buffer):
+    try:
+        frame, frame_size = _parse(buffer, 0, [])
+    except ProtocolError:
+        return None, 0
+
+    if frame is None:
+        return None, 0
+    return frame, frame_size
 
 
 def encode_message(message):
     return message.resp_encode()
+
+
+def encode_message_into(message, buffer):
+    """Append the encoding of message to the bytearray buffer."""
+    message.encode_into(buffer)
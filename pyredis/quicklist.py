@@ -0,0 +1,259 @@
+import struct
+from bisect import bisect_right
+from sys import getsizeof
+
+from pyredis.listpack import (
+    LONG_ENTRY,
+    entry_data,
+    next_entry,
+    pack_entry,
+    previous_entry,
+)
+
+
+# A node takes no more pushes once it holds this many items or bytes, like
+# list-max-listpack-size in Redis. Small nodes keep the scans and the
+# memmoves done inside one node short.
+QUICKLIST_NODE_MAX_ITEMS = 128
+QUICKLIST_NODE_MAX_BYTES = 8192
+
+_U32 = struct.Struct("<I")
+# Per node cost besides its packed bytes: the bytearray and its slots in the
+# node and start lists, plus the start index itself.
+_NODE_OVERHEAD = getsizeof(bytearray()) + 16 + getsizeof(1 << 40)
+
+
+class QuickList:
+    """
+    List encoding modelled on the Redis quicklist: items are packed into
+    bytearray nodes of a few KB instead of being one Python object each.
+
+    Every node records the absolute index of its first item. Pushes and
+    pops only ever change the first or the last node, so the other starts
+    stay valid and an index is found by bisecting them, then scanning at
+    most one node.
+    """
+
+    __slots__ = ("_nodes", "_starts", "_end", "nbytes")
+
+    def __init__(self, items=()):
+        self._nodes = []
+        self._starts = []
+        # Absolute index one past the last item
+        self._end = 0
+        # Packed bytes held by all nodes
+        self.nbytes = 0
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return self._end - self._starts[0] if self._nodes else 0
+
+    def __iter__(self):
+        for node in self._nodes:
+            pos, end = 0, len(node)
+            while pos < end:
+                start, stop = entry_data(node, pos)
+                yield bytes(node[start:stop])
+                pos = next_entry(node, pos)
+
+    def __reversed__(self):
+        for node in reversed(self._nodes):
+            end = len(node)
+            while end:
+                pos = previous_entry(node, end)
+                start, stop = entry_data(node, pos)
+                yield bytes(node[start:stop])
+                end = pos
+
+    def __repr__(self):
+        return f"QuickList({list(self)!r})"
+
+    def copy(self):
+        clone = QuickList()
+        clone._nodes = [bytearray(node) for node in self._nodes]
+        clone._starts = list(self._starts)
+        clone._end = self._end
+        clone.nbytes = self.nbytes
+        return clone
+
+    def memory_usage(self):
+        return _QUICKLIST_SIZE + len(self._nodes) * _NODE_OVERHEAD + self.nbytes
+
+    def _count(self, n):
+        if n + 1 < len(self._starts):
+            return self._starts[n + 1] - self._starts[n]
+        return self._end - self._starts[n]
+
+    def _has_room(self, n, size):
+        return (
+            self._count(n) < QUICKLIST_NODE_MAX_ITEMS
+            and len(self._nodes[n]) + size <= QUICKLIST_NODE_MAX_BYTES
+        )
+
+    def _locate(self, index):
+        """Return the node holding item index and the item's offset in it."""
+        absolute = self._starts[0] + index
+        n = bisect_right(self._starts, absolute) - 1
+        return n, absolute - self._starts[n]
+
+    def _seek(self, n, offset):
+        """Return the position of the offset-th entry of node n."""
+        node = self._nodes[n]
+        count = self._count(n)
+        if offset <= count // 2:
+            pos = 0
+            for _ in range(offset):
+                pos = next_entry(node, pos)
+        else:
+            pos = len(node)
+            for _ in range(count - offset):
+                pos = previous_entry(node, pos)
+        return pos
+
+    def append(self, item):
+        # The hot path of RPUSH, so the tail node checks are spelled out
+        size = len(item)
+        nodes = self._nodes
+        if size < LONG_ENTRY:
+            entry_size = size + 2
+            node = nodes[-1] if nodes else None
+            if (
+                node is not None
+                and self._end - self._starts[-1] < QUICKLIST_NODE_MAX_ITEMS
+                and len(node) + entry_size <= QUICKLIST_NODE_MAX_BYTES
+            ):
+                node.append(size)
+                node += item
+                node.append(size)
+            else:
+                nodes.append(bytearray(pack_entry(item)))
+                self._starts.append(self._end)
+        else:
+            entry = pack_entry(item)
+            entry_size = len(entry)
+            if nodes and self._has_room(len(nodes) - 1, entry_size):
+                nodes[-1] += entry
+            else:
+                nodes.append(bytearray(entry))
+                self._starts.append(self._end)
+        self._end += 1
+        self.nbytes += entry_size
+        return self._end - self._starts[0]
+
+    def appendleft(self, item):
+        if not self._nodes:
+            return self.append(item)
+        entry = pack_entry(item)
+        if self._has_room(0, len(entry)):
+            self._nodes[0][:0] = entry
+            self._starts[0] -= 1
+        else:
+            self._nodes.insert(0, bytearray(entry))
+            self._starts.insert(0, self._starts[0] - 1)
+        self.nbytes += len(entry)
+        return len(self)
+
+    def index(self, index):
+        """Item at index, counted from the head; the caller checks bounds."""
+        n, offset = self._locate(index)
+        node = self._nodes[n]
+        start, stop = entry_data(node, self._seek(n, offset))
+        return bytes(node[start:stop])
+
+    def set(self, index, item):
+        n, offset = self._locate(index)
+        node = self._nodes[n]
+        pos = self._seek(n, offset)
+        end = next_entry(node, pos)
+        entry = pack_entry(item)
+        node[pos:end] = entry
+        self.nbytes += len(entry) - (end - pos)
+
+    def popleft(self):
+        node = self._nodes[0]
+        start, stop = entry_data(node, 0)
+        item = bytes(node[start:stop])
+        self._drop_head(1)
+        return item
+
+    def pop(self):
+        node = self._nodes[-1]
+        start, stop = entry_data(node, previous_entry(node, len(node)))
+        item = bytes(node[start:stop])
+        self._drop_tail(1)
+        return item
+
+    def _drop_head(self, count):
+        nodes, starts = self._nodes, self._starts
+        while count and nodes:
+            head = self._count(0)
+            if head <= count:
+                self.nbytes -= len(nodes.pop(0))
+                starts.pop(0)
+                count -= head
+            else:
+                pos = self._seek(0, count)
+                del nodes[0][:pos]
+                self.nbytes -= pos
+                starts[0] += count
+                count = 0
+
+    def _drop_tail(self, count):
+        nodes, starts = self._nodes, self._starts
+        while count and nodes:
+            tail = self._count(len(nodes) - 1)
+            if tail <= count:
+                self.nbytes -= len(nodes.pop())
+                self._end = starts.pop()
+                count -= tail
+            else:
+                node = nodes[-1]
+                pos = self._seek(len(nodes) - 1, tail - count)
+                self.nbytes -= len(node) - pos
+                del node[pos:]
+                self._end -= count
+                count = 0
+
+    def trim(self, start, stop):
+        """Keep only the items in [start, stop)."""
+        self._drop_tail(len(self) - stop)
+        self._drop_head(start)
+
+    def spans(self, start, stop):
+        """
+        Iterate over the items in [start, stop) as (node, data start, data
+        end) triples, without copying them. The list must not change while
+        the iteration is in progress.
+        """
+        remaining = stop - start
+        if remaining <= 0:
+            return
+        nodes = self._nodes
+        n, offset = self._locate(start)
+        pos = self._seek(n, offset)
+        for n in range(n, len(nodes)):
+            node = nodes[n]
+            end = len(node)
+            while pos < end:
+                size = node[pos]
+                if size == LONG_ENTRY:
+                    (size,) = _U32.unpack_from(node, pos + 1)
+                    data_start = pos + 5
+                    pos = data_start + size + 5
+                else:
+                    data_start = pos + 1
+                    pos = data_start + size + 1
+                yield node, data_start, data_start + size
+                remaining -= 1
+                if not remaining:
+                    return
+            pos = 0
+
+    def range(self, start, stop):
+        """Iterate over the items in [start, stop)."""
+        for node, data_start, data_stop in self.spans(start, stop):
+            yield bytes(node[data_start:data_stop])
+
+
+_QUICKLIST_SIZE = getsizeof(QuickList())
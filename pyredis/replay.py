@@ -0,0 +1,200 @@
+import logging
+import mmap
+import os
+from time import perf_counter, time
+
+from pyredis.commands import load_command
+from pyredis.types import Array, BulkString
+
+
+REPLAY_BATCH_SIZE = 10000
+# A progress line is logged every time this many bytes have been replayed.
+REPLAY_PROGRESS_INTERVAL = 64 * 1024 * 1024
+log = logging.getLogger("pyredis")
+
+
+class TruncatedCommandError(Exception):
+    pass
+
+
+def _read_command(buffer, pos, size):
+    """
+    Read one multi bulk command, as written to the AOF, starting at pos.
+    Returns the arguments as bytes and the position after the command.
+    """
+    find = buffer.find
+    separator = find(b"\r\n", pos)
+    if separator == -1 or buffer[pos] != 0x2A:  # *
+        raise TruncatedCommandError
+    count = int(buffer[pos + 1 : separator])
+    pos = separator + 2
+
+    args = []
+    append = args.append
+    for _ in range(count):
+        separator = find(b"\r\n", pos)
+        if separator == -1 or buffer[pos] != 0x24:  # $
+            raise TruncatedCommandError
+        start = separator + 2
+        pos = start + int(buffer[pos + 1 : separator])
+        if pos + 2 > size:
+            raise TruncatedCommandError
+        append(buffer[start:pos])
+        pos += 2
+    return args, pos
+
+
+def _replay_set(datastore, args):
+    key, value = args[1], args[2]
+    if len(args) == 5 and args[3].upper() == b"PXAT":
+        deadline = int(args[4])
+        if deadline <= time() * 1000:
+            datastore.delete([key])
+        else:
+            datastore.set_with_expiry_at(key, value, deadline)
+    elif len(args) == 3:
+        datastore[key] = value
+    else:
+        return False
+    return True
+
+
+def _replay_del(datastore, args):
+    datastore.delete(args[1:])
+    return True
+
+
+def _replay_incr(datastore, args):
+    datastore.incr(args[1])
+    return True
+
+
+def _replay_decr(datastore, args):
+    datastore.decr(args[1])
+    return True
+
+
+def _replay_incrby(datastore, args):
+    datastore.incr_by(args[1], int(args[2]))
+    return True
+
+
+def _replay_decrby(datastore, args):
+    datastore.incr_by(args[1], -int(args[2]))
+    return True
+
+
+def _replay_lpush(datastore, args):
+    key = args[1]
+    for item in args[2:]:
+        datastore.prepend(key, item)
+    return True
+
+
+def _replay_rpush(datastore, args):
+    key = args[1]
+    for item in args[2:]:
+        datastore.append(key, item)
+    return True
+
+
+_REPLAY_HANDLERS = {
+    b"SET": _replay_set,
+    b"DEL": _replay_del,
+    b"INCR": _replay_incr,
+    b"DECR": _replay_decr,
+    b"INCRBY": _replay_incrby,
+    b"DECRBY": _replay_decrby,
+    b"LPUSH": _replay_lpush,
+    b"RPUSH": _replay_rpush,
+}
+
+
+def _apply(datastore, args):
+    handler = _REPLAY_HANDLERS.get(args[0].upper())
+    if handler is None or not handler(datastore, args):
+        # Anything without a fast path goes through the command handlers
+        load_command(Array([BulkString(a) for a in args]), datastore)
+
+
+def replay_aof(filename, datastore):
+    """
+    Replay the AOF in filename into datastore. The file is memory mapped and
+    parsed in place; commands with a fast path are applied to the datastore
+    directly, without dispatch or reply objects, and the store lock is taken
+    once per batch of REPLAY_BATCH_SIZE commands.
+
+    A command cut short at the end of the file, as left by a crash during a
+    write, is ignored with a warning, as is a MULTI ... EXEC block missing
+    its EXEC: a transaction is applied whole or not at all. Returns the
+    number of commands replayed.
+    """
+    size = os.path.getsize(filename)
+    if size == 0:
+        return 0
+
+    start = perf_counter()
+    commands = 0
+    next_progress = REPLAY_PROGRESS_INTERVAL
+    # Commands of the MULTI block being read, held back until its EXEC
+    transaction = None
+    with open(filename, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buffer:
+        pos = 0
+        while pos < size:
+            with datastore._lock:
+                for _ in range(REPLAY_BATCH_SIZE):
+                    if pos >= size:
+                        break
+                    try:
+                        args, end = _read_command(buffer, pos, size)
+                    except (TruncatedCommandError, ValueError):
+                        log.warning(
+                            "Ignoring truncated or invalid AOF tail at byte %d of %d",
+                            pos,
+                            size,
+                        )
+                        pos = size
+                        break
+                    pos = end
+                    commands += 1
+                    match args[0].upper():
+                        case b"MULTI":
+                            transaction = []
+                        case b"EXEC" if transaction is not None:
+                            for queued in transaction:
+                                _apply(datastore, queued)
+                            transaction = None
+                        case _ if transaction is not None:
+                            transaction.append(args)
+                        case _:
+                            _apply(datastore, args)
+
+            if pos >= next_progress:
+                next_progress += REPLAY_PROGRESS_INTERVAL
+                elapsed = perf_counter() - start
+                log.info(
+                    "AOF replay: %d/%d MB, %d commands, %.0f commands/s",
+                    pos >> 20,
+                    size >> 20,
+                    commands,
+                    commands / elapsed,
+                )
+
+    if transaction is not None:
+        log.warning(
+            "Ignoring %d commands of a transaction without EXEC at the end of the AOF",
+            len(transaction),
+        )
+
+    elapsed = perf_counter() - start
+    log.info(
+        "AOF replay finished: %d commands, %d bytes in %.2fs (%.0f commands/s, %.1f MB/s)",
+        commands,
+        size,
+        elapsed,
+        commands / elapsed if elapsed else 0,
+        size / elapsed / (1 << 20) if elapsed else 0,
+    )
+    return commands
@@ -2,18 +2,21 @@ import socket
 import logging
 import threading
 
-from pyredis.protocol import extract_frame_from_buffer, encode_message
-from pyredis.commands import handle_command
+from pyredis.blocking import Blocked, wait_blocked
+from pyredis.protocol import ProtocolError, RespParser, encode_message_into
+from pyredis.types import Error
+from pyredis.commands import Transaction, handle_command
 
 RECV_SIZE = 2048
 log = logging.getLogger("pyredis")
 
 
 class Server:
-    def __init__(self, port, datastore) -> None:
+    def __init__(self, port, datastore, persister=None) -> None:
         self.port = port
         self._running = False
         self._datastore = datastore
+        self._persister = persister
 
     def run(self):
         self._running = True
@@ -36,24 +39,53 @@ class Server:
                 client_handler.start()
 
     def handle_client_connection(self, client_socket, datastore):
-        buffer = bytearray()
+        parser = RespParser()
+        transaction = Transaction()
         try:
             while True:
                 data = client_socket.recv(RECV_SIZE)
                 log.info("Received data from client")
                 if not data:
                     break
-                buffer.extend(data)
-                frame, frame_size = extract_frame_from_buffer(buffer)
-                log.info("Extracted one frame from received data")
-                if frame:
-                    buffer = buffer[frame_size:]
-                    log.info("Processing one frame")
-                    result = handle_command(frame, datastore)
-                    client_socket.send(encode_message(result))
+                parser.feed(data)
+
+                replies = bytearray()
+                protocol_error = False
+                try:
+                    for frame in parser:
+                        result = handle_command(
+                            frame, datastore, self._persister, transaction
+                        )
+                        if isinstance(result, Blocked):
+                            self._send(client_socket, replies)
+                            replies.clear()
+                            result = wait_blocked(
+                                result,
+                                lambda: handle_command(
+                                    frame, datastore, self._persister
+                                ),
+                                datastore.blocked_keys,
+                            )
+                        encode_message_into(result, replies)
+                except ProtocolError as e:
+                    encode_message_into(Error(f"ERR Protocol error: {e}"), replies)
+                    protocol_error = True
+
+                self._send(client_socket, replies)
+                if protocol_error:
+                    break
 
         finally:
             client_socket.close()
 
+    def _send(self, client_socket, replies):
+        # Group commit: the whole batch reaches the AOF before any reply.
+        if self._persister:
+            self._persister.flush()
+
+        log.info("Sending %d bytes of replies", len(replies))
+        if replies:
+            client_socket.sendall(replies)
+
     def stop(self):
         self._running = False
@@ -0,0 +1,157 @@
+from array import array
+from bisect import bisect_left
+from sys import getsizeof
+
+
+# A set of integers stays an intset while it has at most this many members,
+# see --set-max-intset-entries.
+set_max_intset_entries = 512
+
+
+class Set:
+    """
+    Set value with the two Redis encodings. A set made only of integers is
+    an intset: a sorted array('q') searched by bisection. It is converted to
+    a Python set for good once a member that is not an integer is added, or
+    once it grows past set_max_intset_entries.
+
+    Members are passed through encode_value first, so integers are ints in
+    both encodings and compare equal across sets.
+
+    The hashtable encoding keeps its members in a dense list, and _set maps
+    each member to its slot there, so SSCAN walks the list down from the end
+    as SCAN walks the keyspace: a removed member's slot is filled with the
+    last member, which the scan has already returned or has yet to reach.
+    """
+
+    __slots__ = ("_intset", "_set", "_members", "_set_bytes")
+
+    def __init__(self, members=()):
+        self._intset = array("q")
+        self._set = None
+        self._members = None
+        # Bytes used by the members of the hashtable encoding
+        self._set_bytes = 0
+        for member in members:
+            self.add(member)
+
+    def __len__(self):
+        return len(self._intset) if self._set is None else len(self._set)
+
+    def __iter__(self):
+        return iter(self._intset if self._set is None else self._members)
+
+    def __contains__(self, member):
+        if self._set is not None:
+            return member in self._set
+        if type(member) is not int:
+            return False
+        intset = self._intset
+        i = bisect_left(intset, member)
+        return i < len(intset) and intset[i] == member
+
+    def __repr__(self):
+        return f"Set({list(self)!r})"
+
+    @property
+    def encoding(self):
+        return "intset" if self._set is None else "hashtable"
+
+    def copy(self):
+        clone = Set()
+        if self._set is None:
+            clone._intset = array("q", self._intset)
+        else:
+            clone._intset = None
+            clone._set = dict(self._set)
+            clone._members = list(self._members)
+            clone._set_bytes = self._set_bytes
+        return clone
+
+    def memory_usage(self):
+        if self._set is None:
+            return _SET_SIZE + getsizeof(self._intset)
+        return (
+            _SET_SIZE
+            + getsizeof(self._set)
+            + getsizeof(self._members)
+            + self._set_bytes
+        )
+
+    def _convert(self):
+        members = list(self._intset)
+        self._members = members
+        self._set = {member: slot for slot, member in enumerate(members)}
+        self._set_bytes = sum(getsizeof(member) for member in members)
+        self._intset = None
+
+    def add(self, member):
+        """Add member. Returns True if it is new."""
+        if self._set is None:
+            if type(member) is int:
+                intset = self._intset
+                i = bisect_left(intset, member)
+                if i < len(intset) and intset[i] == member:
+                    return False
+                if len(intset) < set_max_intset_entries:
+                    intset.insert(i, member)
+                    return True
+            self._convert()
+
+        slots = self._set
+        if member in slots:
+            return False
+        slots[member] = len(self._members)
+        self._members.append(member)
+        self._set_bytes += getsizeof(member)
+        return True
+
+    def remove(self, member):
+        """Remove member. Returns True if it was there."""
+        if self._set is not None:
+            slot = self._set.pop(member, None)
+            if slot is None:
+                return False
+            last = self._members.pop()
+            if slot < len(self._members):
+                self._members[slot] = last
+                self._set[last] = slot
+            self._set_bytes -= getsizeof(member)
+            return True
+
+        if member not in self:
+            return False
+        del self._intset[bisect_left(self._intset, member)]
+        return True
+
+    def scan(self, cursor, count):
+        """
+        Return the next cursor, 0 once the walk is over, and the batch of up
+        to count members below cursor, as SSCAN. An intset is small and is
+        returned whole, as Redis does.
+        """
+        if self._set is None:
+            return 0, list(self._intset)
+        members = self._members
+        stop = len(members)
+        if cursor:
+            stop = min(cursor, stop)
+        start = max(stop - count, 0)
+        return start, members[start:stop]
+
+    def as_set(self):
+        """
+        The members as a Python set, or for the hashtable encoding a view of
+        them, which the caller must not keep past a change to this set.
+        """
+        return set(self._intset) if self._set is None else self._set.keys()
+
+    def intersection(self, members):
+        """The members of members, a set or set view, also in this set."""
+        if self._set is not None:
+            # Iterates over the smaller of the two
+            return members & self._set.keys()
+        return {member for member in members if member in self}
+
+
+_SET_SIZE = getsizeof(Set())
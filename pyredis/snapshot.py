@@ -0,0 +1,349 @@
+import gc
+import logging
+import os
+import struct
+import threading
+import zlib
+from time import perf_counter, time
+
+from pyredis.datastore import DataEntry
+from pyredis.encoding import encode_value
+from pyredis.hashes import Hash
+from pyredis.quicklist import QuickList
+from pyredis.sets import Set
+from pyredis.sortedsets import SortedSet
+
+
+# Settings used by SAVE, BGSAVE and the load at startup, see --dbfilename.
+dbfilename = "dump.rdb"
+rdbchecksum = True
+
+_MAGIC = b"PYRDB001"
+_TYPE_STRING = 0
+_TYPE_INT = 1
+_TYPE_LIST = 2
+_TYPE_HASH = 3
+_TYPE_SET = 4
+_TYPE_SORTED_SET = 5
+_OPCODE_EXPIRY = 0xFC
+_OPCODE_EOF = 0xFF
+_FLAG_CHECKSUM = 1
+
+_U8 = struct.Struct("<B")
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+_WRITE_CHUNK_SIZE = 1024 * 1024
+log = logging.getLogger("pyredis")
+
+_bgsave_lock = threading.Lock()
+_bgsave_in_progress = False
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, int):
+        return str(value).encode()
+    return bytes(value)
+
+
+def _is_int64(value):
+    return isinstance(value, int) and -(2**63) <= value < 2**63
+
+
+def _encode_entry(buffer, key, value, expiry):
+    if expiry:
+        buffer += _U8.pack(_OPCODE_EXPIRY)
+        buffer += _I64.pack(expiry)
+
+    if isinstance(value, QuickList):
+        buffer += _U8.pack(_TYPE_LIST)
+    elif isinstance(value, Hash):
+        buffer += _U8.pack(_TYPE_HASH)
+    elif isinstance(value, Set):
+        buffer += _U8.pack(_TYPE_SET)
+    elif isinstance(value, SortedSet):
+        buffer += _U8.pack(_TYPE_SORTED_SET)
+    elif _is_int64(value):
+        buffer += _U8.pack(_TYPE_INT)
+    else:
+        buffer += _U8.pack(_TYPE_STRING)
+
+    key = _to_bytes(key)
+    buffer += _U32.pack(len(key))
+    buffer += key
+
+    if isinstance(value, QuickList):
+        buffer += _U32.pack(len(value))
+        for item in value:
+            item = _to_bytes(item)
+            buffer += _U32.pack(len(item))
+            buffer += item
+    elif isinstance(value, Hash):
+        buffer += _U32.pack(len(value))
+        for pair in value.items():
+            for data in pair:
+                buffer += _U32.pack(len(data))
+                buffer += data
+    elif isinstance(value, Set):
+        buffer += _U32.pack(len(value))
+        for member in value:
+            member = _to_bytes(member)
+            buffer += _U32.pack(len(member))
+            buffer += member
+    elif isinstance(value, SortedSet):
+        buffer += _U32.pack(len(value))
+        for member, score in value:
+            buffer += _U32.pack(len(member))
+            buffer += member
+            buffer += _F64.pack(score)
+    elif _is_int64(value):
+        buffer += _I64.pack(value)
+    else:
+        value = _to_bytes(value)
+        buffer += _U32.pack(len(value))
+        buffer += value
+
+
+def _write(filename, entries, checksum):
+    """
+    Write (key, value, expiry) entries to filename through a temporary file
+    that replaces it atomically. Returns the number of entries written.
+    """
+    temp_filename = f"{filename}.{os.getpid()}.tmp"
+    count = 0
+    crc = 0
+    with open(temp_filename, "wb") as f:
+        buffer = bytearray(_MAGIC)
+        buffer += _U8.pack(_FLAG_CHECKSUM if checksum else 0)
+        for key, value, expiry in entries:
+            _encode_entry(buffer, key, value, expiry)
+            count += 1
+            if len(buffer) > _WRITE_CHUNK_SIZE:
+                if checksum:
+                    crc = zlib.crc32(buffer, crc)
+                f.write(buffer)
+                buffer.clear()
+
+        buffer += _U8.pack(_OPCODE_EOF)
+        if checksum:
+            crc = zlib.crc32(buffer, crc)
+        buffer += _U32.pack(crc)
+        f.write(buffer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+    return count
+
+
+def save(datastore, filename=None, checksum=None):
+    """Write a snapshot of datastore. Returns the number of keys saved."""
+    filename = filename or dbfilename
+    checksum = rdbchecksum if checksum is None else checksum
+    start = perf_counter()
+    count = _write(filename, datastore.snapshot(), checksum)
+    log.info("DB saved on disk: %d keys in %.2fs", count, perf_counter() - start)
+    return count
+
+
+def _bgsave_done(success):
+    global _bgsave_in_progress
+    with _bgsave_lock:
+        _bgsave_in_progress = False
+    if success:
+        log.info("Background saving terminated with success")
+    else:
+        log.error("Background saving failed")
+
+
+def _live_entries(datastore):
+    now = int(time() * 1000)
+    for key, item in datastore._data.items():
+        if not item.expiry or item.expiry >= now:
+            yield key, item.value, item.expiry
+
+
+def _bgsave_fork(datastore, filename, checksum):
+    # Fork with every shard locked, so the child gets a consistent copy-on-
+    # write image of the keyspace without any write half applied. The child
+    # never leaves this block: it only writes the file and exits.
+    with datastore._lock:
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                _write(filename, _live_entries(datastore), checksum)
+                status = 0
+            finally:
+                os._exit(status)
+
+    def wait_for_child():
+        _, status = os.waitpid(pid, 0)
+        _bgsave_done(os.waitstatus_to_exitcode(status) == 0)
+
+    threading.Thread(target=wait_for_child, daemon=True).start()
+
+
+def _bgsave_thread(datastore, filename, checksum):
+    entries = datastore.snapshot()
+
+    def write():
+        try:
+            _write(filename, entries, checksum)
+        except Exception:
+            log.exception("Background save failed")
+            _bgsave_done(False)
+        else:
+            _bgsave_done(True)
+
+    threading.Thread(target=write, daemon=True).start()
+
+
+def bgsave(datastore, filename=None, checksum=None):
+    """
+    Save a snapshot in the background: from a forked child, which sees a
+    copy-on-write image of the keyspace, where os.fork is available, else
+    from a thread writing a point in time copy. Returns False if a
+    background save is already running.
+    """
+    global _bgsave_in_progress
+    filename = filename or dbfilename
+    checksum = rdbchecksum if checksum is None else checksum
+    with _bgsave_lock:
+        if _bgsave_in_progress:
+            return False
+        _bgsave_in_progress = True
+
+    try:
+        if hasattr(os, "fork"):
+            _bgsave_fork(datastore, filename, checksum)
+        else:
+            _bgsave_thread(datastore, filename, checksum)
+    except Exception:
+        _bgsave_done(False)
+        raise
+    return True
+
+
+def bgsave_in_progress():
+    return _bgsave_in_progress
+
+
+def _decode_entries(data):
+    if not data.startswith(_MAGIC):
+        raise SnapshotError("Not a pyredis snapshot file")
+    pos = len(_MAGIC)
+    (flags,) = _U8.unpack_from(data, pos)
+    pos += 1
+
+    # The checksum covers everything before it, so it is verified up front
+    # and a corrupted file is never partially decoded.
+    if flags & _FLAG_CHECKSUM:
+        (expected,) = _U32.unpack_from(data, len(data) - 4)
+        if zlib.crc32(memoryview(data)[:-4]) != expected:
+            raise SnapshotError("Snapshot checksum mismatch")
+
+    read_u32 = _U32.unpack_from
+    expiry = 0
+    while True:
+        opcode = data[pos]
+        pos += 1
+        if opcode == _OPCODE_EOF:
+            break
+        if opcode == _OPCODE_EXPIRY:
+            (expiry,) = _I64.unpack_from(data, pos)
+            pos += 8
+            continue
+
+        (size,) = read_u32(data, pos)
+        key = data[pos + 4 : pos + 4 + size]
+        pos += 4 + size
+
+        if opcode == _TYPE_STRING:
+            (size,) = read_u32(data, pos)
+            value = data[pos + 4 : pos + 4 + size]
+            pos += 4 + size
+        elif opcode == _TYPE_INT:
+            (value,) = _I64.unpack_from(data, pos)
+            pos += 8
+        elif opcode == _TYPE_LIST:
+            (count,) = read_u32(data, pos)
+            pos += 4
+            value = QuickList()
+            for _ in range(count):
+                (size,) = read_u32(data, pos)
+                value.append(data[pos + 4 : pos + 4 + size])
+                pos += 4 + size
+        elif opcode == _TYPE_HASH:
+            (count,) = read_u32(data, pos)
+            pos += 4
+            value = Hash()
+            for _ in range(count):
+                (size,) = read_u32(data, pos)
+                field = data[pos + 4 : pos + 4 + size]
+                pos += 4 + size
+                (size,) = read_u32(data, pos)
+                value.set(field, data[pos + 4 : pos + 4 + size])
+                pos += 4 + size
+        elif opcode == _TYPE_SET:
+            (count,) = read_u32(data, pos)
+            pos += 4
+            value = Set()
+            for _ in range(count):
+                (size,) = read_u32(data, pos)
+                value.add(encode_value(data[pos + 4 : pos + 4 + size]))
+                pos += 4 + size
+        elif opcode == _TYPE_SORTED_SET:
+            (count,) = read_u32(data, pos)
+            pos += 4
+            value = SortedSet()
+            for _ in range(count):
+                (size,) = read_u32(data, pos)
+                pos += 4 + size
+                (score,) = _F64.unpack_from(data, pos)
+                value.add(data[pos - size : pos], score)
+                pos += 8
+        else:
+            raise SnapshotError(f"Unknown value type {opcode}")
+
+        yield key, value, expiry
+        expiry = 0
+
+    if pos + 4 != len(data):
+        raise SnapshotError("Unexpected data after the end of the snapshot")
+
+
+def load(datastore, filename=None):
+    """Load a snapshot into datastore. Returns the number of keys loaded."""
+    filename = filename or dbfilename
+    start = perf_counter()
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    now = int(time() * 1000)
+    # Every object built here lives on, so the cyclic collector would only
+    # walk the growing heap again and again; it is off until the load is done.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        try:
+            entries = [
+                (key, DataEntry(value, expiry))
+                for key, value, expiry in _decode_entries(data)
+                if not expiry or expiry >= now
+            ]
+        except (IndexError, struct.error):
+            raise SnapshotError("Snapshot file is truncated")
+        datastore.load_entries(entries)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    log.info(
+        "DB loaded from disk: %d keys in %.2fs", len(entries), perf_counter() - start
+    )
+    return len(entries)
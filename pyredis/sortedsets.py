@@ -0,0 +1,261 @@
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+from sys import getsizeof
+
+
+# Target number of items per block. Blocks are split at twice this size and
+# merged with a neighbour below half of it.
+BLOCK_SIZE = 512
+
+_score_of = itemgetter(0)
+_member_of = itemgetter(1)
+# A (score, member) tuple, its float score and the block's pointer to it
+_ITEM_SIZE = getsizeof((0.0, b"")) + getsizeof(0.0) + 8
+
+
+def format_score(score):
+    """Format a score as Redis replies with it: shortest form, no trailing .0."""
+    text = repr(score)
+    if text.endswith(".0"):
+        text = text[:-2]
+    return text.encode()
+
+
+class SortedSet:
+    """
+    Sorted set value: a dict from member to score for lookups, plus the
+    (score, member) pairs kept in order in a list of sorted blocks.
+
+    The last item of every block is indexed in _maxes, so finding a pair is
+    a bisection over the blocks then one inside a block. The block lengths
+    are summed in a Fenwick tree, which turns a position in a block into a
+    rank, and a rank back into a block, in O(log n). A range of k items
+    therefore costs O(log n + k).
+    """
+
+    __slots__ = ("_scores", "_blocks", "_maxes", "_tree", "_member_bytes")
+
+    def __init__(self, pairs=()):
+        self._scores = {}
+        self._blocks = []
+        self._maxes = []
+        self._tree = [0]
+        self._member_bytes = 0
+        for member, score in pairs:
+            self.add(member, score)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __iter__(self):
+        """The (member, score) pairs in order."""
+        for block in self._blocks:
+            for score, member in block:
+                yield member, score
+
+    def __repr__(self):
+        return f"SortedSet({list(self)!r})"
+
+    def copy(self):
+        clone = SortedSet()
+        clone._scores = dict(self._scores)
+        clone._blocks = [list(block) for block in self._blocks]
+        clone._maxes = list(self._maxes)
+        clone._tree = list(self._tree)
+        clone._member_bytes = self._member_bytes
+        return clone
+
+    def memory_usage(self):
+        blocks = self._blocks
+        return (
+            _SORTED_SET_SIZE
+            + getsizeof(self._scores)
+            + self._member_bytes
+            + len(self._scores) * _ITEM_SIZE
+            + len(blocks) * 64
+        )
+
+    def _build_tree(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _grow(self, i, delta):
+        tree = self._tree
+        size = len(tree)
+        i += 1
+        while i < size:
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i):
+        """Number of items in the blocks before block i."""
+        tree = self._tree
+        total = 0
+        while i:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, rank):
+        """The block holding the item at rank and the item's offset in it."""
+        tree = self._tree
+        size = len(tree)
+        i = 0
+        step = 1 << (size.bit_length() - 1)
+        while step:
+            j = i + step
+            if j < size and tree[j] <= rank:
+                i = j
+                rank -= tree[j]
+            step >>= 1
+        return i, rank
+
+    def _bisect(self, value, right=False, key=None):
+        """Rank of value among the items, as bisect_left or bisect_right."""
+        search = bisect_right if right else bisect_left
+        i = search(self._maxes, value, key=key)
+        if i == len(self._maxes):
+            return len(self._scores)
+        return self._prefix(i) + search(self._blocks[i], value, key=key)
+
+    def _insert(self, item):
+        blocks, maxes = self._blocks, self._maxes
+        if not blocks:
+            blocks.append([item])
+            maxes.append(item)
+            self._build_tree()
+            return
+        i = bisect_left(maxes, item)
+        if i == len(maxes):
+            i -= 1
+            blocks[i].append(item)
+            maxes[i] = item
+        else:
+            insort(blocks[i], item)
+        block = blocks[i]
+        if len(block) > 2 * BLOCK_SIZE:
+            blocks.insert(i + 1, block[BLOCK_SIZE:])
+            del block[BLOCK_SIZE:]
+            maxes.insert(i, block[-1])
+            self._build_tree()
+        else:
+            self._grow(i, 1)
+
+    def _delete(self, item):
+        blocks, maxes = self._blocks, self._maxes
+        i = bisect_left(maxes, item)
+        block = blocks[i]
+        del block[bisect_left(block, item)]
+        if len(block) >= BLOCK_SIZE // 2:
+            maxes[i] = block[-1]
+            self._grow(i, -1)
+            return
+        if not block:
+            del blocks[i], maxes[i]
+        elif len(blocks) > 1:
+            # Merge into a neighbour, then split again if that is too big
+            if i == len(blocks) - 1:
+                i -= 1
+            blocks[i] += blocks.pop(i + 1)
+            del maxes[i + 1]
+            block = blocks[i]
+            if len(block) > 2 * BLOCK_SIZE:
+                half = len(block) // 2
+                blocks.insert(i + 1, block[half:])
+                del block[half:]
+                maxes.insert(i + 1, blocks[i + 1][-1])
+            maxes[i] = block[-1]
+        else:
+            maxes[i] = block[-1]
+        self._build_tree()
+
+    def score(self, member):
+        return self._scores.get(member)
+
+    def add(self, member, score):
+        """Set member's score. Returns its previous score, None if it is new."""
+        old = self._scores.get(member)
+        if old is not None:
+            if old == score:
+                return old
+            self._delete((old, member))
+        else:
+            self._member_bytes += getsizeof(member)
+        self._scores[member] = score
+        self._insert((score, member))
+        return old
+
+    def remove(self, member):
+        """Remove member. Returns True if it was there."""
+        score = self._scores.pop(member, None)
+        if score is None:
+            return False
+        self._member_bytes -= getsizeof(member)
+        self._delete((score, member))
+        return True
+
+    def rank(self, member):
+        """Position of member in score order, or None if it is not there."""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        return self._bisect((score, member))
+
+    def score_rank(self, score, exclusive=False, right=False):
+        """
+        Rank of the first item scored at least score, or above it if
+        exclusive. With right, the rank after the last item scored at most
+        score, or below it if exclusive.
+        """
+        return self._bisect(score, right != exclusive, _score_of)
+
+    def lex_rank(self, member, exclusive=False, right=False):
+        """As score_rank for members, when every item has the same score."""
+        return self._bisect(member, right != exclusive, _member_of)
+
+    def items(self, start, stop, reverse=False):
+        """The (member, score) pairs ranked from start to stop exclusive."""
+        if start >= stop:
+            return
+        blocks = self._blocks
+        if reverse:
+            i, offset = self._locate(stop - 1)
+            count = stop - start
+            while count > 0:
+                block = blocks[i]
+                for score, member in reversed(
+                    block[max(offset - count + 1, 0) : offset + 1]
+                ):
+                    yield member, score
+                count -= offset + 1
+                i -= 1
+                offset = len(blocks[i]) - 1 if i >= 0 else 0
+        else:
+            i, offset = self._locate(start)
+            count = stop - start
+            while count > 0:
+                block = blocks[i]
+                for score, member in block[offset : offset + count]:
+                    yield member, score
+                count -= len(block) - offset
+                i += 1
+                offset = 0
+
+    def pop(self, count, from_max=False):
+        """Remove and return up to count (member, score) pairs from one end."""
+        size = len(self._scores)
+        if from_max:
+            popped = list(self.items(max(size - count, 0), size, reverse=True))
+        else:
+            popped = list(self.items(0, min(count, size)))
+        for member, _ in popped:
+            self.remove(member)
+        return popped
+
+
+_SORTED_SET_SIZE = getsizeof(SortedSet())
@@ -2,8 +2,10 @@ from trio import SocketListener, serve_tcp, SocketStream
 import logging
 import trio
 
-from pyredis.protocol import extract_frame_from_buffer, encode_message
-from pyredis.commands import handle_command
+from pyredis.blocking import Blocked, trio_wait_blocked
+from pyredis.protocol import ProtocolError, RespParser, encode_message_into
+from pyredis.types import Error
+from pyredis.commands import Transaction, handle_command
 from pyredis.datastore import DataStore
 
 RECV_SIZE = 2048
@@ -11,10 +13,11 @@ log = logging.getLogger("pyredis")
 
 
 class TrioServer:
-    def __init__(self, port) -> None:
+    def __init__(self, port, datastore=None, persister=None) -> None:
         self.port = port
         self._running = False
-        self._datastore = DataStore()
+        self._datastore = datastore if datastore is not None else DataStore()
+        self._persister = persister
 
     async def run(self):
         self._running = True
@@ -23,7 +26,8 @@ class TrioServer:
             nursery.start_soon(serve_tcp, self.handle_client_connection, self.port)
 
     async def handle_client_connection(self, client_stream: SocketStream):
-        buffer = bytearray()
+        parser = RespParser()
+        transaction = Transaction()
         try:
             while True:
                 data = await client_stream.receive_some(RECV_SIZE)
@@ -31,16 +35,45 @@ class TrioServer:
                 if not data:
                     log.info("Readched EOF")
                     break
-                buffer.extend(data)
-                frame, frame_size = extract_frame_from_buffer(buffer)
-                if frame:
-                    buffer = buffer[frame_size:]
-                    result = handle_command(frame, self._datastore)
-                    await client_stream.send_all(encode_message(result))
+                parser.feed(data)
+
+                replies = bytearray()
+                protocol_error = False
+                try:
+                    for frame in parser:
+                        result = handle_command(
+                            frame, self._datastore, self._persister, transaction
+                        )
+                        if isinstance(result, Blocked):
+                            await self._send(client_stream, replies)
+                            replies.clear()
+                            result = await trio_wait_blocked(
+                                result,
+                                lambda: handle_command(
+                                    frame, self._datastore, self._persister
+                                ),
+                                self._datastore.blocked_keys,
+                            )
+                        encode_message_into(result, replies)
+                except ProtocolError as e:
+                    encode_message_into(Error(f"ERR Protocol error: {e}"), replies)
+                    protocol_error = True
+
+                await self._send(client_stream, replies)
+                if protocol_error:
+                    break
 
         finally:
             log.info("Attempt to close stream")
             await client_stream.aclose()
 
+    async def _send(self, client_stream, replies):
+        # Group commit: the whole batch reaches the AOF before any reply.
+        if self._persister:
+            self._persister.flush()
+
+        if replies:
+            await client_stream.send_all(replies)
+
     def stop(self):
         self._running = False
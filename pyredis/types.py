@@ -2,47 +2,108 @@ from collections.abc import Sequence
 from dataclasses import dataclass
 
 
+_CRLF = b"\r\n"
+
+# Replies sent on almost every request are encoded once and shared.
+_SIMPLE_STRING_CACHE = {
+    "OK": b"+OK\r\n",
+    "PONG": b"+PONG\r\n",
+    "QUEUED": b"+QUEUED\r\n",
+}
+_INTEGER_CACHE = tuple(b":%d\r\n" % i for i in range(10000))
+_BULK_HEADER_CACHE = tuple(b"$%d\r\n" % i for i in range(1024))
+_ARRAY_HEADER_CACHE = tuple(b"*%d\r\n" % i for i in range(1024))
+_NULL_BULK_STRING = b"$-1\r\n"
+_NULL_ARRAY = b"*-1\r\n"
+
+
+def _to_bytes(data):
+    if isinstance(data, str):
+        return data.encode()
+    # Integer encoded values from the store
+    if type(data) is int:
+        return b"%d" % data
+    return data
+
+
+def _bulk_header(size):
+    if size < 1024:
+        return _BULK_HEADER_CACHE[size]
+    return b"$%d\r\n" % size
+
+
+def _array_header(size):
+    if size < 1024:
+        return _ARRAY_HEADER_CACHE[size]
+    return b"*%d\r\n" % size
+
+
 @dataclass
 class SimpleString:
     data: str
 
+    def encode_into(self, buffer):
+        encoded = _SIMPLE_STRING_CACHE.get(self.data)
+        if encoded is None:
+            buffer += b"+"
+            buffer += _to_bytes(self.data)
+            buffer += _CRLF
+        else:
+            buffer += encoded
+
     def resp_encode(self):
-        return f"+{self.data}\r\n".encode()
+        encoded = _SIMPLE_STRING_CACHE.get(self.data)
+        if encoded is None:
+            return b"+%s\r\n" % _to_bytes(self.data)
+        return encoded
 
 
 @dataclass
 class Error:
     data: str
 
+    def encode_into(self, buffer):
+        buffer += self.resp_encode()
+
     def resp_encode(self):
-        return f"-{self.data}\r\n".encode()
+        return b"-%s\r\n" % _to_bytes(self.data)
 
 
 @dataclass
 class Integer:
     data: int
 
+    def encode_into(self, buffer):
+        buffer += self.resp_encode()
+
     def resp_encode(self):
-        return f":{self.data}\r\n".encode()
+        if 0 <= self.data < 10000:
+            return _INTEGER_CACHE[self.data]
+        return b":%d\r\n" % self.data
 
 
 @dataclass
 class BulkString:
     data: bytes
 
+    def encode_into(self, buffer):
+        data = self.data
+        # NULL bulk String
+        if data is None:
+            buffer += _NULL_BULK_STRING
+            return
+        data = _to_bytes(data)
+        buffer += _bulk_header(len(data))
+        buffer += data
+        buffer += _CRLF
+
     def resp_encode(self):
+        data = self.data
         # NULL bulk String
-        if self.data is None:
-            return "$-1\r\n".encode()
-        else:
-            if isinstance(self.data, str):
-                return f"${len(self.data)}\r\n{self.data}\r\n".encode()
-            else:
-                return (
-                    f"${len(self.data)}\r\n".encode()
-                    + bytes(self.data)
-                    + "\r\n".encode()
-                )
+        if data is None:
+            return _NULL_BULK_STRING
+        data = _to_bytes(data)
+        return b"".join((_bulk_header(len(data)), data, _CRLF))
 
 
 @dataclass
@@ -55,14 +116,68 @@ class Array(Sequence):
     def __len__(self):
         return len(self.data)
 
-    def resp_encode(self):
+    def encode_into(self, buffer):
         # NULL array
         if self.data is None:
-            return b"*-1\r\n"
-        str_representation = [
-            f"*{len(self.data)}\r\n".encode(),
-        ]
+            buffer += _NULL_ARRAY
+            return
+        buffer += _array_header(len(self.data))
         for frame in self.data:
-            str_representation.append(frame.resp_encode())
+            frame.encode_into(buffer)
+
+    def resp_encode(self):
+        buffer = bytearray()
+        self.encode_into(buffer)
+        return bytes(buffer)
+
 
-        return b"".join(str_representation)
+@dataclass
+class RawReply:
+    """
+    A reply already encoded as RESP, for replies written straight from the
+    store while its lock is held.
+    """
+
+    data: bytes
+
+    def encode_into(self, buffer):
+        buffer += self.data
+
+    def resp_encode(self):
+        return bytes(self.data)
+
+
+def encode_spans_into(buffer, count, spans):
+    """
+    Append an array of count bulk strings, given as (data, start, end)
+    slices of larger buffers, to buffer.
+    """
+    buffer += _array_header(count)
+    for data, start, end in spans:
+        buffer += _bulk_header(end - start)
+        buffer += data[start:end]
+        buffer += _CRLF
+
+
+def encode_values(values):
+    """
+    Encode values as a RESP array of bulk strings in one pass, None being a
+    null bulk string.
+    """
+    buffer = bytearray(_array_header(len(values)))
+    for value in values:
+        if value is None:
+            buffer += _NULL_BULK_STRING
+            continue
+        if type(value) is int:
+            value = b"%d" % value
+        buffer += _bulk_header(len(value))
+        buffer += value
+        buffer += _CRLF
+    return buffer
+
+
+OK = SimpleString("OK")
+PONG = SimpleString("PONG")
+QUEUED = SimpleString("QUEUED")
+NULL_BULK_STRING = BulkString(None)
@@ -0,0 +1,15 @@
+from pyredis.commands import handle_command
+from pyredis.types import Array, BulkString
+
+
+def as_command(*args):
+    """A command as the server parses it, from its arguments as bytes."""
+    return Array([BulkString(arg) for arg in args])
+
+
+def run_command(datastore, *args, persister=None):
+    return handle_command(as_command(*args), datastore, persister)
+
+
+def bulks(*items):
+    return Array([BulkString(item) for item in items])
@@ -0,0 +1,242 @@
+import asyncio
+import threading
+from time import monotonic
+
+import trio
+
+from pyredis.asyncserver import RedisServerProtocol
+from pyredis.blocking import (
+    Blocked,
+    BlockedKeys,
+    async_wait_blocked,
+    trio_wait_blocked,
+    wait_blocked,
+)
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.types import Array, BulkString, Error
+
+from helpers import as_command, run_command
+
+
+class FakeWaiter:
+    def __init__(self):
+        self.woken = False
+
+    def wake(self):
+        self.woken = True
+
+
+def test_blpop_pops_without_blocking_when_a_list_has_items():
+    datastore = DataStore()
+    run_command(datastore, b"RPUSH", b"b", b"1", b"2")
+    assert run_command(datastore, b"BLPOP", b"a", b"b", b"0") == Array(
+        [BulkString(b"b"), BulkString(b"1")]
+    )
+    assert run_command(datastore, b"BRPOP", b"a", b"b", b"0") == Array(
+        [BulkString(b"b"), BulkString(b"2")]
+    )
+    assert run_command(datastore, b"BLPOP", b"a", b"b", b"1.5") == Blocked(
+        [b"a", b"b"], 1.5, Array(None)
+    )
+
+
+def test_blocking_argument_errors():
+    datastore = DataStore()
+    assert run_command(datastore, b"BLPOP", b"a", b"x") == Error(
+        "ERR timeout is not a float or out of range"
+    )
+    assert run_command(datastore, b"BRPOP", b"a", b"-1") == Error(
+        "ERR timeout is negative"
+    )
+    assert run_command(datastore, b"BLMOVE", b"a", b"b", b"UP", b"LEFT", b"0") == Error(
+        "ERR syntax error"
+    )
+    run_command(datastore, b"SET", b"s", b"v")
+    assert run_command(datastore, b"BLPOP", b"s", b"0") == Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+
+
+def test_lmove_and_blmove():
+    datastore = DataStore()
+    run_command(datastore, b"RPUSH", b"src", b"a", b"b", b"c")
+    assert run_command(datastore, b"LMOVE", b"src", b"dst", b"LEFT", b"RIGHT") == (
+        BulkString(b"a")
+    )
+    assert run_command(
+        datastore, b"BLMOVE", b"src", b"dst", b"right", b"left", b"0"
+    ) == (BulkString(b"c"))
+    assert datastore.lrange(b"dst", 0, -1) == [b"c", b"a"]
+    assert run_command(datastore, b"LMOVE", b"src", b"src", b"LEFT", b"RIGHT") == (
+        BulkString(b"b")
+    )
+    assert datastore.lrange(b"src", 0, -1) == [b"b"]
+    assert run_command(datastore, b"LMOVE", b"empty", b"dst", b"LEFT", b"LEFT") == (
+        BulkString(None)
+    )
+
+    run_command(datastore, b"SET", b"s", b"v")
+    assert run_command(datastore, b"LMOVE", b"src", b"s", b"LEFT", b"LEFT") == Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+    assert datastore.lrange(b"src", 0, -1) == [b"b"]
+
+
+def test_blocking_pops_are_logged_as_plain_pops(tmp_path):
+    datastore = DataStore()
+    persister = AppendOnlyPersister(str(tmp_path / "test.aof"), "always", datastore)
+    handle_command(as_command(b"RPUSH", b"q", b"1", b"2"), datastore, persister)
+    handle_command(as_command(b"BLPOP", b"q", b"0"), datastore, persister)
+    handle_command(
+        as_command(b"BLMOVE", b"q", b"d", b"LEFT", b"LEFT", b"0"), datastore, persister
+    )
+    handle_command(as_command(b"BLPOP", b"q", b"0"), datastore, persister)
+    persister.flush()
+
+    replayed = DataStore()
+    AppendOnlyPersister.restore_from_file(str(tmp_path / "test.aof"), replayed)
+    assert b"q" not in replayed
+    assert replayed.lrange(b"d", 0, -1) == [b"2"]
+
+
+def test_signal_wakes_the_longest_waiting_client():
+    blocked_keys = BlockedKeys()
+    first, second, other = FakeWaiter(), FakeWaiter(), FakeWaiter()
+    blocked_keys.add([b"a", b"b"], first)
+    blocked_keys.add([b"a"], second)
+    blocked_keys.add([b"b"], other)
+
+    blocked_keys.signal(b"a")
+    assert (first.woken, second.woken, other.woken) == (True, False, False)
+    # first was already woken through a, so b goes to the next client
+    blocked_keys.signal(b"b")
+    assert other.woken and not second.woken
+
+    blocked_keys.remove([b"a"], second)
+    assert not blocked_keys
+
+
+def test_push_wakes_a_blocked_thread():
+    datastore = DataStore()
+    command = as_command(b"BLPOP", b"q", b"0")
+    blocked = handle_command(command, datastore, None)
+    results = []
+
+    def consumer():
+        def retry():
+            return handle_command(command, datastore, None)
+
+        results.append(wait_blocked(blocked, retry, datastore.blocked_keys))
+        results.append(monotonic())
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    while not datastore.blocked_keys:
+        pass
+    pushed = monotonic()
+    run_command(datastore, b"RPUSH", b"q", b"job")
+    thread.join(1)
+
+    assert results[0] == Array([BulkString(b"q"), BulkString(b"job")])
+    assert results[1] - pushed < 0.05
+    assert not datastore.blocked_keys
+    assert b"q" not in datastore
+
+
+def test_blocked_thread_times_out():
+    datastore = DataStore()
+    command = as_command(b"BRPOP", b"q", b"0.02")
+    blocked = handle_command(command, datastore, None)
+    start = monotonic()
+    result = wait_blocked(
+        blocked,
+        lambda: handle_command(command, datastore, None),
+        datastore.blocked_keys,
+    )
+    assert result == Array(None)
+    assert monotonic() - start >= 0.02
+    assert not datastore.blocked_keys
+
+
+def test_async_clients_are_served_in_order():
+    datastore = DataStore()
+
+    async def consume(name):
+        command = as_command(b"BLPOP", b"q", b"0")
+        return name, await async_wait_blocked(
+            handle_command(command, datastore, None),
+            lambda: handle_command(command, datastore, None),
+            datastore.blocked_keys,
+        )
+
+    async def run():
+        consumers = [asyncio.ensure_future(consume(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        run_command(datastore, b"RPUSH", b"q", b"a", b"b", b"c")
+        return await asyncio.gather(*consumers)
+
+    results = asyncio.run(run())
+    assert [(name, reply[1].data) for name, reply in results] == [
+        (0, b"a"),
+        (1, b"b"),
+        (2, b"c"),
+    ]
+    assert not datastore.blocked_keys
+
+
+def test_async_protocol_holds_pipelined_commands_while_blocked():
+    class FakeTransport:
+        def __init__(self):
+            self.writes = []
+
+        def write(self, data):
+            self.writes.append(bytes(data))
+
+        def close(self):
+            pass
+
+    datastore = DataStore()
+
+    async def run():
+        protocol = RedisServerProtocol(datastore, None)
+        protocol.connection_made(FakeTransport())
+        protocol.data_received(
+            b"*1\r\n$4\r\nPING\r\n*3\r\n$5\r\nBLPOP\r\n$1\r\nq\r\n$1\r\n0\r\n"
+            b"*1\r\n$4\r\nPING\r\n"
+        )
+        await asyncio.sleep(0)
+        writes = list(protocol.transport.writes)
+        run_command(datastore, b"LPUSH", b"q", b"job")
+        await asyncio.sleep(0)
+        return writes, protocol.transport.writes
+
+    before, after = asyncio.run(run())
+    assert before == [b"+PONG\r\n"]
+    assert after == [b"+PONG\r\n", b"*2\r\n$1\r\nq\r\n$3\r\njob\r\n+PONG\r\n"]
+
+
+def test_trio_blmove_wakes_on_push():
+    datastore = DataStore()
+    command = as_command(b"BLMOVE", b"src", b"dst", b"LEFT", b"RIGHT", b"1")
+    results = []
+
+    async def consume():
+        results.append(
+            await trio_wait_blocked(
+                handle_command(command, datastore, None),
+                lambda: handle_command(command, datastore, None),
+                datastore.blocked_keys,
+            )
+        )
+
+    async def run():
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(consume)
+            await trio.sleep(0.01)
+            run_command(datastore, b"RPUSH", b"src", b"item")
+
+    trio.run(run)
+    assert results == [BulkString(b"item")]
+    assert datastore.lrange(b"dst", 0, -1) == [b"item"]
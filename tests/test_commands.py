@@ -1,25 +1,29 @@
 import pytest
+import sys
+import threading
 from time import sleep, time_ns
 
-from pyredis.commands import handle_command
+from pyredis.commands import handle_command, lookup_command
 from pyredis.persistence import AppendOnlyPersister
-from pyredis.datastore import DataStore
+from pyredis.protocol import RespParser
+from pyredis.datastore import DataEntry, DataStore, VolatileKeys
 from pyredis.types import Array, BulkString, Error, Integer, SimpleString
 
-from collections import deque
+from helpers import run_command
 
 
 @pytest.fixture(scope="module")
 def datastore():
     datastore = DataStore()
-    datastore["always_exist_key"] = "default"
+    datastore[b"always_exist_key"] = b"default"
     return datastore
 
 
 @pytest.fixture(scope="module")
-def persister():
-    persister = AppendOnlyPersister("test.aof")
-    return persister
+def persister(tmp_path_factory):
+    persister = AppendOnlyPersister(tmp_path_factory.mktemp("aof") / "test.aof")
+    yield persister
+    persister.close()
 
 
 @pytest.mark.parametrize(
@@ -30,7 +34,7 @@ def persister():
             Array([BulkString(b"ECHO")]),
             Error("ERR wrong number of arguments for 'echo' command"),
         ),
-        (Array([BulkString(b"echo"), BulkString(b"Hello")]), BulkString("Hello")),
+        (Array([BulkString(b"echo"), BulkString(b"Hello")]), BulkString(b"Hello")),
         (
             Array([BulkString(b"echo"), BulkString(b"Hello"), BulkString("World")]),
             Error("ERR wrong number of arguments for 'echo' command"),
@@ -38,7 +42,7 @@ def persister():
         # Ping Tests
         (Array([BulkString(b"ping")]), SimpleString("PONG")),
         # Set Tests
-        (Array([BulkString(b"ping"), BulkString(b"Hello")]), BulkString("Hello")),
+        (Array([BulkString(b"ping"), BulkString(b"Hello")]), BulkString(b"Hello")),
         (
             Array([BulkString(b"set")]),
             Error("ERR wrong number of arguments for 'set' command"),
@@ -53,7 +57,7 @@ def persister():
         ),
         (
             Array([BulkString(b"get"), SimpleString(b"always_exist_key")]),
-            BulkString("default"),
+            BulkString(b"default"),
         ),
         # Set with Expire Errors
         (
@@ -179,8 +183,8 @@ def test_get_with_expiry(datastore, persister):
 
 def test_set_with_expiry(persister):
     datastore = DataStore()
-    key = "key"
-    value = "value"
+    key = b"key"
+    value = b"value"
     ex = 1
     px = 100
 
@@ -209,6 +213,35 @@ def test_set_with_expiry(persister):
     assert diff < 10000
 
 
+@pytest.mark.parametrize(
+    "mode, expiry",
+    [
+        (b"EX", b"0"),
+        (b"PX", b"0"),
+        (b"EX", b"-1"),
+        (b"PX", b"-100"),
+        (b"EXAT", b"0"),
+        (b"PXAT", b"-1"),
+        (b"EX", b"9223372036854776"),
+        (b"EX", b"9223372036854000"),
+        (b"PX", b"9223372036854775807"),
+        (b"EXAT", b"9223372036854776"),
+    ],
+)
+def test_set_rejects_invalid_expire_times(mode, expiry):
+    datastore = DataStore()
+    assert run_command(datastore, b"SET", b"k", b"v", mode, expiry) == Error(
+        "ERR invalid expire time in 'set' command"
+    )
+    assert b"k" not in datastore
+    assert run_command(datastore, b"SET", b"k", b"v", b"FOO", b"0") == Error(
+        "ERR syntax error"
+    )
+    assert run_command(
+        datastore, b"SET", b"k", b"v", b"PXAT", b"9223372036854775807"
+    ) == SimpleString("OK")
+
+
 def test_get_with_expiry(persister):
     datastore = DataStore()
     key = "key"
@@ -276,6 +309,164 @@ def test_handle_decr(persister):
     assert result == Integer(0)
 
 
+def test_integer_values_are_int_encoded():
+    datastore = DataStore()
+    run_command(datastore, b"SET", b"n", b"41")
+    run_command(datastore, b"SET", b"padded", b"041")
+    assert datastore._data[b"n"].value == 41
+    assert datastore._data[b"padded"].value == b"041"
+    assert run_command(datastore, b"INCR", b"n") == Integer(42)
+    assert run_command(datastore, b"GET", b"n").resp_encode() == b"$2\r\n42\r\n"
+
+
+def test_incrby_decrby():
+    datastore = DataStore()
+    assert run_command(datastore, b"INCRBY", b"n", b"10") == Integer(10)
+    assert run_command(datastore, b"DECRBY", b"n", b"15") == Integer(-5)
+    assert run_command(datastore, b"DECR", b"missing") == Integer(-1)
+    for amount in (b"x", b"1_000", b" 1", b"1 ", b"+1", b"01", b"-0", b"1.0", b""):
+        assert run_command(datastore, b"INCRBY", b"n", amount) == Error(
+            "ERR value is not an integer or out of range"
+        )
+    assert run_command(datastore, b"DECRBY", b"n", b"9223372036854775808") == Error(
+        "ERR value is not an integer or out of range"
+    )
+    assert run_command(datastore, b"GET", b"n") == BulkString(-5)
+    for value in (b" 5", b"05", b"+5", b"1_0", b"5 ", b"-0"):
+        run_command(datastore, b"SET", b"s", value)
+        assert run_command(datastore, b"INCR", b"s") == Error(
+            "ERR value is not an integer or out of range"
+        )
+        assert run_command(datastore, b"GET", b"s") == BulkString(value)
+    run_command(datastore, b"SET", b"max", b"9223372036854775807")
+    assert run_command(datastore, b"INCR", b"max") == Error(
+        "ERR increment or decrement would overflow"
+    )
+
+
+def test_incr_keeps_ttl():
+    datastore = DataStore()
+    run_command(datastore, b"SET", b"n", b"1", b"EX", b"100")
+    run_command(datastore, b"INCR", b"n")
+    assert datastore._data[b"n"].expiry
+
+
+def test_incrbyfloat():
+    datastore = DataStore()
+    run_command(datastore, b"SET", b"f", b"10.5")
+    assert run_command(datastore, b"INCRBYFLOAT", b"f", b"0.1") == BulkString(b"10.6")
+    assert run_command(datastore, b"INCRBYFLOAT", b"f", b"-0.6") == BulkString(b"10")
+    assert datastore._data[b"f"].value == 10
+    assert run_command(datastore, b"INCRBYFLOAT", b"f", b"1e3") == BulkString(b"1010")
+    run_command(datastore, b"SET", b"s", b"abc")
+    assert run_command(datastore, b"INCRBYFLOAT", b"s", b"1") == Error(
+        "ERR value is not a valid float"
+    )
+    for value in (b"1_0.5", b" 2 ", b"2\n", b"nan"):
+        run_command(datastore, b"SET", b"s", value)
+        assert run_command(datastore, b"INCRBYFLOAT", b"s", b"1") == Error(
+            "ERR value is not a valid float"
+        )
+
+
+def test_getset():
+    datastore = DataStore()
+    assert run_command(datastore, b"GETSET", b"k", b"1") == BulkString(None)
+    run_command(datastore, b"INCR", b"k")
+    run_command(datastore, b"SET", b"t", b"x", b"EX", b"100")
+    assert run_command(datastore, b"GETSET", b"k", b"0").resp_encode() == b"$1\r\n2\r\n"
+    assert run_command(datastore, b"GETSET", b"t", b"y") == BulkString(b"x")
+    assert not datastore._data[b"t"].expiry
+    run_command(datastore, b"RPUSH", b"l", b"a")
+    assert run_command(datastore, b"GETSET", b"l", b"y") == Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+
+
+def test_mget():
+    datastore = DataStore(shards=4)
+    run_command(datastore, b"SET", b"a", b"1")
+    run_command(datastore, b"INCR", b"a")
+    run_command(datastore, b"SET", b"b", b"x", b"PX", b"1")
+    run_command(datastore, b"RPUSH", b"l", b"item")
+    sleep(0.01)
+    reply = run_command(datastore, b"MGET", b"a", b"b", b"l", b"missing", b"a")
+    assert reply.resp_encode() == b"*5\r\n$1\r\n2\r\n$-1\r\n$-1\r\n$-1\r\n$1\r\n2\r\n"
+    assert b"b" not in datastore
+
+
+def test_mset_and_msetnx(tmp_path):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename)
+    datastore = DataStore(shards=4)
+    run_command(datastore, b"SET", b"t", b"old", b"EX", b"100")
+    mset = Array([BulkString(a) for a in (b"MSET", b"a", b"1", b"t", b"2")])
+    assert handle_command(mset, datastore, persister) == SimpleString("OK")
+    assert datastore.mget([b"a", b"t"]) == [1, 2]
+    assert not datastore._data[b"t"].expiry
+    assert run_command(datastore, b"MSET", b"a", b"1", b"b") == Error(
+        "ERR wrong number of arguments for 'mset' command"
+    )
+    persister.close()
+    # One record for the whole batch
+    assert filename.read_bytes() == mset.resp_encode()
+
+    assert run_command(datastore, b"MSETNX", b"new", b"1", b"a", b"9") == Integer(0)
+    assert datastore.mget([b"new", b"a"]) == [None, 1]
+    assert run_command(datastore, b"MSETNX", b"new", b"1", b"other", b"2") == Integer(1)
+    assert datastore.mget([b"new", b"other"]) == [1, 2]
+
+
+def test_data_entry_has_no_instance_dict():
+    assert not hasattr(DataEntry(b"v"), "__dict__")
+
+
+def test_used_memory_tracks_writes():
+    datastore = DataStore(shards=4)
+    run_command(datastore, b"SET", b"s", b"x" * 100)
+    run_command(datastore, b"SET", b"s", b"y" * 10)
+    run_command(datastore, b"INCRBY", b"n", b"1000000000000")
+    run_command(datastore, b"INCRBYFLOAT", b"f", b"1.5")
+    run_command(datastore, b"RPUSH", b"l", b"a", b"b")
+    run_command(datastore, b"LPUSH", b"l", b"c")
+    run_command(datastore, b"GETSET", b"g", b"v")
+    expected = sum(
+        datastore.memory_usage(key) for key in (b"s", b"n", b"f", b"l", b"g")
+    )
+    assert datastore.used_memory() == expected
+
+    run_command(datastore, b"DEL", b"s", b"n", b"f", b"l", b"g")
+    assert datastore.used_memory() == 0
+
+
+def test_memory_usage_command():
+    datastore = DataStore()
+    run_command(datastore, b"SET", b"k", b"x" * 1000)
+    usage = run_command(datastore, b"MEMORY", b"USAGE", b"k")
+    assert isinstance(usage, Integer) and usage.data > 1000
+    assert run_command(datastore, b"MEMORY", b"USAGE", b"missing") == BulkString(None)
+    assert isinstance(run_command(datastore, b"MEMORY", b"DOCTOR"), Error)
+
+
+def test_info_memory():
+    datastore = DataStore()
+    run_command(datastore, b"SET", b"k", b"v")
+    info = run_command(datastore, b"INFO", b"memory").data.decode()
+    assert info.startswith("# Memory\r\n")
+    assert f"used_memory:{datastore.used_memory()}\r\n" in info
+    assert run_command(datastore, b"INFO", b"nosuchsection") == BulkString(b"")
+
+
+def test_arguments_that_are_not_utf8_are_replied_to():
+    datastore = DataStore()
+    assert run_command(datastore, b"INFO", b"\xff") == BulkString(b"")
+    for command in (b"MEMORY", b"COMMAND", b"FUNCTION"):
+        reply = run_command(datastore, command, b"\xff")
+        assert reply.data.startswith("ERR unknown subcommand '\ufffd'")
+    reply = run_command(datastore, b"\xff", b"\xfe")
+    assert reply.data.startswith("ERR unknown command '\ufffd'")
+
+
 # Lpush Tests
 def test_handle_lpush_lrange(persister):
     datastore = DataStore()
@@ -303,7 +494,10 @@ def test_handle_lpush_lrange(persister):
         datastore,
         persister,
     )
-    assert result == Array(data=[BulkString("first"), BulkString("second")])
+    assert (
+        result.resp_encode()
+        == Array(data=[BulkString(b"first"), BulkString(b"second")]).resp_encode()
+    )
 
 
 # Rpush Tests
@@ -333,7 +527,204 @@ def test_handle_rpush_lrange(persister):
         datastore,
         persister,
     )
-    assert result == Array(data=[BulkString("first"), BulkString("second")])
+    assert (
+        result.resp_encode()
+        == Array(data=[BulkString(b"first"), BulkString(b"second")]).resp_encode()
+    )
+
+
+def test_list_commands():
+    datastore = DataStore()
+    assert run_command(
+        datastore, b"RPUSH", b"l", b"a", b"b", b"c", b"d", b"e"
+    ) == Integer(5)
+    assert run_command(datastore, b"LLEN", b"l") == Integer(5)
+    assert run_command(datastore, b"LLEN", b"missing") == Integer(0)
+    assert run_command(datastore, b"LINDEX", b"l", b"1") == BulkString(b"b")
+    assert run_command(datastore, b"LINDEX", b"l", b"-1") == BulkString(b"e")
+    assert run_command(datastore, b"LINDEX", b"l", b"5") == BulkString(None)
+
+    assert run_command(datastore, b"LSET", b"l", b"-2", b"D") == SimpleString("OK")
+    assert run_command(datastore, b"LINDEX", b"l", b"3") == BulkString(b"D")
+    assert run_command(datastore, b"LSET", b"l", b"9", b"x") == Error(
+        "ERR index out of range"
+    )
+    assert run_command(datastore, b"LSET", b"missing", b"0", b"x") == Error(
+        "ERR no such key"
+    )
+
+    assert run_command(datastore, b"LPOP", b"l") == BulkString(b"a")
+    assert run_command(datastore, b"RPOP", b"l", b"2") == Array(
+        [BulkString(b"e"), BulkString(b"D")]
+    )
+    assert run_command(datastore, b"LPOP", b"missing") == BulkString(None)
+    assert run_command(datastore, b"LPOP", b"l", b"-1") == Error(
+        "ERR value is out of range, must be positive"
+    )
+
+
+@pytest.mark.parametrize(
+    "start, stop, expected",
+    [
+        (0, -1, range(10)),
+        (0, 0, range(1)),
+        (-3, -1, range(7, 10)),
+        (2, 4, range(2, 5)),
+        (-100, 2, range(3)),
+        (8, 100, range(8, 10)),
+        (5, 2, []),
+        (10, 20, []),
+        (-1, -2, []),
+    ],
+)
+def test_lrange_index_rules(start, stop, expected):
+    datastore = DataStore()
+    items = [b"item:%d" % i for i in range(10)]
+    run_command(datastore, b"RPUSH", b"l", *items)
+    reply = run_command(datastore, b"LRANGE", b"l", b"%d" % start, b"%d" % stop)
+    expected = [items[i] for i in expected]
+    assert reply.resp_encode() == Array([BulkString(i) for i in expected]).resp_encode()
+    assert datastore.lrange(b"l", start, stop) == expected
+
+
+def test_lrange_missing_key_and_errors():
+    datastore = DataStore()
+    assert (
+        run_command(datastore, b"LRANGE", b"missing", b"0", b"-1").resp_encode()
+        == b"*0\r\n"
+    )
+    assert run_command(datastore, b"LRANGE", b"l", b"a", b"1") == Error(
+        "ERR value is not an integer or out of range"
+    )
+    run_command(datastore, b"SET", b"s", b"v")
+    assert run_command(datastore, b"LRANGE", b"s", b"0", b"-1") == Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+
+
+def test_lrange_is_consistent_while_the_list_changes():
+    # Switch threads often, so the writer runs in the middle of an LRANGE
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    datastore = DataStore(shards=4)
+    run_command(datastore, b"RPUSH", b"l", *[b"item:%d" % i for i in range(200)])
+    done = threading.Event()
+    errors = []
+
+    def writer():
+        while not done.is_set():
+            run_command(datastore, b"RPUSH", b"l", b"item:x", b"item:y")
+            run_command(datastore, b"LPOP", b"l")
+            run_command(datastore, b"RPOP", b"l")
+
+    def reader():
+        try:
+            for _ in range(300):
+                reply = run_command(
+                    datastore, b"LRANGE", b"l", b"0", b"-1"
+                ).resp_encode()
+                parser = RespParser()
+                parser.feed(reply)
+                frame = parser.get_frame()
+                assert len(frame.data) in (200, 201, 202)
+                assert all(item.data.startswith(b"item:") for item in frame.data)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    try:
+        for t in threads:
+            t.start()
+        threads[1].join()
+    finally:
+        done.set()
+        threads[0].join()
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+
+
+def test_ltrim_and_empty_lists_are_deleted():
+    datastore = DataStore()
+    run_command(datastore, b"RPUSH", b"l", *[b"%d" % i for i in range(10)])
+    assert run_command(datastore, b"LTRIM", b"l", b"2", b"-3") == SimpleString("OK")
+    assert list(datastore[b"l"]) == [b"%d" % i for i in range(2, 8)]
+    assert run_command(datastore, b"LTRIM", b"l", b"5", b"1") == SimpleString("OK")
+    assert b"l" not in datastore
+
+    run_command(datastore, b"RPUSH", b"p", b"x")
+    run_command(datastore, b"RPOP", b"p", b"5")
+    assert b"p" not in datastore
+    assert datastore.used_memory() == 0
+
+    run_command(datastore, b"SET", b"s", b"v")
+    assert run_command(datastore, b"LLEN", b"s") == Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+
+
+def test_command_lookup_is_case_insensitive():
+    assert lookup_command(b"GET") is lookup_command(b"get")
+    assert lookup_command(b"GeT") is lookup_command(b"get")
+    assert lookup_command(b"nope") is None
+
+
+def test_arity_is_checked_before_the_handler():
+    result = handle_command(
+        Array([BulkString(b"GET"), BulkString(b"a"), BulkString(b"b")]),
+        DataStore(),
+        None,
+    )
+    assert result == Error("ERR wrong number of arguments for 'get' command")
+
+
+def test_command_info():
+    result = handle_command(
+        Array([BulkString(b"COMMAND"), BulkString(b"INFO"), BulkString(b"set")]),
+        DataStore(),
+        None,
+    )
+    assert result == Array(
+        [
+            Array(
+                [
+                    BulkString(b"set"),
+                    Integer(-3),
+                    Array([SimpleString("write"), SimpleString("denyoom")]),
+                    Integer(1),
+                    Integer(1),
+                    Integer(1),
+                ]
+            )
+        ]
+    )
+
+    result = handle_command(
+        Array([BulkString(b"COMMAND"), BulkString(b"INFO"), BulkString(b"nope")]),
+        DataStore(),
+        None,
+    )
+    assert result == Array([BulkString(None)])
+
+
+def test_command_count():
+    result = handle_command(
+        Array([BulkString(b"COMMAND"), BulkString(b"COUNT")]), DataStore(), None
+    )
+    assert result == Integer(
+        len(handle_command(Array([BulkString(b"COMMAND")]), DataStore(), None))
+    )
+
+
+def test_only_successful_writes_are_logged(tmp_path):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename)
+    datastore = DataStore()
+    set_command = Array([BulkString(b"SET"), BulkString(b"k"), BulkString(b"v")])
+    handle_command(set_command, datastore, persister)
+    handle_command(Array([BulkString(b"GET"), BulkString(b"k")]), datastore, persister)
+    handle_command(Array([BulkString(b"INCR"), BulkString(b"k")]), datastore, persister)
+    persister.close()
+    assert filename.read_bytes() == set_command.resp_encode()
 
 
 @pytest.fixture
@@ -365,9 +756,9 @@ def test_get_item(ds):
 
 
 def test_set_item(ds):
-    l = ds.append("key", 1)
+    l = ds.append("key", b"1")
     assert l == 1
-    assert ds["key"] == deque([1])
+    assert list(ds["key"]) == [b"1"]
 
 
 def test_incr(ds):
@@ -391,15 +782,15 @@ def test_decr(ds):
 
 
 def test_append(ds):
-    num_entries = ds.append("key", 1)
+    num_entries = ds.append("key", b"1")
     assert num_entries == 1
-    assert ds["key"] == deque([1])
+    assert list(ds["key"]) == [b"1"]
 
 
 def test_preppend(ds):
-    ds.append("key", 1)
-    ds.prepend("key", 2)
-    assert ds["key"] == deque([2, 1])
+    ds.append("key", b"1")
+    ds.prepend("key", b"2")
+    assert list(ds["key"]) == [b"2", b"1"]
 
 
 def test_expire_on_read(ds):
@@ -435,3 +826,66 @@ def test_remove_expired_keys(size, percent_expired):
 
     ds.remove_expired_keys()
     assert len(ds._data) == expected_len_after_expiry
+
+
+def test_sharded_datastore():
+    ds = DataStore(shards=8)
+    for i in range(100):
+        ds[f"k{i}"] = i
+    assert ds.exists([f"k{i}" for i in range(0, 200, 2)]) == 50
+    assert ds.delete(["k1", "k2", "missing"]) == 2
+    assert "k1" not in ds
+    assert ds["k3"] == 3
+
+
+def test_sharded_datastore_concurrent_incr():
+    ds = DataStore(shards=4)
+
+    def incr_many():
+        for _ in range(1000):
+            ds.incr("counter")
+
+    threads = [threading.Thread(target=incr_many) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ds["counter"] == 8000
+
+
+def test_invalid_shard_count():
+    with pytest.raises(ValueError):
+        DataStore(shards=0)
+
+
+def test_volatile_keys_index():
+    index = VolatileKeys()
+    for key in "abcde":
+        index.add(key)
+    index.add("a")
+    index.discard("b")
+    index.discard("e")
+    index.discard("missing")
+    assert len(index) == 3
+    assert sorted(index.sample(10)) == ["a", "c", "d"]
+    assert len(index.sample(2)) == 2
+
+
+def test_volatile_keys_tracked_by_datastore():
+    ds = DataStore()
+    ds.set_with_expiry("a", "1", 10000)
+    ds.set_with_expiry("b", "1", 10000)
+    ds["plain"] = "1"
+    assert "a" in ds._volatile and "plain" not in ds._volatile
+    ds["a"] = "2"
+    ds.delete(["b"])
+    assert len(ds._volatile) == 0
+
+
+def test_remove_expired_keys_ignores_keys_without_ttl():
+    ds = DataStore()
+    _fill_ds(ds, 10000, 1)
+    assert len(ds._volatile) == 100
+    assert ds.remove_expired_keys() == 100
+    assert len(ds._data) == 9900
+    assert len(ds._volatile) == 0
@@ -0,0 +1,160 @@
+import pytest
+from time import time
+
+from pyredis import eviction
+from pyredis.commands import evict_after_load
+from pyredis.datastore import DataStore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.types import BulkString, Error, Integer, SimpleString
+
+from helpers import run_command
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(eviction, "monotonic", clock)
+    return clock
+
+
+def _fill(datastore, count, prefix=b"key"):
+    for i in range(count):
+        run_command(datastore, b"SET", b"%s:%d" % (prefix, i), b"x" * 100)
+
+
+def test_noeviction_rejects_writes():
+    datastore = DataStore(maxmemory=2000)
+    _fill(datastore, 20)
+    assert run_command(datastore, b"SET", b"more", b"x") == Error(
+        "OOM command not allowed when used memory > 'maxmemory'."
+    )
+    assert run_command(datastore, b"GET", b"key:0") == BulkString(b"x" * 100)
+    # Commands that free memory are still allowed
+    assert run_command(datastore, b"DEL", b"key:0") == Integer(1)
+
+
+@pytest.mark.parametrize(
+    "policy", ["allkeys-lru", "allkeys-lfu", "allkeys-random", "volatile-ttl"]
+)
+def test_memory_stays_bounded(policy):
+    datastore = DataStore(maxmemory=20000, maxmemory_policy=policy)
+    for i in range(1000):
+        result = run_command(
+            datastore, b"SET", b"key:%d" % i, b"x" * 100, b"EX", b"1000"
+        )
+        assert result == SimpleString("OK")
+    assert datastore.used_memory() <= 20000 + 500
+    assert datastore.evictor.evicted_keys > 900
+
+
+def test_allkeys_lru_keeps_recently_used_keys(clock):
+    datastore = DataStore(maxmemory=30000, maxmemory_policy="allkeys-lru")
+    _fill(datastore, 50, b"hot")
+    for i in range(500):
+        clock.now += 1
+        for j in range(50):
+            run_command(datastore, b"GET", b"hot:%d" % j)
+        run_command(datastore, b"SET", b"cold:%d" % i, b"x" * 100)
+    survivors = sum(b"hot:%d" % j in datastore for j in range(50))
+    assert survivors >= 45
+
+
+def test_allkeys_lfu_keeps_frequently_used_keys(clock):
+    datastore = DataStore(maxmemory=30000, maxmemory_policy="allkeys-lfu")
+    _fill(datastore, 50, b"hot")
+    for _ in range(20):
+        for j in range(50):
+            run_command(datastore, b"GET", b"hot:%d" % j)
+    _fill(datastore, 500, b"cold")
+    survivors = sum(b"hot:%d" % j in datastore for j in range(50))
+    assert survivors >= 45
+
+
+def test_volatile_policies_only_evict_keys_with_a_ttl():
+    datastore = DataStore(maxmemory=20000, maxmemory_policy="volatile-lru")
+    _fill(datastore, 50, b"persistent")
+    deadline = b"%d" % (time() * 1000 + 100000)
+    for i in range(200):
+        run_command(datastore, b"SET", b"v:%d" % i, b"x" * 100, b"PXAT", deadline)
+    assert all(b"persistent:%d" % i in datastore for i in range(50))
+
+    datastore = DataStore(maxmemory=2000, maxmemory_policy="volatile-lru")
+    _fill(datastore, 20)
+    assert isinstance(run_command(datastore, b"SET", b"more", b"x"), Error)
+
+
+def test_volatile_ttl_evicts_the_soonest_deadline_first():
+    datastore = DataStore(
+        maxmemory=2000, maxmemory_policy="volatile-ttl", maxmemory_samples=10
+    )
+    now = int(time() * 1000)
+    for i in range(10):
+        run_command(
+            datastore,
+            b"SET",
+            b"k:%d" % i,
+            b"x",
+            b"PXAT",
+            b"%d" % (now + 100000 * (i + 1)),
+        )
+    datastore.evictor.maxmemory = datastore.used_memory() - 1
+    run_command(datastore, b"SET", b"other", b"x")
+    assert b"k:0" not in datastore
+    assert all(b"k:%d" % i in datastore for i in range(1, 10))
+
+
+def test_evicted_keys_are_logged_as_deletes(tmp_path):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename)
+    datastore = DataStore(maxmemory=2000, maxmemory_policy="allkeys-random")
+    for i in range(30):
+        run_command(datastore, b"SET", b"key:%d" % i, b"x" * 100, persister=persister)
+    persister.close()
+
+    restored = DataStore()
+    AppendOnlyPersister.restore_from_file(filename, restored)
+    assert sorted(restored._data) == sorted(datastore._data)
+
+
+@pytest.mark.parametrize("policy", ["noeviction", "allkeys-lru"])
+def test_loading_never_evicts(tmp_path, policy):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename)
+    datastore = DataStore()
+    for i in range(2000):
+        run_command(datastore, b"SET", b"string:%d" % i, b"x" * 50, persister=persister)
+        run_command(datastore, b"HSET", b"hash:%d" % i, b"f", b"v", persister=persister)
+    persister.close()
+
+    maxmemory = datastore.used_memory() // 2
+    restored = DataStore(maxmemory=maxmemory, maxmemory_policy=policy)
+    AppendOnlyPersister.restore_from_file(filename, restored)
+    assert sorted(restored._data) == sorted(datastore._data)
+
+    evict_after_load(restored, None)
+    if policy == "noeviction":
+        assert len(restored._data) == 4000
+    else:
+        assert restored.used_memory() <= maxmemory
+
+
+def test_info_reports_maxmemory_and_evictions():
+    datastore = DataStore(maxmemory=2000, maxmemory_policy="allkeys-lru")
+    _fill(datastore, 30)
+    info = run_command(datastore, b"INFO").data.decode()
+    assert "maxmemory:2000\r\n" in info
+    assert "maxmemory_policy:allkeys-lru\r\n" in info
+    assert f"evicted_keys:{datastore.evictor.evicted_keys}\r\n" in info
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        DataStore(maxmemory=1, maxmemory_policy="sometimes")
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+from time import sleep
+
+import trio
+
+from pyredis.datastore import DataStore
+from pyredis.expiry import (
+    AsyncExpiryScheduler,
+    ExpiryHeap,
+    ThreadedExpiryScheduler,
+    TrioExpiryScheduler,
+)
+
+
+def test_expiry_heap_pop_due():
+    heap = ExpiryHeap()
+    deadlines = []
+    heap.listener = deadlines.append
+    heap.push(30, "c")
+    heap.push(10, "a")
+    heap.push(20, "b")
+    assert deadlines == [30, 10]
+    assert heap.pop_due(21) == [(10, "a"), (20, "b")]
+    assert heap.next_deadline() == 30
+
+
+def test_remove_due_keys():
+    ds = DataStore(precise_expiry=True)
+    for i in range(50):
+        ds.set_with_expiry(f"e{i}", "v", 5)
+    ds.set_with_expiry("later", "v", 10000)
+    ds["plain"] = "v"
+    sleep(0.02)
+    deadline = ds.remove_due_keys()
+    assert sorted(ds._data) == ["later", "plain"]
+    assert deadline == ds._data["later"].expiry
+
+
+def test_remove_due_keys_skips_overwritten_keys():
+    ds = DataStore(precise_expiry=True)
+    ds.set_with_expiry("key", "old", 5)
+    ds.set_with_expiry("key", "new", 10000)
+    sleep(0.02)
+    ds.remove_due_keys()
+    assert ds["key"] == "new"
+
+
+def test_async_expiry_scheduler():
+    ds = DataStore(precise_expiry=True)
+
+    async def run():
+        AsyncExpiryScheduler(ds, asyncio.get_running_loop()).start()
+        ds.set_with_expiry("slow", "v", 60)
+        ds.set_with_expiry("fast", "v", 20)
+        await asyncio.sleep(0.045)
+        assert list(ds._data) == ["slow"]
+        await asyncio.sleep(0.045)
+        assert not ds._data
+
+    asyncio.run(run())
+
+
+def test_threaded_expiry_scheduler():
+    ds = DataStore(precise_expiry=True)
+    scheduler = ThreadedExpiryScheduler(ds)
+    threading.Thread(target=scheduler.run, daemon=True).start()
+    ds.set_with_expiry("key", "v", 20)
+    sleep(0.1)
+    assert not ds._data
+
+
+def test_trio_expiry_scheduler():
+    ds = DataStore(precise_expiry=True)
+
+    async def run():
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(TrioExpiryScheduler(ds).run)
+            await trio.sleep(0.01)
+            ds.set_with_expiry("key", "v", 20)
+            await trio.sleep(0.06)
+            assert not ds._data
+            nursery.cancel_scope.cancel()
+
+    trio.run(run)
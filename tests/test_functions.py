@@ -0,0 +1,251 @@
+from time import time
+
+import pytest
+
+from pyredis import functions
+from pyredis.commands import Transaction, handle_command
+from pyredis.datastore import DataStore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.types import (
+    NULL_BULK_STRING,
+    Array,
+    BulkString,
+    Error,
+    Integer,
+    SimpleString,
+)
+
+from helpers import as_command, run_command
+
+LIBRARY = """
+def ratelimit(redis, keys, args):
+    count = redis.call("INCR", keys[0])
+    if count == 1:
+        redis.call("SET", keys[0], count, "EX", args[0])
+    return [count, count <= int(args[1])]
+
+
+def transfer(redis, keys, args):
+    amount = int(args[0])
+    if int(redis.call("GET", keys[0]) or 0) < amount:
+        raise FunctionError("ERR insufficient funds")
+    redis.call("DECRBY", keys[0], amount)
+    return redis.call("INCRBY", keys[1], amount)
+
+
+def peek(redis, keys, args):
+    return redis.call("MGET", *keys)
+
+
+def sneaky(redis, keys, args):
+    return redis.call("SET", keys[0], "v")
+
+
+def broken(redis, keys, args):
+    return redis.call("INCR", keys[0], "extra")
+
+
+def crash(redis, keys, args):
+    return 1 / 0
+
+
+def forbidden(redis, keys, args):
+    return redis.call(*args)
+
+
+def caught(redis, keys, args):
+    try:
+        redis.call("INCR", keys[0])
+    except FunctionError as e:
+        return str(e)
+
+
+redis.register_function("ratelimit", ratelimit)
+redis.register_function("transfer", transfer)
+redis.register_function("peek", peek, flags=["no-writes"])
+redis.register_function("sneaky", sneaky, flags=["no-writes"])
+redis.register_function("broken", broken)
+redis.register_function("crash", crash)
+redis.register_function("forbidden", forbidden)
+redis.register_function("caught", caught)
+"""
+
+
+@pytest.fixture
+def library(tmp_path):
+    path = tmp_path / "mylib.py"
+    path.write_text(LIBRARY)
+    functions.load_library(path)
+    yield path
+    functions.FUNCTIONS.clear()
+    functions.LIBRARIES.clear()
+
+
+def test_fcall(library):
+    datastore = DataStore(shards=4)
+    for count, allowed in ((1, 1), (2, 1), (3, 0)):
+        assert run_command(
+            datastore, b"FCALL", b"ratelimit", b"1", b"rl", b"10", b"2"
+        ) == Array([Integer(count), Integer(allowed)])
+    assert 0 < datastore._data[b"rl"].expiry - time() * 1000 <= 10000
+
+    datastore[b"a"] = b"10"
+    assert run_command(datastore, b"FCALL", b"transfer", b"2", b"a", b"b", b"4") == (
+        Integer(4)
+    )
+    assert run_command(datastore, b"FCALL", b"transfer", b"2", b"a", b"b", b"7") == (
+        Error("ERR insufficient funds")
+    )
+    assert (datastore[b"a"], datastore[b"b"]) == (6, 4)
+
+    assert run_command(datastore, b"FCALL_RO", b"peek", b"2", b"a", b"x") == Array(
+        [BulkString(b"6"), BulkString(None)]
+    )
+    assert run_command(datastore, b"FCALL", b"caught", b"1", b"rl") == NULL_BULK_STRING
+    assert datastore[b"rl"] == 4
+    datastore[b"s"] = b"text"
+    assert run_command(datastore, b"FCALL", b"caught", b"1", b"s") == BulkString(
+        b"ERR value is not an integer or out of range"
+    )
+
+
+def test_fcall_errors(library):
+    datastore = DataStore()
+    assert run_command(datastore, b"FCALL", b"nosuch", b"0") == Error(
+        "ERR Function not found"
+    )
+    assert run_command(datastore, b"FCALL", b"peek", b"x") == Error(
+        "ERR value is not an integer or out of range"
+    )
+    assert run_command(datastore, b"FCALL", b"peek", b"2", b"a") == Error(
+        "ERR Number of keys can't be greater than number of args"
+    )
+    assert run_command(
+        datastore, b"FCALL_RO", b"ratelimit", b"1", b"k", b"1", b"2"
+    ) == Error("ERR Can not execute a script with write flag using *_ro command.")
+    assert run_command(datastore, b"FCALL", b"sneaky", b"1", b"k") == Error(
+        "ERR Write commands are not allowed from read-only scripts"
+    )
+    assert run_command(datastore, b"FCALL", b"broken", b"1", b"k") == Error(
+        "ERR wrong number of arguments for 'incr' command"
+    )
+    assert run_command(datastore, b"FCALL", b"forbidden", b"0", b"MULTI") == Error(
+        "ERR This Redis command is not allowed from script"
+    )
+    assert run_command(datastore, b"FCALL", b"forbidden", b"0", b"NOSUCH") == Error(
+        "ERR Unknown Redis command called from script"
+    )
+    reply = run_command(datastore, b"FCALL", b"crash", b"0")
+    assert reply.data.startswith("ERR Error running function 'crash'")
+    assert b"k" not in datastore
+
+
+def test_function_list(library):
+    assert run_command(DataStore(), b"FUNCTION", b"LIST")[0] == Array(
+        [
+            BulkString(b"library_name"),
+            BulkString(b"mylib"),
+            BulkString(b"functions"),
+            Array(
+                [
+                    Array(
+                        [
+                            BulkString(b"name"),
+                            BulkString(name),
+                            BulkString(b"flags"),
+                            Array(flags),
+                        ]
+                    )
+                    for name, flags in (
+                        (b"ratelimit", []),
+                        (b"transfer", []),
+                        (b"peek", [SimpleString("no-writes")]),
+                        (b"sneaky", [SimpleString("no-writes")]),
+                        (b"broken", []),
+                        (b"crash", []),
+                        (b"forbidden", []),
+                        (b"caught", []),
+                    )
+                ]
+            ),
+        ]
+    )
+
+
+def test_load_library_errors(tmp_path, library):
+    with pytest.raises(ValueError, match="already exists"):
+        functions.load_library(library)
+
+    cases = {
+        "imports": "import os\nredis.register_function('f', lambda r, k, a: 1)",
+        "opens": "open('/etc/passwd')",
+        "empty": "x = 1",
+        "duplicate": "redis.register_function('ratelimit', lambda r, k, a: 1)",
+        "flags": "redis.register_function('g', lambda r, k, a: 1, flags=['bad'])",
+        "syntax": "def (",
+    }
+    for name, source in cases.items():
+        path = tmp_path / f"{name}.py"
+        path.write_text(source)
+        with pytest.raises(ValueError):
+            functions.load_library(path)
+    assert list(functions.LIBRARIES) == ["mylib"]
+    with pytest.raises(ValueError):
+        functions.load_library(tmp_path / "missing.py")
+
+
+def test_function_writes_are_logged_as_one_block(tmp_path, library):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename, "always")
+    datastore = DataStore()
+    datastore[b"a"] = b"10"
+    run_command(
+        datastore, b"FCALL", b"transfer", b"2", b"a", b"b", b"4", persister=persister
+    )
+    run_command(datastore, b"FCALL_RO", b"peek", b"1", b"a", persister=persister)
+    run_command(
+        datastore, b"FCALL", b"ratelimit", b"1", b"rl", b"10", b"2", persister=persister
+    )
+    persister.close()
+    logged = b"".join(
+        as_command(*args).resp_encode()
+        for args in (
+            (b"MULTI",),
+            (b"DECRBY", b"a", b"4"),
+            (b"INCRBY", b"b", b"4"),
+            (b"EXEC",),
+            (b"MULTI",),
+            (b"INCR", b"rl"),
+        )
+    )
+    aof = filename.read_bytes()
+    assert aof.startswith(logged)
+    # The SET is logged with its deadline, then the block is closed
+    assert aof[len(logged) :].startswith(b"*5\r\n$3\r\nSET\r\n")
+    assert aof.endswith(as_command(b"EXEC").resp_encode())
+
+    # The effects are replayed, so the library is not needed to restore
+    functions.FUNCTIONS.clear()
+    restored = DataStore()
+    restored[b"a"] = b"10"
+    AppendOnlyPersister.restore_from_file(str(filename), restored)
+    assert (restored[b"a"], restored[b"b"], restored[b"rl"]) == (6, 4, 1)
+
+
+def test_fcall_in_a_transaction_and_watch(library):
+    datastore = DataStore(shards=4)
+    transaction = Transaction()
+
+    def run(*args):
+        return handle_command(as_command(*args), datastore, None, transaction)
+
+    run(b"WATCH", b"rl")
+    run(b"MULTI")
+    run(b"SET", b"x", b"1")
+    run(b"FCALL", b"ratelimit", b"1", b"rl", b"10", b"2")
+    assert run(b"EXEC") == Array([SimpleString("OK"), Array([Integer(1), Integer(1)])])
+
+    run(b"WATCH", b"rl")
+    run_command(datastore, b"FCALL", b"ratelimit", b"1", b"rl", b"10", b"2")
+    run(b"MULTI")
+    assert run(b"EXEC") == Array(None)
@@ -0,0 +1,203 @@
+import random
+
+import pytest
+
+from pyredis import hashes
+from pyredis.datastore import DataStore
+from pyredis.hashes import Hash
+from pyredis.types import Array, BulkString, Error, Integer
+
+from helpers import bulks, run_command
+
+
+def test_small_hash_is_a_listpack():
+    fields = Hash([(b"name", b"ada"), (b"age", b"36")])
+    assert fields.encoding == "listpack"
+    assert fields.get(b"name") == b"ada"
+    assert fields.get(b"nam") is None
+    assert fields.set(b"name", b"grace") is False
+    assert fields.set(b"city", b"") is True
+    assert list(fields.items()) == [
+        (b"name", b"grace"),
+        (b"age", b"36"),
+        (b"city", b""),
+    ]
+    assert fields.delete(b"age") and not fields.delete(b"age")
+    assert len(fields) == 2
+
+
+def test_values_are_not_mistaken_for_fields():
+    fields = Hash([(b"a", b"b"), (b"b", b"c")])
+    assert fields.get(b"b") == b"c"
+    assert fields.delete(b"b")
+    assert list(fields.items()) == [(b"a", b"b")]
+
+
+def test_conversion_thresholds(monkeypatch):
+    monkeypatch.setattr(hashes, "hash_max_listpack_entries", 4)
+    fields = Hash((b"f%d" % i, b"v") for i in range(4))
+    assert fields.encoding == "listpack"
+    fields.set(b"f4", b"v")
+    assert fields.encoding == "hashtable"
+    assert dict(fields.items()) == {b"f%d" % i: b"v" for i in range(5)}
+
+    fields = Hash([(b"short", b"v")])
+    fields.set(b"long", b"x" * (hashes.hash_max_listpack_value + 1))
+    assert fields.encoding == "hashtable"
+    assert fields.get(b"short") == b"v"
+
+
+def test_listpack_is_smaller_than_a_dict():
+    pairs = [(b"field:%d" % i, b"value:%d" % i) for i in range(100)]
+    listpack = Hash(pairs)
+    table = Hash(pairs)
+    table._convert()
+    assert listpack.memory_usage() * 3 < table.memory_usage()
+
+
+def test_matches_a_dict(monkeypatch):
+    monkeypatch.setattr(hashes, "hash_max_listpack_entries", 16)
+    rng = random.Random(3)
+    reference = {}
+    fields = Hash()
+    for _ in range(2000):
+        field = b"f%d" % rng.randrange(40)
+        if rng.random() < 0.6:
+            value = b"v" * rng.choice((0, 5, 300))
+            assert fields.set(field, value) == (field not in reference)
+            reference[field] = value
+        else:
+            assert fields.delete(field) == (reference.pop(field, None) is not None)
+        assert fields.get(field) == reference.get(field)
+        assert len(fields) == len(reference)
+    assert dict(fields.items()) == reference
+    assert dict(fields.copy().items()) == reference
+
+
+def test_hash_commands():
+    datastore = DataStore()
+    assert run_command(
+        datastore, b"HSET", b"u", b"name", b"ada", b"age", b"36"
+    ) == Integer(2)
+    assert run_command(datastore, b"HSET", b"u", b"name", b"grace") == Integer(0)
+    assert run_command(datastore, b"HGET", b"u", b"name") == BulkString(b"grace")
+    assert run_command(datastore, b"HGET", b"u", b"x") == BulkString(None)
+    assert run_command(datastore, b"HMGET", b"u", b"age", b"x") == bulks(b"36", None)
+    assert run_command(datastore, b"HMGET", b"missing", b"a") == bulks(None)
+    assert run_command(datastore, b"HGETALL", b"u") == bulks(
+        b"name", b"grace", b"age", b"36"
+    )
+    assert run_command(datastore, b"HLEN", b"u") == Integer(2)
+    assert run_command(datastore, b"HSET", b"u", b"odd") == Error(
+        "ERR wrong number of arguments for 'hset' command"
+    )
+
+    assert run_command(datastore, b"HDEL", b"u", b"name", b"x") == Integer(1)
+    assert run_command(datastore, b"HDEL", b"u", b"age") == Integer(1)
+    assert b"u" not in datastore
+    assert datastore.used_memory() == 0
+
+
+def test_hincrby():
+    datastore = DataStore()
+    assert run_command(datastore, b"HINCRBY", b"h", b"n", b"5") == Integer(5)
+    assert run_command(datastore, b"HINCRBY", b"h", b"n", b"-7") == Integer(-2)
+    assert run_command(datastore, b"HGET", b"h", b"n") == BulkString(b"-2")
+    run_command(datastore, b"HSET", b"h", b"s", b"abc", b"big", b"9223372036854775807")
+    assert run_command(datastore, b"HINCRBY", b"h", b"s", b"1") == Error(
+        "ERR hash value is not an integer"
+    )
+    assert run_command(datastore, b"HINCRBY", b"h", b"big", b"1") == Error(
+        "ERR increment or decrement would overflow"
+    )
+    assert run_command(datastore, b"HINCRBY", b"h", b"n", b"x") == Error(
+        "ERR value is not an integer or out of range"
+    )
+
+
+def test_wrong_types():
+    datastore = DataStore()
+    run_command(datastore, b"SET", b"s", b"v")
+    run_command(datastore, b"HSET", b"h", b"f", b"v")
+    wrongtype = Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+    assert run_command(datastore, b"HGET", b"s", b"f") == wrongtype
+    assert run_command(datastore, b"HSET", b"s", b"f", b"v") == wrongtype
+    assert run_command(datastore, b"GET", b"h") == wrongtype
+    assert run_command(datastore, b"LPUSH", b"h", b"x") == wrongtype
+
+
+def test_hash_memory_is_accounted():
+    datastore = DataStore()
+    run_command(datastore, b"HSET", b"h", *[b"f%d" % (i // 2) for i in range(400)])
+    run_command(datastore, b"HINCRBY", b"h", b"n", b"1")
+    assert datastore.used_memory() == datastore.memory_usage(b"h")
+    run_command(datastore, b"HDEL", b"h", *[b"f%d" % i for i in range(200)])
+    assert datastore.used_memory() == datastore.memory_usage(b"h")
+
+
+@pytest.mark.parametrize("fields", [10, 1000])
+def test_hscan_returns_every_field(fields):
+    datastore = DataStore()
+    pairs = [(b"f%d" % i, b"%d" % i) for i in range(fields)]
+    run_command(datastore, b"HSET", b"h", *[data for pair in pairs for data in pair])
+
+    seen = {}
+    cursor = b"0"
+    while True:
+        reply = run_command(datastore, b"HSCAN", b"h", cursor, b"COUNT", b"100")
+        cursor = reply[0].data
+        items = [frame.data for frame in reply[1]]
+        seen.update(zip(items[::2], items[1::2]))
+        if cursor == b"0":
+            break
+    assert seen == dict(pairs)
+
+
+def test_hscan_returns_every_field_that_survives_deletes():
+    datastore = DataStore()
+    fields = [b"f%d" % i for i in range(1000)]
+    run_command(
+        datastore, b"HSET", b"h", *[data for field in fields for data in (field, b"v")]
+    )
+    deleted = set(fields[::7])
+
+    seen = set()
+    cursor = b"0"
+    while True:
+        reply = run_command(datastore, b"HSCAN", b"h", cursor, b"COUNT", b"50")
+        cursor = reply[0].data
+        returned = [frame.data for frame in reply[1]][::2]
+        seen.update(returned)
+        # Delete fields already returned and some that are not yet
+        run_command(datastore, b"HDEL", b"h", *returned[::2], *fields[::7])
+        deleted.update(returned[::2])
+        if cursor == b"0":
+            break
+    assert set(fields) - deleted <= seen
+
+
+def test_hscan_match():
+    datastore = DataStore()
+    run_command(
+        datastore, b"HSET", b"h", b"user:1", b"a", b"user:2", b"b", b"group:1", b"c"
+    )
+    reply = run_command(datastore, b"HSCAN", b"h", b"0", b"MATCH", b"user:*")
+    assert reply == Array([BulkString(b"0"), bulks(b"user:1", b"a", b"user:2", b"b")])
+    reply = run_command(datastore, b"HSCAN", b"h", b"0", b"MATCH", b"[gx]roup:?")
+    assert reply[1] == bulks(b"group:1", b"c")
+    assert run_command(datastore, b"HSCAN", b"h", b"x") == Error("ERR invalid cursor")
+    assert run_command(datastore, b"HSCAN", b"h", b"0", b"COUNT") == Error(
+        "ERR syntax error"
+    )
+    assert run_command(datastore, b"HSCAN", b"missing", b"0") == Array(
+        [BulkString(b"0"), Array([])]
+    )
+
+
+def test_long_entries_never_stay_in_a_listpack(monkeypatch):
+    monkeypatch.setattr(hashes, "hash_max_listpack_value", 1000)
+    fields = Hash([(b"a", b"1"), (b"b", b"x" * 300)])
+    assert fields.encoding == "hashtable"
+    assert fields.get(b"b") == b"x" * 300
@@ -0,0 +1,180 @@
+import logging
+import threading
+
+import pytest
+from time import sleep
+
+from pyredis import persistence
+
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.replay import replay_aof
+from pyredis.types import Array, BulkString, SimpleString
+
+
+def _set(key, value):
+    return Array([BulkString(b"SET"), BulkString(key), BulkString(value)])
+
+
+@pytest.mark.parametrize("appendfsync", ["always", "everysec", "no"])
+def test_log_command_is_buffered_until_flush(tmp_path, appendfsync):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename, appendfsync)
+    persister.log_command(_set(b"k1", b"v1"))
+    persister.log_command(_set(b"k2", b"v2"))
+    assert filename.read_bytes() == b""
+
+    persister.flush()
+    assert filename.read_bytes() == (
+        b"*3\r\n$3\r\nSET\r\n$2\r\nk1\r\n$2\r\nv1\r\n"
+        b"*3\r\n$3\r\nSET\r\n$2\r\nk2\r\n$2\r\nv2\r\n"
+    )
+    persister.close()
+
+
+def test_restore_from_file(tmp_path):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename)
+    persister.log_command(_set(b"k1", b"v1"))
+    persister.log_command(Array([BulkString(b"INCR"), BulkString(b"n")]))
+    persister.close()
+
+    datastore = DataStore()
+    assert AppendOnlyPersister.restore_from_file(filename, datastore)
+    assert datastore[b"k1"] == b"v1"
+    assert datastore[b"n"] == 1
+
+
+def test_everysec_close_stops_the_fsync_thread_cleanly(tmp_path, monkeypatch, caplog):
+    # The background thread's second is over once the persister is closed
+    closed = threading.Event()
+    monkeypatch.setattr(persistence, "sleep", lambda seconds: closed.wait())
+    persister = AppendOnlyPersister(tmp_path / "test.aof", "everysec")
+    persister.log_command(_set(b"k", b"v"))
+    persister.flush()
+    with caplog.at_level(logging.ERROR, logger="pyredis"):
+        persister.close()
+        closed.set()
+        persister._fsync_thread.join(timeout=5)
+    assert not persister._fsync_thread.is_alive()
+    assert "Background AOF fsync failed" not in caplog.text
+
+
+def test_invalid_appendfsync(tmp_path):
+    with pytest.raises(ValueError):
+        AppendOnlyPersister(tmp_path / "test.aof", "sometimes")
+
+
+def _wait_for_rewrite(persister):
+    for _ in range(100):
+        if not persister.rewrite_in_progress:
+            return
+        sleep(0.01)
+    raise AssertionError("AOF rewrite did not finish")
+
+
+def test_rewrite_compacts_file(tmp_path):
+    filename = tmp_path / "test.aof"
+    datastore = DataStore()
+    persister = AppendOnlyPersister(filename, datastore=datastore)
+    incr = Array([BulkString(b"INCR"), BulkString(b"counter")])
+    for _ in range(100):
+        handle_command(incr, datastore, persister)
+    for i in range(5):
+        handle_command(
+            Array([BulkString(b"RPUSH"), BulkString(b"list"), BulkString(b"%d" % i)]),
+            datastore,
+            persister,
+        )
+    for i in range(5):
+        handle_command(
+            Array([BulkString(a) for a in (b"HSET", b"hash", b"f%d" % i, b"%d" % i)]),
+            datastore,
+            persister,
+        )
+    handle_command(_set(b"gone", b"x"), datastore, persister)
+    handle_command(
+        Array([BulkString(b"DEL"), BulkString(b"gone")]), datastore, persister
+    )
+    persister.flush()
+    size_before = filename.stat().st_size
+
+    assert handle_command(
+        Array([BulkString(b"BGREWRITEAOF")]), datastore, persister
+    ) == SimpleString("Background append only file rewriting started")
+    # Written while the rewrite may still be running
+    handle_command(incr, datastore, persister)
+    _wait_for_rewrite(persister)
+    persister.close()
+    assert filename.stat().st_size < size_before
+
+    restored = DataStore()
+    AppendOnlyPersister.restore_from_file(filename, restored)
+    assert restored[b"counter"] == 101
+    assert list(restored[b"list"]) == [b"0", b"1", b"2", b"3", b"4"]
+    assert restored.hgetall(b"hash") == [(b"f%d" % i, b"%d" % i) for i in range(5)]
+    assert b"gone" not in restored
+
+
+def test_rewrite_keeps_absolute_expiry(tmp_path):
+    filename = tmp_path / "test.aof"
+    datastore = DataStore()
+    persister = AppendOnlyPersister(filename, datastore=datastore)
+    command = _set(b"k", b"v")
+    command.data += [BulkString(b"EX"), BulkString(b"100")]
+    handle_command(command, datastore, persister)
+    persister.rewrite()
+    _wait_for_rewrite(persister)
+    persister.close()
+
+    restored = DataStore()
+    AppendOnlyPersister.restore_from_file(filename, restored)
+    assert restored._data[b"k"].expiry == datastore._data[b"k"].expiry
+
+
+def test_automatic_rewrite(tmp_path):
+    filename = tmp_path / "test.aof"
+    datastore = DataStore()
+    persister = AppendOnlyPersister(
+        filename,
+        datastore=datastore,
+        auto_rewrite_percentage=100,
+        auto_rewrite_min_size=1024,
+    )
+    for _ in range(200):
+        handle_command(_set(b"key", b"value"), datastore, persister)
+        persister.flush()
+        _wait_for_rewrite(persister)
+    persister.close()
+    assert filename.stat().st_size < 2048
+
+
+def test_replay_aof(tmp_path):
+    filename = tmp_path / "test.aof"
+    filename.write_bytes(
+        b"*3\r\n$3\r\nSET\r\n$1\r\na\r\n$1\r\n1\r\n"
+        b"*5\r\n$3\r\nSET\r\n$1\r\nb\r\n$1\r\n2\r\n$4\r\nPXAT\r\n$13\r\n9999999999999\r\n"
+        b"*5\r\n$3\r\nSET\r\n$1\r\nc\r\n$1\r\n3\r\n$4\r\nPXAT\r\n$1\r\n1\r\n"
+        b"*2\r\n$4\r\nINCR\r\n$1\r\na\r\n"
+        b"*4\r\n$5\r\nRPUSH\r\n$1\r\nl\r\n$1\r\nx\r\n$1\r\ny\r\n"
+        b"*3\r\n$5\r\nLPUSH\r\n$1\r\nl\r\n$1\r\nw\r\n"
+        b"*5\r\n$3\r\nSET\r\n$1\r\nd\r\n$1\r\n4\r\n$2\r\nex\r\n$3\r\n100\r\n"
+        b"*2\r\n$3\r\nDEL\r\n$1\r\nd\r\n"
+        # cut short by a crash
+        b"*3\r\n$3\r\nSET\r\n$1\r\ne\r\n$5\r\nval"
+    )
+    datastore = DataStore()
+    assert replay_aof(filename, datastore) == 8
+    assert datastore[b"a"] == 2
+    assert datastore._data[b"b"].expiry == 9999999999999
+    assert b"c" not in datastore
+    assert b"d" not in datastore
+    assert b"e" not in datastore
+    assert list(datastore[b"l"]) == [b"w", b"x", b"y"]
+
+
+def test_replay_empty_aof(tmp_path):
+    filename = tmp_path / "test.aof"
+    filename.write_bytes(b"")
+    assert replay_aof(filename, DataStore()) == 0
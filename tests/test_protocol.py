@@ -1,7 +1,13 @@
 import pytest
 from time import sleep
 
-from pyredis.protocol import extract_frame_from_buffer, encode_message
+from pyredis.protocol import (
+    ProtocolError,
+    RespParser,
+    extract_frame_from_buffer,
+    encode_message,
+    encode_message_into,
+)
 from pyredis.datastore import DataStore
 from pyredis.types import (
     Array,
@@ -65,14 +71,64 @@ def test_read_frame(buffer, expected):
     assert actual == expected
 
 
+def test_parser_pipelined_frames():
+    parser = RespParser()
+    parser.feed(b"+OK\r\n:1\r\n*2\r\n$3\r\nfoo\r\n*-1\r\n$-1\r\n")
+    assert list(parser) == [
+        SimpleString("OK"),
+        Integer(1),
+        Array([BulkString(b"foo"), Array(None)]),
+        BulkString(None),
+    ]
+    assert parser.get_frame() is None
+
+
+def test_parser_resumes_partial_frames():
+    message = b"*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$12\r\nHello\r\nWorld\r\n+OK\r\n"
+    parser = RespParser()
+    frames = []
+    for i in range(len(message)):
+        parser.feed(message[i : i + 1])
+        frames.extend(parser)
+    assert frames == [
+        Array([BulkString(b"SET"), BulkString(b"key"), BulkString(b"Hello\r\nWorld")]),
+        SimpleString("OK"),
+    ]
+
+
+def test_parser_large_multibulk():
+    size = 10000
+    parts = [b"*%d\r\n" % (size + 1), b"$5\r\nRPUSH\r\n"]
+    parts.extend(b"$%d\r\n%d\r\n" % (len(b"%d" % i), i) for i in range(size))
+    message = b"".join(parts)
+
+    parser = RespParser()
+    for i in range(0, len(message), 1024):
+        parser.feed(message[i : i + 1024])
+    frame = parser.get_frame()
+    assert len(frame) == size + 1
+    assert frame[-1] == BulkString(b"%d" % (size - 1))
+
+
+def test_parser_protocol_error():
+    parser = RespParser()
+    parser.feed(b"PING\r\n")
+    with pytest.raises(ProtocolError):
+        parser.get_frame()
+
+
 @pytest.mark.parametrize(
     "message, expected",
     [
         (SimpleString("OK"), b"+OK\r\n"),
         (Error("Error"), b"-Error\r\n"),
         (Integer(100), b":100\r\n"),
+        (Integer(123456), b":123456\r\n"),
+        (Integer(-1), b":-1\r\n"),
         (BulkString("This is a Bulk String"), b"$21\r\nThis is a Bulk String\r\n"),
         (BulkString(""), b"$0\r\n\r\n"),
+        (BulkString("h\u00e9"), b"$3\r\nh\xc3\xa9\r\n"),
+        (BulkString(b"x" * 2000), b"$2000\r\n" + b"x" * 2000 + b"\r\n"),
         (BulkString(None), b"$-1\r\n"),
         (Array([]), b"*0\r\n"),
         (Array(None), b"*-1\r\n"),
@@ -85,3 +141,12 @@ def test_read_frame(buffer, expected):
 def test_encode_message(message, expected):
     encoded_message = encode_message(message)
     assert encoded_message == expected
+
+
+def test_encode_message_into_shared_buffer():
+    buffer = bytearray()
+    encode_message_into(SimpleString("OK"), buffer)
+    encode_message_into(
+        Array([BulkString(b"a"), Array([Integer(1), BulkString(None)])]), buffer
+    )
+    assert buffer == b"+OK\r\n*2\r\n$1\r\na\r\n*2\r\n:1\r\n$-1\r\n"
@@ -0,0 +1,111 @@
+import random
+
+import pytest
+
+from pyredis import quicklist
+from pyredis.quicklist import QuickList
+
+
+@pytest.fixture(autouse=True)
+def small_nodes(monkeypatch):
+    # Small nodes so that a few dozen items already span several of them
+    monkeypatch.setattr(quicklist, "QUICKLIST_NODE_MAX_ITEMS", 4)
+    monkeypatch.setattr(quicklist, "QUICKLIST_NODE_MAX_BYTES", 64)
+
+
+def _item(i):
+    return b"item:%d" % i
+
+
+def test_push_and_iterate():
+    items = QuickList()
+    for i in range(10):
+        items.append(_item(i))
+        items.appendleft(_item(-i))
+    expected = [_item(-i) for i in reversed(range(10))] + [_item(i) for i in range(10)]
+    assert len(items) == 20
+    assert list(items) == expected
+    assert list(reversed(items)) == expected[::-1]
+    assert len(items._nodes) > 1
+
+
+def test_index_and_set():
+    items = QuickList(_item(i) for i in range(30))
+    for _ in range(5):
+        items.appendleft(b"head")
+    assert items.index(0) == b"head"
+    assert items.index(5) == _item(0)
+    assert items.index(34) == _item(29)
+
+    items.set(20, b"x" * 300)
+    assert items.index(20) == b"x" * 300
+    assert items.index(21) == _item(16)
+
+
+def test_long_and_empty_items():
+    values = [b"", b"a" * 254, b"b" * 255, b"c" * 70000, b"d"]
+    items = QuickList(values)
+    assert list(items) == values
+    assert list(reversed(items)) == values[::-1]
+    assert [items.index(i) for i in range(len(values))] == values
+
+
+def test_pop_both_ends():
+    items = QuickList(_item(i) for i in range(10))
+    assert items.popleft() == _item(0)
+    assert items.pop() == _item(9)
+    assert list(items) == [_item(i) for i in range(1, 9)]
+    while items:
+        items.pop()
+    assert len(items) == 0
+    items.appendleft(b"again")
+    assert list(items) == [b"again"]
+
+
+def test_trim_and_range():
+    items = QuickList(_item(i) for i in range(40))
+    assert list(items.range(5, 12)) == [_item(i) for i in range(5, 12)]
+    items.trim(7, 23)
+    assert list(items) == [_item(i) for i in range(7, 23)]
+    assert items.index(0) == _item(7)
+    items.trim(0, 0)
+    assert len(items) == 0
+
+
+def test_spans_reference_the_nodes():
+    items = QuickList([b"a", b"b" * 300, b""] + [_item(i) for i in range(20)])
+    spans = list(items.spans(0, len(items)))
+    assert [bytes(node[start:end]) for node, start, end in spans] == list(items)
+    assert spans[0][0] is items._nodes[0]
+
+
+def test_matches_a_python_list():
+    rng = random.Random(7)
+    reference = []
+    items = QuickList()
+    for _ in range(3000):
+        item = bytes(rng.randrange(256) for _ in range(rng.choice((0, 3, 40, 300))))
+        operation = rng.random()
+        if operation < 0.3:
+            reference.append(item)
+            items.append(item)
+        elif operation < 0.6:
+            reference.insert(0, item)
+            items.appendleft(item)
+        elif reference and operation < 0.7:
+            assert items.pop() == reference.pop()
+        elif reference and operation < 0.8:
+            assert items.popleft() == reference.pop(0)
+        elif reference and operation < 0.9:
+            i = rng.randrange(len(reference))
+            reference[i] = item
+            items.set(i, item)
+        elif reference:
+            start = rng.randrange(len(reference))
+            stop = rng.randrange(start, len(reference) + 1)
+            assert list(items.range(start, stop)) == reference[start:stop]
+        assert len(items) == len(reference)
+
+    assert list(items) == reference
+    assert items.nbytes == sum(len(node) for node in items._nodes)
+    assert list(items.copy()) == reference
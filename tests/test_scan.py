@@ -0,0 +1,194 @@
+import random
+from time import sleep
+
+import pytest
+
+from pyredis import sets
+from pyredis.datastore import DataStore
+from pyredis.types import Array, BulkString, Error, SimpleString
+
+from helpers import run_command
+
+
+def _scan_all(datastore, *options):
+    seen = []
+    cursor = b"0"
+    while True:
+        reply = run_command(datastore, b"SCAN", cursor, *options)
+        cursor = reply[0].data
+        seen += [frame.data for frame in reply[1]]
+        if cursor == b"0":
+            return seen
+
+
+def _filled_datastore(shards=1):
+    datastore = DataStore(shards=shards)
+    for i in range(100):
+        datastore[b"user:%d" % i] = b"v"
+    run_command(datastore, b"RPUSH", b"queue", b"a")
+    run_command(datastore, b"HSET", b"hash", b"f", b"v")
+    run_command(datastore, b"SADD", b"set", b"m")
+    run_command(datastore, b"ZADD", b"zset", b"1", b"m")
+    return datastore
+
+
+@pytest.mark.parametrize("shards", [1, 4])
+def test_scan_returns_every_key(shards):
+    datastore = _filled_datastore(shards)
+    keys = _scan_all(datastore, b"COUNT", b"7")
+    assert sorted(keys) == sorted(datastore._data)
+    assert len(keys) == 104
+
+
+def test_scan_match_and_type():
+    datastore = _filled_datastore()
+    assert sorted(_scan_all(datastore, b"MATCH", b"user:1?")) == sorted(
+        b"user:%d" % i for i in range(10, 20)
+    )
+    assert _scan_all(datastore, b"TYPE", b"zset") == [b"zset"]
+    assert _scan_all(datastore, b"TYPE", b"LIST", b"MATCH", b"q*") == [b"queue"]
+    assert len(_scan_all(datastore, b"TYPE", b"string")) == 100
+    assert _scan_all(datastore, b"TYPE", b"stream") == []
+
+
+def test_scan_errors():
+    datastore = DataStore()
+    for cursor in (b"x", b" 0", b"+0", b"1_0", b"0 ", b"-1", b""):
+        assert run_command(datastore, b"SCAN", cursor) == Error("ERR invalid cursor")
+    assert run_command(datastore, b"SCAN", b"0", b"COUNT", b"0") == Error(
+        "ERR syntax error"
+    )
+    assert run_command(datastore, b"SCAN", b"0", b"TYPE") == Error("ERR syntax error")
+    assert run_command(datastore, b"HSCAN", b"h", b"0", b"TYPE", b"hash") == Error(
+        "ERR syntax error"
+    )
+    assert run_command(datastore, b"SCAN", b"0") == Array([BulkString(b"0"), Array([])])
+
+
+@pytest.mark.parametrize("shards", [1, 4])
+def test_scan_survives_concurrent_writes(shards):
+    rng = random.Random(11)
+    datastore = DataStore(shards=shards)
+    stable = {b"stable:%d" % i for i in range(500)}
+    churn = [b"churn:%d" % i for i in range(500)]
+    for key in stable:
+        datastore[key] = b"v"
+    for key in churn:
+        datastore[key] = b"v"
+
+    seen = set()
+    cursor = 0
+    while True:
+        cursor, keys = datastore.scan(cursor, 10)
+        seen.update(keys)
+        # Deleting keys moves others into their slots, inserting grows the array
+        for _ in range(5):
+            key = rng.choice(churn)
+            if key in datastore:
+                datastore.delete([key])
+            else:
+                datastore[key] = b"v"
+        if not cursor:
+            break
+    assert stable <= seen
+
+
+def test_scan_skips_expired_keys():
+    datastore = DataStore()
+    datastore.set_with_expiry(b"gone", b"v", 1)
+    datastore[b"kept"] = b"v"
+    sleep(0.01)
+    assert _scan_all(datastore) == [b"kept"]
+    assert b"gone" not in datastore
+
+
+def test_keyspace_positions_stay_consistent():
+    rng = random.Random(5)
+    datastore = DataStore(shards=3)
+    for _ in range(3000):
+        key = b"k%d" % rng.randrange(200)
+        match rng.randrange(3):
+            case 0:
+                datastore[key] = b"v"
+            case 1:
+                datastore.delete([key])
+            case 2:
+                datastore.sadd(key + b":set", [b"m"])
+    shards = datastore._keyspace._keys
+    assert sorted(key for keys in shards for key in keys) == sorted(datastore._data)
+    for shard, keys in enumerate(shards):
+        for position, key in enumerate(keys):
+            assert hash(key) % 3 == shard
+            assert datastore._data[key].position == position
+
+
+def test_keys():
+    datastore = _filled_datastore()
+    names = sorted(frame.data for frame in run_command(datastore, b"KEYS", b"user:9*"))
+    assert names == [b"user:9"] + [b"user:%d" % i for i in range(90, 100)]
+    names = sorted(frame.data for frame in run_command(datastore, b"KEYS", b"[hsz]*"))
+    assert names == [b"hash", b"set", b"zset"]
+    assert len(run_command(datastore, b"KEYS", b"*")) == 104
+    assert run_command(datastore, b"KEYS", b"nothing*") == Array([])
+
+
+def test_type():
+    datastore = _filled_datastore()
+    assert run_command(datastore, b"TYPE", b"user:1") == SimpleString("string")
+    assert run_command(datastore, b"TYPE", b"queue") == SimpleString("list")
+    assert run_command(datastore, b"TYPE", b"hash") == SimpleString("hash")
+    assert run_command(datastore, b"TYPE", b"set") == SimpleString("set")
+    assert run_command(datastore, b"TYPE", b"zset") == SimpleString("zset")
+    assert run_command(datastore, b"TYPE", b"missing") == SimpleString("none")
+
+
+@pytest.mark.parametrize("members", [10, 1000])
+def test_sscan_returns_every_member(members):
+    datastore = DataStore()
+    run_command(datastore, b"SADD", b"s", *[b"%d" % i for i in range(members)])
+    assert datastore[b"s"].encoding == (
+        "intset" if members <= sets.set_max_intset_entries else "hashtable"
+    )
+    seen = set()
+    cursor = b"0"
+    while True:
+        reply = run_command(datastore, b"SSCAN", b"s", cursor, b"COUNT", b"100")
+        cursor = reply[0].data
+        seen.update(frame.data for frame in reply[1])
+        if cursor == b"0":
+            break
+    assert seen == set(range(members))
+
+
+def test_sscan_returns_every_member_that_survives_removes():
+    datastore = DataStore()
+    members = [b"m%d" % i for i in range(1000)]
+    run_command(datastore, b"SADD", b"s", *members)
+    removed = set(members[::7])
+
+    seen = set()
+    cursor = b"0"
+    while True:
+        reply = run_command(datastore, b"SSCAN", b"s", cursor, b"COUNT", b"50")
+        cursor = reply[0].data
+        returned = [frame.data for frame in reply[1]]
+        seen.update(returned)
+        # Remove members already returned and some that are not yet
+        run_command(datastore, b"SREM", b"s", *returned[::2], *members[::7])
+        removed.update(returned[::2])
+        if cursor == b"0":
+            break
+    assert set(members) - removed <= seen
+
+
+def test_sscan_match():
+    datastore = DataStore()
+    run_command(datastore, b"SADD", b"s", b"10", b"11", b"20", b"1x")
+    reply = run_command(datastore, b"SSCAN", b"s", b"0", b"MATCH", b"1?")
+    assert sorted(frame.resp_encode() for frame in reply[1]) == sorted(
+        BulkString(member).resp_encode() for member in (10, 11, b"1x")
+    )
+    run_command(datastore, b"SET", b"str", b"v")
+    assert run_command(datastore, b"SSCAN", b"str", b"0") == Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
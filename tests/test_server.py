@@ -0,0 +1,35 @@
+import pytest
+
+from pyredis.asyncserver import RedisServerProtocol
+from pyredis.datastore import DataStore
+
+
+class FakeTransport:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def protocol():
+    protocol = RedisServerProtocol(DataStore(), None)
+    protocol.connection_made(FakeTransport())
+    return protocol
+
+
+def test_pipelined_commands_single_write(protocol):
+    pipeline = b"*1\r\n$4\r\nPING\r\n" * 3 + b"*2\r\n$4\r\nECHO\r\n$2\r\nhi\r\n"
+    protocol.data_received(pipeline)
+    assert protocol.transport.writes == [b"+PONG\r\n" * 3 + b"$2\r\nhi\r\n"]
+
+
+def test_pipelined_commands_partial_frame(protocol):
+    protocol.data_received(b"*1\r\n$4\r\nPING\r\n*1\r\n$4\r\nPI")
+    assert protocol.transport.writes == [b"+PONG\r\n"]
+    protocol.data_received(b"NG\r\n")
+    assert protocol.transport.writes == [b"+PONG\r\n", b"+PONG\r\n"]
@@ -0,0 +1,145 @@
+import random
+from time import sleep
+
+from pyredis import sets
+from pyredis.datastore import DataStore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.sets import Set
+from pyredis.types import BulkString, Error, Integer
+
+from helpers import run_command
+
+
+def _members(reply):
+    return sorted(frame.resp_encode() for frame in reply)
+
+
+def _bulks(*items):
+    return sorted(BulkString(item).resp_encode() for item in items)
+
+
+def test_integer_set_is_an_intset():
+    members = Set([5, 1, 3])
+    assert members.encoding == "intset"
+    assert list(members) == [1, 3, 5]
+    assert 3 in members and 2 not in members and b"3" not in members
+    assert members.add(3) is False
+    assert members.remove(1) and not members.remove(1)
+    members.add(b"x")
+    assert members.encoding == "hashtable"
+    assert sorted(members, key=str) == [3, 5, b"x"]
+
+
+def test_intset_converts_past_the_entry_limit(monkeypatch):
+    monkeypatch.setattr(sets, "set_max_intset_entries", 4)
+    members = Set(range(4))
+    assert members.encoding == "intset"
+    members.add(10)
+    assert members.encoding == "hashtable"
+    assert members.as_set() == {0, 1, 2, 3, 10}
+
+
+def test_intset_is_smaller_than_a_set():
+    intset = Set(range(500))
+    table = Set(range(500))
+    table._convert()
+    assert intset.memory_usage() * 4 < table.memory_usage()
+
+
+def test_matches_a_python_set(monkeypatch):
+    monkeypatch.setattr(sets, "set_max_intset_entries", 16)
+    rng = random.Random(5)
+    reference = set()
+    members = Set()
+    for _ in range(2000):
+        member = rng.randrange(40) if rng.random() < 0.95 else b"m"
+        if rng.random() < 0.6:
+            assert members.add(member) == (member not in reference)
+            reference.add(member)
+        else:
+            assert members.remove(member) == (member in reference)
+            reference.discard(member)
+        assert (member in members) == (member in reference)
+        assert len(members) == len(reference)
+    assert members.as_set() == reference
+    assert members.copy().as_set() == reference
+
+
+def test_set_commands():
+    datastore = DataStore()
+    assert run_command(datastore, b"SADD", b"s", b"1", b"2", b"2", b"a") == Integer(3)
+    assert run_command(datastore, b"SISMEMBER", b"s", b"2") == Integer(1)
+    assert run_command(datastore, b"SISMEMBER", b"s", b"02") == Integer(0)
+    assert run_command(datastore, b"SISMEMBER", b"missing", b"2") == Integer(0)
+    assert run_command(datastore, b"SCARD", b"s") == Integer(3)
+    assert _members(run_command(datastore, b"SMEMBERS", b"s")) == _bulks(
+        b"1", b"2", b"a"
+    )
+    assert run_command(datastore, b"SREM", b"s", b"1", b"x") == Integer(1)
+    assert run_command(datastore, b"SREM", b"s", b"2", b"a") == Integer(2)
+    assert b"s" not in datastore
+    assert datastore.used_memory() == 0
+
+
+def test_set_algebra():
+    datastore = DataStore()
+    run_command(datastore, b"SADD", b"a", b"1", b"2", b"3", b"x")
+    run_command(datastore, b"SADD", b"b", b"2", b"3", b"4")
+    run_command(datastore, b"SADD", b"c", b"3", b"x", b"y")
+
+    assert _members(run_command(datastore, b"SINTER", b"a", b"b")) == _bulks(b"2", b"3")
+    assert _members(run_command(datastore, b"SINTER", b"a", b"b", b"c")) == _bulks(b"3")
+    assert _members(run_command(datastore, b"SINTER", b"a", b"missing")) == []
+    assert _members(
+        run_command(datastore, b"SUNION", b"b", b"c", b"missing")
+    ) == _bulks(b"2", b"3", b"4", b"x", b"y")
+    assert _members(run_command(datastore, b"SDIFF", b"a", b"b", b"missing")) == _bulks(
+        b"1", b"x"
+    )
+    assert _members(run_command(datastore, b"SDIFF", b"missing", b"a")) == []
+
+    assert run_command(datastore, b"SINTERSTORE", b"d", b"a", b"c") == Integer(2)
+    assert _members(run_command(datastore, b"SMEMBERS", b"d")) == _bulks(b"3", b"x")
+    assert run_command(datastore, b"SINTERSTORE", b"a", b"a", b"b") == Integer(2)
+    assert datastore.smembers(b"a") == [2, 3]
+    assert run_command(datastore, b"SINTERSTORE", b"d", b"b", b"missing") == Integer(0)
+    assert b"d" not in datastore
+
+
+def test_large_intersection_starts_from_the_smallest_set():
+    datastore = DataStore()
+    datastore.sadd(b"big", [b"%d" % i for i in range(100000)])
+    datastore.sadd(b"small", [b"%d" % i for i in range(0, 300000, 1000)])
+    assert datastore[b"small"].encoding == "intset"
+    assert sorted(datastore.sinter([b"big", b"small"])) == list(range(0, 100000, 1000))
+
+
+def test_wrong_types():
+    datastore = DataStore()
+    run_command(datastore, b"SET", b"str", b"v")
+    run_command(datastore, b"SADD", b"s", b"m")
+    wrongtype = Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+    assert run_command(datastore, b"SADD", b"str", b"m") == wrongtype
+    assert run_command(datastore, b"SINTER", b"s", b"str") == wrongtype
+    assert run_command(datastore, b"SINTERSTORE", b"d", b"s", b"str") == wrongtype
+    assert run_command(datastore, b"GET", b"s") == wrongtype
+    assert run_command(datastore, b"HGET", b"s", b"m") == wrongtype
+
+
+def test_sets_survive_an_aof_rewrite(tmp_path):
+    datastore = DataStore()
+    datastore.sadd(b"ids", [b"%d" % i for i in range(300)])
+    datastore.sadd(b"tags", [b"red", b"7"])
+    filename = str(tmp_path / "test.aof")
+    persister = AppendOnlyPersister(filename, "always", datastore)
+    persister.rewrite()
+    while persister.rewrite_in_progress:
+        sleep(0.01)
+
+    restored = DataStore()
+    AppendOnlyPersister.restore_from_file(filename, restored)
+    assert restored[b"ids"].encoding == "intset"
+    assert restored.smembers(b"ids") == list(range(300))
+    assert set(restored.smembers(b"tags")) == {b"red", 7}
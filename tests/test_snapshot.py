@@ -0,0 +1,128 @@
+import pytest
+from time import sleep, time
+
+from pyredis import snapshot
+from pyredis.commands import handle_command
+from pyredis.datastore import DataStore
+from pyredis.hashes import Hash
+from pyredis.quicklist import QuickList
+from pyredis.sets import Set
+from pyredis.snapshot import SnapshotError
+from pyredis.types import Array, BulkString, Error, SimpleString
+
+
+def _filled_datastore():
+    datastore = DataStore()
+    datastore[b"s"] = b"value"
+    datastore[b"n"] = 42
+    datastore[b"l"] = QuickList([b"a", b"b", b"c"])
+    datastore[b"h"] = Hash([(b"f", b"1"), (b"g", b"x" * 300)])
+    datastore[b"set"] = Set([3, 1, b"m"])
+    datastore.set_with_expiry_at(b"e", b"soon", int(time() * 1000) + 100000)
+    return datastore
+
+
+def test_save_and_load(tmp_path):
+    filename = tmp_path / "dump.rdb"
+    datastore = _filled_datastore()
+    assert snapshot.save(datastore, filename) == 6
+
+    restored = DataStore()
+    assert snapshot.load(restored, filename) == 6
+    assert restored[b"s"] == b"value"
+    assert restored[b"n"] == 42
+    assert list(restored[b"l"]) == [b"a", b"b", b"c"]
+    assert list(restored[b"h"].items()) == [(b"f", b"1"), (b"g", b"x" * 300)]
+    assert restored[b"set"].as_set() == {1, 3, b"m"}
+    assert restored._data[b"e"].expiry == datastore._data[b"e"].expiry
+    assert restored._volatile.keys() == [b"e"]
+
+
+@pytest.mark.parametrize("shards", [1, 4])
+def test_load_builds_the_same_store_as_writes(tmp_path, shards):
+    filename = tmp_path / "dump.rdb"
+    datastore = _filled_datastore()
+    for i in range(100):
+        datastore[b"key:%d" % i] = b"v"
+    snapshot.save(datastore, filename)
+
+    restored = DataStore(shards=shards, precise_expiry=True)
+    snapshot.load(restored, filename)
+    assert restored.used_memory() == datastore.used_memory()
+    assert sorted(restored._data) == sorted(datastore._data)
+    assert restored._expiry_heap.next_deadline() == datastore._data[b"e"].expiry
+    restored.delete([b"key:%d" % i for i in range(50)])
+    cursor, keys = restored.scan(0, 1000)
+    while cursor:
+        cursor, batch = restored.scan(cursor, 1000)
+        keys += batch
+    assert sorted(keys) == sorted(restored._data)
+
+
+def test_load_skips_expired_keys(tmp_path):
+    filename = tmp_path / "dump.rdb"
+    snapshot._write(filename, [(b"gone", b"x", 1)], True)
+
+    restored = DataStore()
+    assert snapshot.load(restored, filename) == 0
+    assert b"gone" not in restored
+
+
+def test_load_detects_corruption(tmp_path):
+    filename = tmp_path / "dump.rdb"
+    snapshot.save(_filled_datastore(), filename)
+    data = bytearray(filename.read_bytes())
+    data[12] ^= 0xFF
+    filename.write_bytes(data)
+    with pytest.raises(SnapshotError):
+        snapshot.load(DataStore(), filename)
+
+
+def test_load_without_checksum(tmp_path):
+    filename = tmp_path / "dump.rdb"
+    snapshot.save(_filled_datastore(), filename, checksum=False)
+    restored = DataStore()
+    assert snapshot.load(restored, filename) == 6
+
+
+def test_load_truncated_file(tmp_path):
+    filename = tmp_path / "dump.rdb"
+    snapshot.save(_filled_datastore(), filename)
+    filename.write_bytes(filename.read_bytes()[:-10])
+    with pytest.raises(SnapshotError):
+        snapshot.load(DataStore(), filename)
+
+
+def test_save_command(tmp_path, monkeypatch):
+    filename = tmp_path / "dump.rdb"
+    monkeypatch.setattr(snapshot, "dbfilename", str(filename))
+    result = handle_command(Array([BulkString(b"SAVE")]), _filled_datastore(), None)
+    assert result == SimpleString("OK")
+    assert snapshot.load(DataStore(), filename) == 6
+
+
+def test_bgsave_command(tmp_path, monkeypatch):
+    filename = tmp_path / "dump.rdb"
+    monkeypatch.setattr(snapshot, "dbfilename", str(filename))
+    datastore = _filled_datastore()
+    result = handle_command(Array([BulkString(b"BGSAVE")]), datastore, None)
+    assert result == SimpleString("Background saving started")
+    # Writes after the fork are not part of the snapshot
+    datastore[b"later"] = b"x"
+
+    for _ in range(200):
+        if not snapshot.bgsave_in_progress():
+            break
+        sleep(0.01)
+    assert not snapshot.bgsave_in_progress()
+
+    restored = DataStore()
+    assert snapshot.load(restored, filename) == 6
+    assert b"later" not in restored
+
+
+def test_save_wrong_arguments():
+    result = handle_command(
+        Array([BulkString(b"SAVE"), BulkString(b"x")]), DataStore(), None
+    )
+    assert isinstance(result, Error)
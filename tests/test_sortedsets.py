@@ -0,0 +1,289 @@
+import random
+from time import sleep
+
+import pytest
+
+from pyredis import snapshot, sortedsets
+from pyredis.datastore import DataStore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.sortedsets import SortedSet, format_score
+from pyredis.types import BulkString, Error, Integer
+
+from helpers import bulks, run_command
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Splits and merges blocks after a handful of items
+    monkeypatch.setattr(sortedsets, "BLOCK_SIZE", 4)
+
+
+def _leaderboard():
+    datastore = DataStore()
+    run_command(
+        datastore, b"ZADD", b"z", b"1", b"a", b"2", b"b", b"2", b"c", b"3", b"d"
+    )
+    return datastore
+
+
+def test_format_score():
+    assert format_score(3.0) == b"3"
+    assert format_score(-0.5) == b"-0.5"
+    assert format_score(float("inf")) == b"inf"
+    assert format_score(1e20) == b"1e+20"
+
+
+def test_matches_a_sorted_list(small_blocks):
+    rng = random.Random(7)
+    reference = {}
+    members = SortedSet()
+    for step in range(5000):
+        member = b"m%d" % rng.randrange(100)
+        if rng.random() < 0.6:
+            score = float(rng.randrange(30))
+            assert (members.add(member, score) is None) == (member not in reference)
+            reference[member] = score
+        else:
+            assert members.remove(member) == (reference.pop(member, None) is not None)
+        if step % 100:
+            continue
+
+        order = sorted((score, member) for member, score in reference.items())
+        pairs = [(member, score) for score, member in order]
+        assert list(members) == pairs
+        assert [members.rank(member) for member, _ in pairs] == list(range(len(pairs)))
+        start, stop = sorted(rng.randrange(len(pairs) + 1) for _ in range(2))
+        assert list(members.items(start, stop)) == pairs[start:stop]
+        assert list(members.items(start, stop, True)) == pairs[start:stop][::-1]
+        score = float(rng.randrange(30))
+        assert members.score_rank(score) == sum(s < score for s, _ in order)
+        assert members.score_rank(score, True) == sum(s <= score for s, _ in order)
+    assert list(members.copy()) == list(members)
+
+
+def test_pop_across_blocks(small_blocks):
+    members = SortedSet((b"%02d" % i, i) for i in range(50))
+    assert members.pop(3) == [(b"00", 0), (b"01", 1), (b"02", 2)]
+    assert members.pop(20, from_max=True)[-1] == (b"30", 30)
+    assert [member for member, _ in members] == [b"%02d" % i for i in range(3, 30)]
+    assert members.pop(100) and len(members) == 0
+
+
+def test_zadd_and_lookups():
+    datastore = _leaderboard()
+    assert run_command(datastore, b"ZCARD", b"z") == Integer(4)
+    assert run_command(datastore, b"ZSCORE", b"z", b"c") == BulkString(b"2")
+    assert run_command(datastore, b"ZSCORE", b"z", b"x") == BulkString(None)
+    assert run_command(datastore, b"ZRANK", b"z", b"c") == Integer(2)
+    assert run_command(datastore, b"ZRANK", b"missing", b"c") == BulkString(None)
+    assert run_command(datastore, b"ZADD", b"z", b"0.5", b"c", b"5", b"e") == Integer(1)
+    assert run_command(datastore, b"ZRANK", b"z", b"c") == Integer(0)
+    assert run_command(datastore, b"ZINCRBY", b"z", b"1.5", b"c") == BulkString(b"2")
+    assert run_command(datastore, b"ZINCRBY", b"z", b"2", b"new") == BulkString(b"2")
+    assert run_command(datastore, b"ZREM", b"z", b"new", b"x") == Integer(1)
+    assert run_command(
+        datastore, b"ZREM", b"z", b"a", b"b", b"c", b"d", b"e"
+    ) == Integer(5)
+    assert b"z" not in datastore
+    assert datastore.used_memory() == 0
+
+
+def test_zadd_options():
+    datastore = _leaderboard()
+    assert run_command(
+        datastore, b"ZADD", b"z", b"NX", b"9", b"a", b"9", b"n"
+    ) == Integer(1)
+    assert datastore.zscore(b"z", b"a") == 1
+    assert run_command(
+        datastore, b"ZADD", b"z", b"XX", b"CH", b"9", b"a", b"9", b"x"
+    ) == (Integer(1))
+    assert datastore.zscore(b"z", b"x") is None
+    assert run_command(
+        datastore, b"ZADD", b"z", b"GT", b"CH", b"5", b"a", b"5", b"d"
+    ) == (Integer(1))
+    assert datastore.zscore(b"z", b"a") == 9
+    assert run_command(datastore, b"ZADD", b"z", b"LT", b"1", b"d") == Integer(0)
+    assert datastore.zscore(b"z", b"d") == 1
+    assert run_command(datastore, b"ZADD", b"z", b"INCR", b"2", b"d") == BulkString(
+        b"3"
+    )
+    assert run_command(datastore, b"ZADD", b"z", b"INCR", b"NX", b"2", b"d") == (
+        BulkString(None)
+    )
+    assert run_command(datastore, b"ZADD", b"missing", b"XX", b"1", b"a") == Integer(0)
+    assert b"missing" not in datastore
+
+
+@pytest.mark.parametrize(
+    "args, error",
+    [
+        ((b"NX", b"XX", b"1", b"a"), "ERR XX and NX options at the same time"),
+        ((b"GT", b"LT", b"1", b"a"), "ERR GT, LT, and/or NX options"),
+        ((b"NX", b"GT", b"1", b"a"), "ERR GT, LT, and/or NX options"),
+        ((b"1", b"a", b"2"), "ERR syntax error"),
+        ((b"CH", b"1"), "ERR syntax error"),
+        ((b"INCR", b"1", b"a", b"2", b"b"), "ERR INCR option supports a single"),
+        ((b"x", b"a"), "ERR value is not a valid float"),
+        ((b"nan", b"a"), "ERR value is not a valid float"),
+        ((b"1_000", b"a"), "ERR value is not a valid float"),
+        ((b" 1", b"a"), "ERR value is not a valid float"),
+        ((b"1\n", b"a"), "ERR value is not a valid float"),
+        ((b"", b"a"), "ERR value is not a valid float"),
+        ((b"INCR", b"1e", b"a"), "ERR value is not a valid float"),
+    ],
+)
+def test_zadd_errors(args, error):
+    reply = run_command(DataStore(), b"ZADD", b"z", *args)
+    assert isinstance(reply, Error) and reply.data.startswith(error)
+
+
+def test_zadd_accepts_redis_float_syntax():
+    datastore = DataStore()
+    args = (b"+inf", b"a", b"-Inf", b"b", b"-1.5e2", b"c", b".5", b"d", b"3.", b"e")
+    assert run_command(datastore, b"ZADD", b"z", *args) == Integer(5)
+    assert run_command(datastore, b"ZSCORE", b"z", b"c") == BulkString(b"-150")
+    assert run_command(datastore, b"ZSCORE", b"z", b"a") == BulkString(b"inf")
+
+
+def test_zincrby_nan():
+    datastore = DataStore()
+    run_command(datastore, b"ZADD", b"z", b"inf", b"a")
+    assert run_command(datastore, b"ZINCRBY", b"z", b"-inf", b"a") == Error(
+        "ERR resulting score is not a number (NaN)"
+    )
+    assert datastore.zscore(b"z", b"a") == float("inf")
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        ((b"0", b"-1"), [b"a", b"b", b"c", b"d"]),
+        ((b"1", b"2"), [b"b", b"c"]),
+        ((b"-2", b"100"), [b"c", b"d"]),
+        ((b"3", b"1"), []),
+        ((b"0", b"1", b"REV"), [b"d", b"c"]),
+        ((b"-1", b"-1", b"REV"), [b"a"]),
+        ((b"2", b"3", b"BYSCORE"), [b"b", b"c", b"d"]),
+        ((b"(2", b"+inf", b"BYSCORE"), [b"d"]),
+        ((b"-inf", b"(2", b"BYSCORE"), [b"a"]),
+        ((b"3", b"(1", b"BYSCORE", b"REV"), [b"d", b"c", b"b"]),
+        ((b"-inf", b"inf", b"BYSCORE", b"LIMIT", b"1", b"2"), [b"b", b"c"]),
+        (
+            (b"+inf", b"-inf", b"BYSCORE", b"REV", b"LIMIT", b"1", b"-1"),
+            [b"c", b"b", b"a"],
+        ),
+        ((b"-inf", b"inf", b"BYSCORE", b"LIMIT", b"-1", b"2"), []),
+        ((b"2", b"1", b"BYSCORE"), []),
+    ],
+)
+def test_zrange(args, expected):
+    assert run_command(_leaderboard(), b"ZRANGE", b"z", *args) == bulks(*expected)
+
+
+def test_zrange_withscores():
+    reply = run_command(_leaderboard(), b"ZRANGE", b"z", b"0", b"1", b"WITHSCORES")
+    assert reply == bulks(b"a", b"1", b"b", b"2")
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        ((b"-", b"+"), [b"a", b"b", b"c", b"d"]),
+        ((b"[b", b"(d"), [b"b", b"c"]),
+        ((b"(a", b"[c", b"LIMIT", b"1", b"5"), [b"c"]),
+        ((b"+", b"[b", b"REV"), [b"d", b"c", b"b"]),
+        ((b"+", b"-"), []),
+    ],
+)
+def test_zrange_bylex(args, expected):
+    datastore = DataStore()
+    run_command(
+        datastore, b"ZADD", b"z", b"0", b"d", b"0", b"b", b"0", b"a", b"0", b"c"
+    )
+    assert run_command(datastore, b"ZRANGE", b"z", *args[:2], b"BYLEX", *args[2:]) == (
+        bulks(*expected)
+    )
+
+
+def test_zrange_errors():
+    datastore = _leaderboard()
+    assert run_command(
+        datastore, b"ZRANGE", b"z", b"0", b"1", b"LIMIT", b"0", b"1"
+    ) == Error(
+        "ERR syntax error, LIMIT is only supported in combination with either "
+        "BYSCORE or BYLEX"
+    )
+    assert run_command(
+        datastore, b"ZRANGE", b"z", b"-", b"+", b"BYLEX", b"WITHSCORES"
+    ) == (Error("ERR syntax error, WITHSCORES not supported in combination with BYLEX"))
+    assert run_command(datastore, b"ZRANGE", b"z", b"x", b"1", b"BYSCORE") == Error(
+        "ERR min or max is not a float"
+    )
+    assert run_command(datastore, b"ZRANGE", b"z", b"a", b"+", b"BYLEX") == Error(
+        "ERR min or max not valid string range item"
+    )
+    assert run_command(datastore, b"ZRANGE", b"z", b"0", b"1", b"BOGUS") == Error(
+        "ERR syntax error"
+    )
+
+
+def test_zcount_and_pops():
+    datastore = _leaderboard()
+    assert run_command(datastore, b"ZCOUNT", b"z", b"2", b"3") == Integer(3)
+    assert run_command(datastore, b"ZCOUNT", b"z", b"(2", b"3") == Integer(1)
+    assert run_command(datastore, b"ZCOUNT", b"z", b"3", b"2") == Integer(0)
+    assert run_command(datastore, b"ZCOUNT", b"missing", b"-inf", b"inf") == Integer(0)
+    assert run_command(datastore, b"ZPOPMIN", b"z") == bulks(b"a", b"1")
+    assert run_command(datastore, b"ZPOPMAX", b"z", b"2") == bulks(
+        b"d", b"3", b"c", b"2"
+    )
+    assert run_command(datastore, b"ZPOPMAX", b"z", b"-1") == Error(
+        "ERR value is out of range, must be positive"
+    )
+    assert run_command(datastore, b"ZPOPMIN", b"z", b"5") == bulks(b"b", b"2")
+    assert run_command(datastore, b"ZPOPMIN", b"z") == bulks()
+    assert b"z" not in datastore
+
+
+def test_wrong_types():
+    datastore = DataStore()
+    run_command(datastore, b"SET", b"s", b"v")
+    run_command(datastore, b"ZADD", b"z", b"1", b"m")
+    wrongtype = Error(
+        "WRONGTYPE Operation against a key holding the wrong kind of value"
+    )
+    assert run_command(datastore, b"ZADD", b"s", b"1", b"m") == wrongtype
+    assert run_command(datastore, b"ZRANGE", b"s", b"0", b"-1") == wrongtype
+    assert run_command(datastore, b"ZINCRBY", b"s", b"1", b"m") == wrongtype
+    assert run_command(datastore, b"GET", b"z") == wrongtype
+    assert run_command(datastore, b"SADD", b"z", b"m") == wrongtype
+
+
+def test_memory_is_accounted(small_blocks):
+    datastore = DataStore()
+    run_command(datastore, b"ZADD", b"z", *[b"%d" % (i // 2) for i in range(400)])
+    run_command(datastore, b"ZINCRBY", b"z", b"1", b"m")
+    assert datastore.used_memory() == datastore.memory_usage(b"z")
+    run_command(datastore, b"ZPOPMIN", b"z", b"150")
+    assert datastore.used_memory() == datastore.memory_usage(b"z")
+
+
+def test_sorted_sets_are_persisted(tmp_path):
+    datastore = DataStore()
+    pairs = [(b"m%d" % i, i / 3) for i in range(300)] + [(b"top", float("inf"))]
+    datastore.zadd(b"z", pairs)
+
+    filename = tmp_path / "dump.rdb"
+    snapshot.save(datastore, filename)
+    restored = DataStore()
+    snapshot.load(restored, filename)
+    assert list(restored[b"z"]) == list(datastore[b"z"])
+
+    filename = str(tmp_path / "test.aof")
+    persister = AppendOnlyPersister(filename, "always", datastore)
+    persister.rewrite()
+    while persister.rewrite_in_progress:
+        sleep(0.01)
+    restored = DataStore()
+    AppendOnlyPersister.restore_from_file(filename, restored)
+    assert list(restored[b"z"]) == list(datastore[b"z"])
@@ -0,0 +1,308 @@
+import sys
+import threading
+
+import pytest
+
+from pyredis import snapshot
+from pyredis.commands import Transaction, handle_command
+from pyredis.datastore import DataStore
+from pyredis.persistence import AppendOnlyPersister
+from pyredis.types import Array, BulkString, Error, Integer, SimpleString
+
+from helpers import as_command
+
+OK = SimpleString("OK")
+QUEUED = SimpleString("QUEUED")
+
+
+class Client:
+    def __init__(self, datastore, persister=None):
+        self.datastore = datastore
+        self.persister = persister
+        self.transaction = Transaction()
+
+    def __call__(self, *args):
+        return handle_command(
+            as_command(*args), self.datastore, self.persister, self.transaction
+        )
+
+
+def test_multi_exec():
+    client = Client(DataStore())
+    assert client(b"MULTI") == OK
+    assert client(b"SET", b"k", b"1") == QUEUED
+    assert client(b"INCR", b"k") == QUEUED
+    assert client(b"GET", b"k") == QUEUED
+    # Nothing runs before EXEC
+    assert b"k" not in client.datastore
+    reply = client(b"EXEC")
+    assert reply == Array([OK, Integer(2), BulkString(2)])
+    assert client(b"GET", b"k") == BulkString(2)
+
+
+def test_discard():
+    client = Client(DataStore())
+    client(b"MULTI")
+    client(b"SET", b"k", b"1")
+    assert client(b"DISCARD") == OK
+    assert b"k" not in client.datastore
+    assert client(b"EXEC") == Error("ERR EXEC without MULTI")
+    assert client(b"DISCARD") == Error("ERR DISCARD without MULTI")
+
+
+def test_rejected_commands_abort_the_transaction():
+    client = Client(DataStore())
+    client(b"MULTI")
+    client(b"SET", b"k", b"1")
+    assert client(b"GET") == Error("ERR wrong number of arguments for 'get' command")
+    assert client(b"EXEC") == Error(
+        "EXECABORT Transaction discarded because of previous errors."
+    )
+    assert b"k" not in client.datastore
+
+    client(b"MULTI")
+    assert isinstance(client(b"NOSUCH"), Error)
+    assert client(b"EXEC").data.startswith("EXECABORT")
+
+    client(b"MULTI")
+    assert client(b"MULTI") == Error("ERR MULTI calls can not be nested")
+    assert client(b"WATCH", b"k") == Error("ERR WATCH inside MULTI is not allowed")
+    assert client(b"EXEC").data.startswith("EXECABORT")
+
+
+def test_errors_at_exec_do_not_stop_the_other_commands():
+    client = Client(DataStore())
+    client(b"RPUSH", b"list", b"a")
+    client(b"MULTI")
+    client(b"INCR", b"list")
+    client(b"SET", b"k", b"v")
+    # Blocking commands do not block inside a transaction
+    client(b"BLPOP", b"empty", b"0")
+    reply = client(b"EXEC")
+    assert reply[0] == Error("ERR value is not an integer or out of range")
+    assert reply[1:] == [OK, Array(None)]
+    assert client(b"GET", b"k") == BulkString(b"v")
+
+
+def test_watch():
+    datastore = DataStore()
+    client, other = Client(datastore), Client(datastore)
+    other(b"SET", b"k", b"1")
+
+    assert client(b"WATCH", b"k", b"missing") == OK
+    client(b"MULTI")
+    client(b"SET", b"k", b"2")
+    assert client(b"EXEC") == Array([OK])
+
+    # EXEC forgets the watched keys
+    other(b"SET", b"k", b"3")
+    client(b"MULTI")
+    client(b"SET", b"k", b"4")
+    assert client(b"EXEC") == Array([OK])
+
+    client(b"WATCH", b"k")
+    other(b"INCR", b"k")
+    client(b"MULTI")
+    client(b"SET", b"k", b"5")
+    assert client(b"EXEC") == Array(None)
+    assert datastore[b"k"] == 5
+
+
+def test_watch_sees_deletes_recreation_and_collections():
+    datastore = DataStore()
+    client, other = Client(datastore), Client(datastore)
+    other(b"SET", b"k", b"1")
+    other(b"RPUSH", b"l", b"a")
+
+    client(b"WATCH", b"k")
+    other(b"DEL", b"k")
+    other(b"SET", b"k", b"1")
+    client(b"MULTI")
+    assert client(b"EXEC") == Array(None)
+
+    client(b"WATCH", b"l")
+    other(b"RPUSH", b"l", b"b")
+    client(b"MULTI")
+    assert client(b"EXEC") == Array(None)
+
+    # Failed writes and reads leave the version alone
+    client(b"WATCH", b"l")
+    other(b"INCR", b"l")
+    other(b"LRANGE", b"l", b"0", b"-1")
+    client(b"MULTI")
+    assert client(b"EXEC") == Array([])
+
+    client(b"WATCH", b"k")
+    assert client(b"UNWATCH") == OK
+    other(b"SET", b"k", b"2")
+    client(b"MULTI")
+    assert client(b"EXEC") == Array([])
+
+
+def test_watch_sees_a_missing_key_created_and_deleted_again():
+    datastore = DataStore(shards=4)
+    client, other = Client(datastore), Client(datastore)
+    client(b"WATCH", b"k")
+    other(b"SET", b"k", b"1")
+    other(b"DEL", b"k")
+    client(b"MULTI")
+    assert client(b"EXEC") == Array(None)
+
+
+@pytest.mark.parametrize("source", ["snapshot", "aof", "initial_data"])
+def test_watch_sees_loaded_keys_deleted(tmp_path, source):
+    filename = tmp_path / "dump"
+    match source:
+        case "snapshot":
+            snapshot.save(DataStore({b"k": b"1"}), str(filename))
+            datastore = DataStore()
+            snapshot.load(datastore, str(filename))
+        case "aof":
+            filename.write_bytes(as_command(b"SET", b"k", b"1").resp_encode())
+            datastore = DataStore()
+            AppendOnlyPersister.restore_from_file(str(filename), datastore)
+        case "initial_data":
+            datastore = DataStore({b"k": b"1"})
+    client, other = Client(datastore), Client(datastore)
+    client(b"WATCH", b"k")
+    assert other(b"DEL", b"k") == Integer(1)
+    client(b"MULTI")
+    assert client(b"EXEC") == Array(None)
+
+
+def test_writes_that_change_nothing_are_not_seen_or_logged(tmp_path):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename, "always")
+    datastore = DataStore()
+    client, other = Client(datastore), Client(datastore, persister)
+    other(b"SADD", b"s", b"a")
+    other(b"HSET", b"h", b"f", b"v")
+    other(b"ZADD", b"z", b"1", b"m")
+    persister.flush()
+    logged = filename.read_bytes()
+
+    client(b"WATCH", b"k", b"s", b"h", b"z", b"l")
+    noops = (
+        (b"DEL", b"k"),
+        (b"SREM", b"s", b"b"),
+        (b"SADD", b"s", b"a"),
+        (b"HDEL", b"h", b"g"),
+        (b"ZREM", b"z", b"n"),
+        (b"ZADD", b"z", b"1", b"m"),
+        (b"ZADD", b"z", b"XX", b"INCR", b"1", b"n"),
+        (b"ZPOPMIN", b"k"),
+        (b"LPOP", b"l"),
+        (b"RPOP", b"l", b"2"),
+        (b"LMOVE", b"l", b"k", b"LEFT", b"RIGHT"),
+        (b"MSETNX", b"k", b"1", b"s", b"2"),
+    )
+    for args in noops:
+        assert not isinstance(other(*args), Error)
+    client(b"MULTI")
+    assert client(b"EXEC") == Array([])
+    persister.flush()
+    assert filename.read_bytes() == logged
+
+    client(b"WATCH", b"s")
+    other(b"SREM", b"s", b"a", b"b")
+    client(b"MULTI")
+    assert client(b"EXEC") == Array(None)
+    persister.close()
+    assert (
+        filename.read_bytes()
+        == logged + as_command(b"SREM", b"s", b"a", b"b").resp_encode()
+    )
+
+
+def test_check_and_set_loops_do_not_lose_updates():
+    datastore = DataStore(shards=4)
+    datastore[b"counter"] = b"0"
+
+    def increment(times):
+        client = Client(datastore)
+        for _ in range(times):
+            while True:
+                client(b"WATCH", b"counter")
+                value = int(client(b"GET", b"counter").data)
+                client(b"MULTI")
+                client(b"SET", b"counter", b"%d" % (value + 1))
+                if client(b"EXEC").data is not None:
+                    break
+
+    threads = [threading.Thread(target=increment, args=(200,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert datastore[b"counter"] == 800
+
+
+def test_blocks_with_keyless_commands_do_not_deadlock():
+    datastore = DataStore(shards=2)
+    # The MEMORY USAGE block holds the second shard and then wants the first,
+    # while the other block locks the first shard and waits for the second
+    keys = [b"k%d" % i for i in range(100)]
+    first = next(key for key in keys if hash(key) % 2 == 0)
+    second = next(key for key in keys if hash(key) % 2 == 1)
+    blocks = (
+        [(b"SET", second, b"1"), (b"MEMORY", b"USAGE", first)],
+        [(b"SET", first, b"1"), (b"SET", second, b"1")],
+        [(b"SET", second, b"1"), (b"SCAN", b"0")],
+    )
+
+    def run(block):
+        client = Client(datastore)
+        for _ in range(2000):
+            client(b"MULTI")
+            for args in block:
+                client(*args)
+            client(b"EXEC")
+
+    threads = [threading.Thread(target=run, args=(b,), daemon=True) for b in blocks]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+            assert not thread.is_alive()
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_transactions_are_logged_and_replayed_whole(tmp_path):
+    filename = tmp_path / "test.aof"
+    persister = AppendOnlyPersister(filename, "always")
+    client = Client(DataStore(), persister)
+    client(b"MULTI")
+    client(b"SET", b"a", b"1")
+    client(b"GET", b"a")
+    client(b"RPUSH", b"l", b"x")
+    client(b"EXEC")
+    persister.close()
+    expected = b"".join(
+        as_command(*args).resp_encode()
+        for args in (
+            (b"MULTI",),
+            (b"SET", b"a", b"1"),
+            (b"RPUSH", b"l", b"x"),
+            (b"EXEC",),
+        )
+    )
+    assert filename.read_bytes() == expected
+
+    restored = DataStore()
+    AppendOnlyPersister.restore_from_file(str(filename), restored)
+    assert restored[b"a"] == 1
+    assert restored.lrange(b"l", 0, -1) == [b"x"]
+
+    # A crash before EXEC reached the file leaves none of the block applied
+    filename.write_bytes(
+        as_command(b"SET", b"b", b"1").resp_encode()
+        + expected[: -len(as_command(b"EXEC").resp_encode())]
+    )
+    restored = DataStore()
+    AppendOnlyPersister.restore_from_file(str(filename), restored)
+    assert restored[b"b"] == 1
+    assert b"a" not in restored and b"l" not in restored